@@ -165,6 +165,65 @@ function filterUsersAndRender() {
   });
 }
 
+function renderGaps(days, missingDays) {
+  const tbody = qs('#gapsTbody');
+  if (!tbody) return;
+
+  const rows = (Array.isArray(days) ? days : []).map(d => ({ ...d, missing: false }));
+  (Array.isArray(missingDays) ? missingDays : []).forEach(day => rows.push({ day, missing: true }));
+  rows.sort((a, b) => String(b.day).localeCompare(String(a.day)));
+
+  if (rows.length === 0) {
+    tbody.innerHTML = `<tr><td colspan="6" class="admin-muted">ไม่มีข้อมูล</td></tr>`;
+    return;
+  }
+
+  tbody.innerHTML = rows.map(d => {
+    if (d.missing) {
+      return `
+        <tr>
+          <td>${escapeHtml(d.day)}</td>
+          <td>0</td>
+          <td><span class="badge warn">0%</span></td>
+          <td>-</td>
+          <td class="admin-muted">ไม่มีข้อมูลทั้งวัน</td>
+          <td></td>
+        </tr>
+      `;
+    }
+    const pct = d.coverage == null ? '-' : (d.coverage * 100).toFixed(1) + '%';
+    const badge = d.coverage != null && d.coverage >= 0.99 ? 'ok' : 'warn';
+    const first = String(d.first_slot || '').slice(11);
+    const last = String(d.last_slot || '').slice(11);
+    return `
+      <tr>
+        <td>${escapeHtml(d.day)}</td>
+        <td>${escapeHtml(d.slot_count)} / ${escapeHtml(d.expected)}</td>
+        <td><span class="badge ${badge}">${escapeHtml(pct)}</span></td>
+        <td>${escapeHtml(d.gap_count)}</td>
+        <td id="gapDetail_${escapeHtml(d.day)}">${escapeHtml(first)} – ${escapeHtml(last)}</td>
+        <td>
+          ${d.gap_count > 0 ? `<button class="admin-btn small secondary" data-action="gaps" data-day="${escapeHtml(d.day)}">ดูช่วงที่ขาด</button>` : ''}
+        </td>
+      </tr>
+    `;
+  }).join('');
+
+  tbody.querySelectorAll('button[data-action="gaps"]').forEach(btn => {
+    btn.addEventListener('click', async () => {
+      const day = btn.dataset.day;
+      const { ok, data } = await apiGet('/api/admin/data_gaps?day=' + encodeURIComponent(day));
+      if (!ok || !data.ok) return showAlert('โหลดช่วงที่ขาดไม่สำเร็จ', 'error');
+      const cell = qs('#gapDetail_' + day);
+      if (!cell) return;
+      const gaps = Array.isArray(data.gaps) ? data.gaps : [];
+      cell.innerHTML = gaps.length === 0
+        ? '<span class="admin-muted">ไม่มีช่วงที่ขาด</span>'
+        : gaps.map(g => `${escapeHtml(String(g.start).slice(11))} – ${escapeHtml(String(g.end).slice(11))} (${escapeHtml(g.slots)} slots)`).join('<br>');
+    });
+  });
+}
+
 async function reloadAll() {
   // pending
   const p = await apiGet('/api/admin/pending');
@@ -186,6 +245,15 @@ async function reloadAll() {
     _allUsersCache = Array.isArray(u.data.users) ? u.data.users : [];
     filterUsersAndRender();
   }
+
+  // data gaps
+  const g = await apiGet('/api/admin/data_gaps');
+  if (!g.ok || !g.data.ok) {
+    const tbody = qs('#gapsTbody');
+    if (tbody) tbody.innerHTML = `<tr><td colspan="6" class="admin-muted">${escapeHtml(g.data.message || 'โหลดข้อมูลไม่สำเร็จ')}</td></tr>`;
+  } else {
+    renderGaps(g.data.days, g.data.missing_days);
+  }
 }
 
 async function bootstrap() {
@@ -11,6 +11,14 @@ except Exception:  # pragma: no cover
     _cv2 = None
 
 
+try:
+    from PIL import Image as _PILImage  # type: ignore
+    from PIL import ImageOps as _PILImageOps  # type: ignore
+except Exception:  # pragma: no cover
+    _PILImage = None
+    _PILImageOps = None
+
+
 def _get_cv2():
     """Return a validated cv2 module or None.
 
@@ -37,6 +45,7 @@ from email.message import EmailMessage
 
 import zipfile
 import uuid
+import tempfile
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -94,13 +103,15 @@ def _is_probably_url(s: str) -> bool:
     return s.startswith("http://") or s.startswith("https://") or s.startswith("data:")
 
 
-def normalize_image_to_url(val: str) -> str:
+def normalize_image_to_url(val: str, width: Optional[int] = None) -> str:
     """Normalize DB value to something the browser can load.
 
     Supported:
       - http(s)://... or data:... -> keep
       - /assets/... -> keep
       - any filesystem path -> convert to /assets/<filename> or /assets/uploads/<filename>
+
+    width: ถ้าระบุ จะคืน URL ของ variant ที่เล็กที่สุดซึ่งกว้าง >= width (ถ้ามีแล้ว)
     """
     if val is None:
         return None
@@ -109,18 +120,27 @@ def normalize_image_to_url(val: str) -> str:
         return None
 
     if _is_probably_url(v) or v.startswith("/assets/"):
-        return v
-
-    v_low = v.lower().replace("\\", "/")
-    filename = _basename_from_any_path(v)
-    if not filename:
-        return None
+        url = v
+    else:
+        v_low = v.lower().replace("\\", "/")
+        filename = _basename_from_any_path(v)
+        if not filename:
+            return None
 
-    # If the old value hints it was an uploaded file, keep it under uploads/
-    if "uploads" in v_low:
-        return f"/assets/uploads/{filename}"
+        # If the old value hints it was an uploaded file, keep it under uploads/
+        if "uploads" in v_low:
+            url = f"/assets/uploads/{filename}"
+        else:
+            url = f"/assets/{filename}"
 
-    return f"/assets/{filename}"
+    if width and url.startswith("/assets/"):
+        variants = image_variant_urls(url)
+        for w in sorted(int(k) for k in variants):
+            if w >= width:
+                return variants[str(w)]
+        if variants:
+            return variants[str(max(int(k) for k in variants))]
+    return url
 
 
 def _allowed_file(filename: str) -> bool:
@@ -473,6 +493,28 @@ def _state_set(key: str, value: str):
         conn.close()
 
 
+def _state_set_tx(cursor, key: str, value: str):
+    """เหมือน _state_set แต่ใช้ cursor ของ caller (commit พร้อมกับงานที่ watermark นี้คุมอยู่)"""
+    cursor.execute(
+        """
+        INSERT INTO notification_state (k, v) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE v=VALUES(v)
+        """,
+        (key, value),
+    )
+
+
+def _state_get_tx(cursor, key: str, default: str = "", for_update: bool = False) -> str:
+    """เหมือน _state_get แต่อ่านบน cursor ของ caller
+    for_update=True: lock แถวจน caller commit -> process อื่นที่อ่าน watermark เดียวกันรอค่าที่ commit แล้ว"""
+    cursor.execute(
+        "SELECT v FROM notification_state WHERE k=%s LIMIT 1" + (" FOR UPDATE" if for_update else ""),
+        (key,),
+    )
+    row = cursor.fetchone() or {}
+    return row.get("v") or default
+
+
 def _fetch_new_alerts_since(cursor, last_id: int, limit: int = 5) -> list[dict]:
     """Return newest alerts inserted after last_id (excluding deleted/archived)."""
     cursor.execute(
@@ -549,6 +591,36 @@ def _alert_push_worker_loop():
 
                 connection.commit()
 
+                # 2.5) event clips (eat/excrete transitions + no_cat) -> background pool
+                try:
+                    _detect_clip_events(cursor)
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+                    # slot หลัง watermark จะถูกอ่านซ้ำ -> seed activity ใหม่จาก watermark ที่ commit แล้ว
+                    _clip_prev_activity.clear()
+
+                # 2.6) hourly rollup (timeslot_hourly) — backfill ทีละ batch
+                try:
+                    _hourly_rollup_catch_up(cursor, HOURLY_ROLLUP_BATCH_ROWS)
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+
+                # 2.7) run-length segments (timeslot_segments)
+                try:
+                    _segments_catch_up(cursor, SEGMENTS_BATCH_ROWS)
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+
+                # 2.8) day coverage (timeslot_coverage)
+                try:
+                    _coverage_catch_up(cursor, COVERAGE_BATCH_ROWS)
+                    connection.commit()
+                except Exception:
+                    connection.rollback()
+
                 # 3) detect new alerts since last push
                 latest_id = _get_latest_alert_id(cursor)
                 if latest_id > int(last_push_id):
@@ -618,6 +690,100 @@ _ensure_assets_folder()
 app.config["MAX_CONTENT_LENGTH"] = app_max_bytes
 
 
+# Case-insensitive index ของไฟล์ใน Colorcat/ และ Colorcat/uploads/
+# - สร้างครั้งแรกตอนมี request แล้ว rebuild เมื่อ mtime ของโฟลเดอร์เปลี่ยน (stat 2 ครั้ง/request)
+#   หรือเมื่อ upload_cat_image เรียก _asset_index_invalidate()
+# - ชื่อที่หาไม่เจอ cache ไว้ (ล้างทุกครั้งที่ rebuild) กันสแกนซ้ำจาก URL เสีย
+ASSET_MAX_AGE = int(os.environ.get("ASSET_MAX_AGE", "300") or 0)
+_ASSET_INDEX_LOCK = Lock()
+_ASSET_INDEX = {"stamp": None, "root": {}, "uploads": {}, "root_exact": set(), "uploads_exact": set()}
+_ASSET_MISSES = set()
+_ASSET_MISSES_MAX = 2048
+
+
+def _dir_stamp(path: str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _scan_asset_dir(path: str, files_only: bool):
+    lower, exact = {}, set()
+    if not os.path.isdir(path):
+        return lower, exact
+    with os.scandir(path) as it:
+        for e in it:
+            if files_only and not e.is_file():
+                continue
+            exact.add(e.name)
+            lower.setdefault(e.name.lower(), e.name)
+    return lower, exact
+
+
+def _asset_index_invalidate():
+    with _ASSET_INDEX_LOCK:
+        _ASSET_INDEX["stamp"] = None
+
+
+def _asset_index() -> dict:
+    stamp = (_dir_stamp(ASSETS_DIR), _dir_stamp(UPLOADS_DIR))
+    with _ASSET_INDEX_LOCK:
+        if _ASSET_INDEX["stamp"] != stamp:
+            root, root_exact = _scan_asset_dir(ASSETS_DIR, files_only=True)
+            uploads, uploads_exact = _scan_asset_dir(UPLOADS_DIR, files_only=True)
+            _ASSET_INDEX.update({
+                "stamp": stamp,
+                "root": root,
+                "root_exact": root_exact,
+                "uploads": uploads,
+                "uploads_exact": uploads_exact,
+            })
+            _ASSET_MISSES.clear()
+        return _ASSET_INDEX
+
+
+def _resolve_asset(sub: str, base: str):
+    """คืน path ภายใต้ ASSETS_DIR (เช่น 'uploads/x.jpg') หรือ None — ลำดับเดียวกับของเดิม:
+    exact ใน root -> (uploads/) case-insensitive ใน uploads -> uploads -> root case-insensitive
+    """
+    idx = _asset_index()
+    key = (sub, base)
+    if key in _ASSET_MISSES:
+        return None
+
+    wanted = base.lower()
+    found = None
+    if sub == "" and base in idx["root_exact"]:
+        found = base
+    elif sub == "uploads" and base in idx["uploads_exact"]:
+        found = f"uploads/{base}"
+    elif wanted in idx["uploads"]:
+        found = f"uploads/{idx['uploads'][wanted]}"
+    elif wanted in idx["root"]:
+        found = idx["root"][wanted]
+
+    if found is None:
+        with _ASSET_INDEX_LOCK:
+            if len(_ASSET_MISSES) >= _ASSET_MISSES_MAX:
+                _ASSET_MISSES.clear()
+            _ASSET_MISSES.add(key)
+    return found
+
+
+def _asset_rel(filename: str):
+    """path ภายใต้ ASSETS_DIR ที่ /assets/<filename> เสิร์ฟ หรือ None"""
+    base = os.path.basename(filename)
+    sub = os.path.dirname(filename).strip("/")
+    if sub.lower() in ("", "uploads"):
+        return _resolve_asset(sub.lower(), base)
+    if ".." not in sub.split("/") and os.path.isfile(os.path.join(ASSETS_DIR, filename)):
+        # sub-folder อื่น: path ตรงตัวก่อน
+        return filename
+    # ไม่เจอ -> หา basename แบบ case-insensitive ใน uploads/ แล้ว root (เหมือนเดิม)
+    return _resolve_asset(sub.lower(), base)
+
+
 @app.route("/assets/<path:filename>")
 def assets(filename):
     """Serve local cat images as HTTP URLs.
@@ -625,68 +791,382 @@ def assets(filename):
     Supported URLs:
       - /assets/<file>              -> searches Colorcat/ then Colorcat/uploads/
       - /assets/uploads/<file>      -> searches Colorcat/uploads/
+      - /assets/<sub>/<file>        -> exact path, else <file> in Colorcat/uploads/ then Colorcat/
     """
     # Normalise slashes
     filename = (filename or "").replace("\\", "/")
 
-    # 1) direct hit: Colorcat/<filename>
     try:
-        full = os.path.join(ASSETS_DIR, filename)
-        if os.path.isfile(full):
-            return send_from_directory(ASSETS_DIR, filename)
+        rel = _asset_rel(filename)
+
+        if rel:
+            # send_from_directory ใส่ ETag + Last-Modified และตอบ 304 ให้เองเมื่อ request มี If-None-Match/If-Modified-Since
+            if rel.startswith("uploads/") and _UPLOAD_BLOB_RE.match(os.path.basename(rel)):
+                # ชื่อไฟล์คือ sha256 ของเนื้อหา -> cache ได้ตลอดไป
+                resp = send_from_directory(ASSETS_DIR, rel, max_age=31536000, conditional=True, etag=True)
+                resp.cache_control.immutable = True
+                return resp
+            return send_from_directory(ASSETS_DIR, rel, max_age=ASSET_MAX_AGE, conditional=True, etag=True)
+    except Exception:
+        # let flask return 404 below
+        pass
+
+    return ("Not Found", 404)
 
-        base = os.path.basename(filename)
-        sub = os.path.dirname(filename).replace("\\", "/").strip("/")
 
-        wanted = base.lower()
+# =========================================
+# Cat image variants (ย่อรูปตอน upload)
+# =========================================
+# รูปใน Colorcat/ และ Colorcat/uploads/ ถูกย่อเป็นหลายขนาดไว้ที่ Colorcat/variants/<width>/...
+# (หมุนตาม EXIF แล้ว) โดย worker pool เบื้องหลัง; ตอน start จะ backfill ไฟล์ที่ยังไม่มี variant
+# ต้องมี Pillow — ถ้าไม่มีจะคืน URL รูปต้นฉบับเหมือนเดิม
+IMAGE_VARIANTS_DIR = os.path.join(ASSETS_DIR, "variants")
+IMAGE_VARIANT_WIDTHS = sorted({
+    int(w) for w in (os.environ.get("IMAGE_VARIANT_WIDTHS", "160,480,1024") or "").split(",")
+    if w.strip().isdigit() and int(w) > 0
+})
+IMAGE_VARIANT_FORMAT = (os.environ.get("IMAGE_VARIANT_FORMAT", "webp") or "webp").strip().lower()
+IMAGE_VARIANT_QUALITY = int(os.environ.get("IMAGE_VARIANT_QUALITY", "80") or 80)
+IMAGE_VARIANT_WORKERS = max(1, int(os.environ.get("IMAGE_VARIANT_WORKERS", "2") or 2))
+
+_IMAGE_VARIANT_POOL = None
+_IMAGE_VARIANT_PENDING = set()
+_IMAGE_VARIANT_LOCK = Lock()
+
+
+def _image_variant_ext() -> str:
+    if IMAGE_VARIANT_FORMAT == "webp":
+        try:
+            from PIL import features as _pil_features
+            if _pil_features.check("webp"):
+                return "webp"
+        except Exception:
+            pass
+    return "jpg"
 
-        # 2) If explicitly under uploads/, serve from uploads
-        if sub.lower() == "uploads":
-            if os.path.isdir(UPLOADS_DIR):
-                for f in os.listdir(UPLOADS_DIR):
-                    if f.lower() == wanted:
-                        return send_from_directory(ASSETS_DIR, f"uploads/{f}")
 
-        # 3) Fallback: if request is /assets/<file> but the file is actually in uploads/
-        if os.path.isdir(UPLOADS_DIR):
-            for f in os.listdir(UPLOADS_DIR):
-                if f.lower() == wanted:
-                    return send_from_directory(ASSETS_DIR, f"uploads/{f}")
+def _image_source_rel(url: str):
+    """'/assets/uploads/x.jpg' -> 'uploads/x.jpg' (ไฟล์ local ที่ /assets เสิร์ฟจริง) หรือ None"""
+    if not url or not url.startswith("/assets/"):
+        return None
+    return _asset_rel(url[len("/assets/"):])
 
-        # 4) Case-insensitive fallback for root folder
-        if os.path.isdir(ASSETS_DIR):
-            for f in os.listdir(ASSETS_DIR):
-                if os.path.isfile(os.path.join(ASSETS_DIR, f)) and f.lower() == wanted:
-                    return send_from_directory(ASSETS_DIR, f)
-    except Exception:
-        # let flask return 404 below
-        pass
 
-    return ("Not Found", 404)
+def _image_variant_rel(src_rel: str, width: int) -> str:
+    # เก็บนามสกุลเดิมไว้ในชื่อ (x.png -> x.png.webp) ไม่งั้น x.jpg กับ x.png ได้ variant ไฟล์เดียวกัน
+    return f"variants/{width}/{src_rel}.{_image_variant_ext()}"
+
+
+def _image_variant_fresh(src_rel: str, width: int) -> bool:
+    try:
+        src_m = os.stat(os.path.join(ASSETS_DIR, src_rel)).st_mtime_ns
+        return os.stat(os.path.join(ASSETS_DIR, _image_variant_rel(src_rel, width))).st_mtime_ns >= src_m
+    except OSError:
+        return False
+
+
+def _build_image_variants(src_rel: str):
+    try:
+        src_path = os.path.join(ASSETS_DIR, src_rel)
+        ext = _image_variant_ext()
+        with _PILImage.open(src_path) as im:
+            im = _PILImageOps.exif_transpose(im)
+            has_alpha = im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info)
+            if ext == "webp":
+                im = im.convert("RGBA" if has_alpha else "RGB")
+            elif has_alpha:
+                bg = _PILImage.new("RGB", im.size, (255, 255, 255))
+                bg.paste(im.convert("RGBA"), mask=im.convert("RGBA").split()[-1])
+                im = bg
+            else:
+                im = im.convert("RGB")
+
+            for width in IMAGE_VARIANT_WIDTHS:
+                if _image_variant_fresh(src_rel, width):
+                    continue
+                out = im.copy()
+                if out.width > width:
+                    out.thumbnail((width, width * 10), _PILImage.LANCZOS)
+                dst = os.path.join(ASSETS_DIR, _image_variant_rel(src_rel, width))
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                tmp = f"{dst}.{os.getpid()}.tmp"
+                if ext == "webp":
+                    out.save(tmp, "WEBP", quality=IMAGE_VARIANT_QUALITY, method=4)
+                else:
+                    out.save(tmp, "JPEG", quality=IMAGE_VARIANT_QUALITY, optimize=True, progressive=True)
+                os.replace(tmp, dst)
+    except Exception as e:
+        print(f"⚠️ image variant build failed for {src_rel}: {e}")
+    finally:
+        with _IMAGE_VARIANT_LOCK:
+            _IMAGE_VARIANT_PENDING.discard(src_rel)
+
+
+def _schedule_image_variants(src_rel: str):
+    global _IMAGE_VARIANT_POOL
+    if _PILImage is None or not IMAGE_VARIANT_WIDTHS or not src_rel:
+        return
+    with _IMAGE_VARIANT_LOCK:
+        if src_rel in _IMAGE_VARIANT_PENDING:
+            return
+        _IMAGE_VARIANT_PENDING.add(src_rel)
+        if _IMAGE_VARIANT_POOL is None:
+            _IMAGE_VARIANT_POOL = ThreadPoolExecutor(
+                max_workers=IMAGE_VARIANT_WORKERS, thread_name_prefix="image-variant"
+            )
+        pool = _IMAGE_VARIANT_POOL
+    pool.submit(_build_image_variants, src_rel)
+
+
+def image_variant_urls(url: str) -> dict:
+    """{"160": "/assets/variants/160/...", ...} ของ variant ที่พร้อมใช้; ถ้ายังไม่มีจะสั่ง build แล้วคืน {}"""
+    src_rel = _image_source_rel(url)
+    if not src_rel or _PILImage is None:
+        return {}
+    out = {}
+    for width in IMAGE_VARIANT_WIDTHS:
+        if _image_variant_fresh(src_rel, width):
+            out[str(width)] = f"/assets/{_image_variant_rel(src_rel, width)}"
+    if len(out) < len(IMAGE_VARIANT_WIDTHS):
+        _schedule_image_variants(src_rel)
+    return out
+
+
+def _backfill_image_variants():
+    if _PILImage is None:
+        return
+    for sub in ("", "uploads"):
+        folder = os.path.join(ASSETS_DIR, sub) if sub else ASSETS_DIR
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if not _allowed_file(name) or not os.path.isfile(os.path.join(folder, name)):
+                continue
+            src_rel = f"{sub}/{name}" if sub else name
+            if not all(_image_variant_fresh(src_rel, w) for w in IMAGE_VARIANT_WIDTHS):
+                _schedule_image_variants(src_rel)
+
+    # variant ที่ไม่มีต้นฉบับแล้ว (รวมถึงชื่อแบบเก่าที่ตัดนามสกุลต้นฉบับทิ้ง) -> ลบ
+    for root, _, files in os.walk(IMAGE_VARIANTS_DIR):
+        for name in files:
+            if name.endswith(".tmp"):
+                continue  # กำลัง build อยู่
+            path = os.path.join(root, name)
+            src_rel = os.path.splitext(os.path.relpath(path, IMAGE_VARIANTS_DIR).split(os.sep, 1)[-1])[0]
+            if not os.path.isfile(os.path.join(ASSETS_DIR, src_rel)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def _start_image_variant_backfill():
+    if os.environ.get("IMAGE_VARIANT_BACKFILL", "1") != "1":
+        return
+    if os.environ.get("FLASK_DEBUG") == "1" or os.environ.get("WERKZEUG_RUN_MAIN") is not None:
+        if os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+            return
+    threading.Thread(target=_backfill_image_variants, daemon=True, name="image-variant-backfill").start()
 
 
 # =========================================
 # Frontend static files (same-origin)
 # =========================================
+# Static pipeline: ตอน start สร้าง manifest ของไฟล์ frontend
+#   - JS/CSS ได้ URL แบบมี content hash (/dist/script.<hash>.js) -> Cache-Control: immutable 1 ปี
+#   - HTML ถูก rewrite ให้อ้าง URL ที่มี hash แล้วเสิร์ฟแบบ no-cache + ETag (ได้ 304 เกือบทุกครั้ง)
+#   - เตรียม gzip/brotli ไว้ล่วงหน้าใน memory แล้วเลือกตาม Accept-Encoding (brotli เป็น optional)
+# ถ้าไฟล์ต้นทางถูกแก้ (mtime เปลี่ยน) entry นั้นจะถูกสร้างใหม่ตอน request ถัดไป
+import gzip
+import re
+
+try:
+    import brotli as _brotli  # optional
+except Exception:
+    _brotli = None
+
+STATIC_HASHED_FILES = ("script.js", "style.css", "auth.js", "admin.js")
+STATIC_HTML_FILES = ("index.html", "login.html", "admin.html")
+STATIC_HASH_LEN = 12
+STATIC_MIN_COMPRESS_BYTES = 512
+STATIC_MIMETYPES = {
+    ".js": "application/javascript; charset=utf-8",
+    ".css": "text/css; charset=utf-8",
+    ".html": "text/html; charset=utf-8",
+}
+_STATIC_LOCK = Lock()
+_STATIC_MANIFEST = {}  # name -> entry (ดู _static_build_entry)
+_STATIC_BY_HASHED = {}  # "script.<hash>.js" -> name
+
+
+def _static_hashed_name(name: str, digest: str) -> str:
+    stem, ext = os.path.splitext(name)
+    return f"{stem}.{digest[:STATIC_HASH_LEN]}{ext}"
+
+
+def _static_rewrite_html(html: str) -> str:
+    # แทน src="script.js" / href="style.css" (relative หรือขึ้นต้นด้วย /) ด้วย URL ที่มี hash
+    def repl(m):
+        attr, quote, slash, name = m.group(1), m.group(2), m.group(3), m.group(4)
+        entry = _STATIC_MANIFEST.get(name)
+        if not entry:
+            return m.group(0)
+        return f"{attr}={quote}/dist/{entry['hashed']}{quote}"
+
+    names = "|".join(re.escape(n) for n in STATIC_HASHED_FILES)
+    return re.sub(r'\b(src|href)=(["\'])(/?)(' + names + r')\2', repl, html)
+
+
+def _static_build_entry(name: str, mtime_ns: int) -> dict:
+    with open(os.path.join(BASE_DIR, name), "rb") as fh:
+        raw = fh.read()
+    if name.endswith(".html"):
+        raw = _static_rewrite_html(raw.decode("utf-8")).encode("utf-8")
+
+    digest = hashlib.sha256(raw).hexdigest()
+    bodies = {"identity": raw}
+    if len(raw) >= STATIC_MIN_COMPRESS_BYTES:
+        gz = gzip.compress(raw, compresslevel=9, mtime=0)
+        if len(gz) < len(raw):
+            bodies["gzip"] = gz
+        if _brotli is not None:
+            br = _brotli.compress(raw, quality=11)
+            if len(br) < len(raw):
+                bodies["br"] = br
+
+    return {
+        "mtime_ns": mtime_ns,
+        "hash": digest[:STATIC_HASH_LEN],
+        "hashed": _static_hashed_name(name, digest),
+        "mimetype": STATIC_MIMETYPES.get(os.path.splitext(name)[1], "application/octet-stream"),
+        "bodies": bodies,
+    }
+
+
+def _static_entry(name: str):
+    """คืน entry ล่าสุดของไฟล์ (rebuild ถ้า mtime เปลี่ยน); HTML ถูก rebuild ตามเมื่อ JS/CSS เปลี่ยน hash"""
+    try:
+        mtime_ns = os.stat(os.path.join(BASE_DIR, name)).st_mtime_ns
+    except OSError:
+        return None
+
+    deps = _static_deps() if name.endswith(".html") else None
+    entry = _STATIC_MANIFEST.get(name)
+    if entry and entry["mtime_ns"] == mtime_ns and entry.get("deps") == deps:
+        return entry
+
+    with _STATIC_LOCK:
+        entry = _STATIC_MANIFEST.get(name)
+        if entry and entry["mtime_ns"] == mtime_ns and entry.get("deps") == deps:
+            return entry
+        old = entry
+        entry = _static_build_entry(name, mtime_ns)
+        if deps is not None:
+            entry["deps"] = deps
+        else:
+            if old:
+                _STATIC_BY_HASHED.pop(old["hashed"], None)
+            _STATIC_BY_HASHED[entry["hashed"]] = name
+        _STATIC_MANIFEST[name] = entry
+        return entry
+
+
+def _static_deps() -> tuple:
+    # hash ของ JS/CSS ปัจจุบัน (ตรวจ mtime ผ่าน _static_entry) ใช้ตัดสินว่า HTML ต้อง rewrite ใหม่ไหม
+    out = []
+    for n in STATIC_HASHED_FILES:
+        e = _static_entry(n)
+        out.append(e["hash"] if e else "")
+    return tuple(out)
+
+
+def _build_static_manifest():
+    for name in STATIC_HASHED_FILES + STATIC_HTML_FILES:
+        try:
+            _static_entry(name)
+        except Exception as e:
+            print(f"[STATIC] manifest build failed for {name}: {e}")
+
+
+def _static_pick_encoding(bodies: dict) -> str:
+    accepted = {}
+    for part in (request.headers.get("Accept-Encoding") or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    for enc in ("br", "gzip"):
+        if enc in bodies and accepted.get(enc, accepted.get("*", 0.0)) > 0:
+            return enc
+    return "identity"
+
+
+def _serve_static_entry(name: str, immutable: bool):
+    entry = _static_entry(name)
+    if entry is None:
+        return ("Not Found", 404)
+
+    enc = _static_pick_encoding(entry["bodies"])
+    etag = entry["hash"] if enc == "identity" else f"{entry['hash']}-{enc}"
+    headers = {"Vary": "Accept-Encoding"}
+    if immutable:
+        headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        headers["Cache-Control"] = "no-cache"
+
+    resp = Response(status=200, mimetype=entry["mimetype"], headers=headers)
+    resp.set_etag(etag)
+    if request.if_none_match.contains(etag):
+        resp.status_code = 304
+        return resp
+
+    body = entry["bodies"][enc]
+    resp.set_data(body)
+    if enc != "identity":
+        resp.headers["Content-Encoding"] = enc
+    return resp
+
+
+@app.route("/dist/<hashed_name>")
+def serve_hashed_static(hashed_name):
+    name = _STATIC_BY_HASHED.get(hashed_name)
+    if name is None:
+        # อาจเป็น hash ใหม่หลังแก้ไฟล์ -> refresh manifest แล้วลองอีกรอบ
+        _static_deps()
+        name = _STATIC_BY_HASHED.get(hashed_name)
+    if name is None:
+        return ("Not Found", 404)
+    return _serve_static_entry(name, immutable=True)
+
+
 @app.route("/")
 def serve_index():
-    return send_from_directory(BASE_DIR, "index.html")
+    return _serve_static_entry("index.html", immutable=False)
 
 
 # Also serve index.html explicitly to avoid redirect loops when some clients navigate to /index.html
 @app.route("/index.html")
 def serve_index_html():
-    return send_from_directory(BASE_DIR, "index.html")
+    return _serve_static_entry("index.html", immutable=False)
 
 
+# URL เดิม (ไม่มี hash) ยังใช้ได้ แต่ต้อง revalidate ทุกครั้ง
 @app.route("/script.js")
 def serve_script():
-    return send_from_directory(BASE_DIR, "script.js")
+    return _serve_static_entry("script.js", immutable=False)
 
 
 @app.route("/style.css")
 def serve_style():
-    return send_from_directory(BASE_DIR, "style.css")
+    return _serve_static_entry("style.css", immutable=False)
 
 
 @app.route("/sw.js")
@@ -698,22 +1178,25 @@ def serve_sw():
 
 @app.route("/login.html")
 def serve_login():
-    return send_from_directory(BASE_DIR, "login.html")
+    return _serve_static_entry("login.html", immutable=False)
 
 
 @app.route("/auth.js")
 def serve_auth_js():
-    return send_from_directory(BASE_DIR, "auth.js")
+    return _serve_static_entry("auth.js", immutable=False)
 
 
 @app.route("/admin.html")
 def serve_admin():
-    return send_from_directory(BASE_DIR, "admin.html")
+    return _serve_static_entry("admin.html", immutable=False)
 
 
 @app.route("/admin.js")
 def serve_admin_js():
-    return send_from_directory(BASE_DIR, "admin.js")
+    return _serve_static_entry("admin.js", immutable=False)
+
+
+_build_static_manifest()
 
 
 # =========================================
@@ -835,7 +1318,7 @@ def api_rooms():
             {
                 "name": r["name"],
                 "cameras": [
-                    {"label": c.get("label", f"Camera {i+1}"), "index": i}
+                    {"label": c.get("label", f"Camera {i+1}"), "index": i, "sizes": CAMERA_VARIANT_WIDTHS}
                     for i, c in enumerate(r.get("cameras", []))
                 ],
             }
@@ -1410,7 +1893,7 @@ def _fetch_timeslots_for_cat(cursor, prefix: str, start_dt: datetime, end_dt: da
                `{status_col}` AS status,
                `{cam_col}` AS cam,
                `{ac_col}` AS activity
-        FROM timeslot
+        FROM {_timeslot_source(cursor, start_dt, end_dt)}
         WHERE date_slot >= %s AND date_slot < %s
         ORDER BY date_slot ASC
     """
@@ -1423,6 +1906,7 @@ def _count_activity_transitions(slots, target_activity: str):
     นับ "จำนวนครั้ง" แบบ transition:
       - นับเมื่อ activity เปลี่ยนจาก ไม่ใช่ target -> เป็น target
       - นับเฉพาะ slot ที่ status == 'F' (พบแมว)
+    รับได้ทั้ง slot ดิบและ segment จาก _fetch_segments_for_cat (ผลเท่ากัน)
     """
     cnt = 0
     prev = None
@@ -1436,23 +1920,114 @@ def _count_activity_transitions(slots, target_activity: str):
     return cnt
 
 
+# Catalog ขอบเขตข้อมูลของ timeslot (อยู่ใน memory):
+#   first/last slot, ปีที่มีข้อมูล, วันที่มีข้อมูล + จำนวน slot ต่อวัน
+# สร้างครั้งแรกด้วย GROUP BY วัน (scan ครั้งเดียว) แล้วตามแถวใหม่จาก watermark ของ timeslot.id
+# ตรวจแถวใหม่ไม่บ่อยกว่าทุก TIMESLOT_CATALOG_TTL วินาที; snapshot ถูกแทนที่ทั้งก้อน (อ่านได้โดยไม่ต้อง lock)
+# ถ้ามีการลบ/ย้ายแถวเก่าออกจาก timeslot ให้เรียก _timeslot_catalog_reset()
+TIMESLOT_CATALOG_TTL = float(os.environ.get("TIMESLOT_CATALOG_TTL", "2.0") or 2.0)
+_TIMESLOT_CATALOG_LOCK = Lock()
+_TIMESLOT_CATALOG = {"snapshot": None, "checked_at": 0.0}
+
+
+def _timeslot_catalog_reset():
+    with _TIMESLOT_CATALOG_LOCK:
+        _TIMESLOT_CATALOG["snapshot"] = None
+    _ARCHIVED_COVERAGE["before"] = None
+
+
+def _catalog_snapshot(last_id: int, days: dict) -> dict:
+    first = min((v[1] for v in days.values()), default=None)
+    last = max((v[2] for v in days.values()), default=None)
+    return {
+        "last_id": int(last_id),
+        "first": first,
+        "last": last,
+        "days": days,  # date -> (slot_count, first_dt, last_dt)
+        "years": sorted({d.year for d in days}),
+    }
+
+
+def _timeslot_catalog(cursor) -> dict:
+    """snapshot ล่าสุดของ catalog (ห้ามแก้ dict ที่ได้ไป)"""
+    snap = _TIMESLOT_CATALOG["snapshot"]
+    if snap is not None and time_module.monotonic() - _TIMESLOT_CATALOG["checked_at"] < TIMESLOT_CATALOG_TTL:
+        return snap
+
+    with _TIMESLOT_CATALOG_LOCK:
+        snap = _TIMESLOT_CATALOG["snapshot"]
+        if snap is not None and time_module.monotonic() - _TIMESLOT_CATALOG["checked_at"] < TIMESLOT_CATALOG_TTL:
+            return snap
+
+        if snap is None:
+            cov = _coverage_catalog_days(cursor)
+            if cov is not None:
+                # เริ่มจาก timeslot_coverage (1 แถว/วัน) แล้วตามแถวหลัง watermark ด้านล่าง
+                snap = _catalog_snapshot(cov[0], cov[1])
+
+        if snap is None:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) AS mx FROM timeslot")
+            mx = int((cursor.fetchone() or {}).get("mx") or 0)
+            cursor.execute(
+                """
+                SELECT DATE(date_slot) AS d, COUNT(*) AS c, MIN(date_slot) AS first_dt, MAX(date_slot) AS last_dt
+                FROM timeslot
+                WHERE id <= %s AND date_slot IS NOT NULL
+                GROUP BY DATE(date_slot)
+                """,
+                (mx,),
+            )
+            days = {
+                r["d"]: (int(r["c"] or 0), r["first_dt"], r["last_dt"])
+                for r in (cursor.fetchall() or [])
+                if r.get("d") is not None
+            }
+            snap = _catalog_snapshot(mx, days)
+        else:
+            last_id = snap["last_id"]
+            days = None
+            while True:
+                cursor.execute(
+                    "SELECT id, date_slot FROM timeslot WHERE id > %s ORDER BY id ASC LIMIT 50000",
+                    (last_id,),
+                )
+                rows = cursor.fetchall() or []
+                if not rows:
+                    break
+                if days is None:
+                    days = dict(snap["days"])
+                for r in rows:
+                    last_id = max(last_id, int(r["id"]))
+                    dt = r.get("date_slot")
+                    if not dt:
+                        continue
+                    d = dt.date()
+                    c, f, l = days.get(d, (0, dt, dt))
+                    days[d] = (c + 1, min(f, dt), max(l, dt))
+                if len(rows) < 50000:
+                    break
+            if days is not None:
+                snap = _catalog_snapshot(last_id, days)
+
+        _TIMESLOT_CATALOG["snapshot"] = snap
+        _TIMESLOT_CATALOG["checked_at"] = time_module.monotonic()
+        return snap
+
+
 def _latest_date_in_timeslot(cursor):
-    cursor.execute("SELECT MAX(DATE(date_slot)) AS d FROM timeslot")
-    row = cursor.fetchone() or {}
-    return row.get("d")
+    last = _timeslot_catalog(cursor)["last"]
+    return last.date() if last else None
 
 
 def _latest_datetime_in_timeslot(cursor):
     """คืน datetime ล่าสุดใน timeslot (MAX(date_slot))"""
-    cursor.execute("SELECT MAX(date_slot) AS dt FROM timeslot")
-    row = cursor.fetchone() or {}
-    return row.get("dt")
+    return _timeslot_catalog(cursor)["last"]
 
 
 def _latest_datetime_in_timeslot_day(cursor, day_start: datetime, day_end: datetime):
     """คืน datetime ล่าสุดใน timeslot เฉพาะวันนั้น (MAX(date_slot) ภายในช่วงวัน)"""
     cursor.execute(
-        "SELECT MAX(date_slot) AS dt FROM timeslot WHERE date_slot >= %s AND date_slot < %s",
+        f"SELECT MAX(date_slot) AS dt FROM {_timeslot_source(cursor, day_start, day_end)} WHERE date_slot >= %s AND date_slot < %s",
         (day_start, day_end),
     )
     row = cursor.fetchone() or {}
@@ -2139,18 +2714,14 @@ def _prev_month_ym(today: date) -> str:
 
 def _is_month_complete_in_timeslot(cursor, month_start: datetime, month_end: datetime, days_in_month: int) -> bool:
     """เดือนจะถือว่า 'ครบ' เมื่อมีข้อมูลใน timeslot ครบทุกวันของเดือนนั้น
-    (นับจาก DISTINCT DATE(date_slot) ในช่วง [start, end))
+    (นับวันจาก timeslot_coverage ถ้าพร้อม ไม่งั้นจาก catalog)
     """
-    cursor.execute(
-        """
-        SELECT COUNT(DISTINCT DATE(date_slot)) AS dcnt
-        FROM timeslot
-        WHERE date_slot >= %s AND date_slot < %s
-        """,
-        (month_start, month_end),
-    )
-    row = cursor.fetchone() or {}
-    dcnt = int(row.get("dcnt") or 0)
+    first_day, end_day = month_start.date(), month_end.date()
+    covered = _coverage_days_in_range(cursor, first_day, end_day)
+    if covered is not None:
+        return len(covered) >= int(days_in_month)
+    days = _timeslot_catalog(cursor)["days"]
+    dcnt = sum(1 for d in days if first_day <= d < end_day)
     return dcnt >= int(days_in_month)
 
 
@@ -2428,6 +2999,30 @@ def mark_all_read():
 # =========================================
 # G) CATS (CURRENT ROOM FROM TIMESLOT)
 # =========================================
+def _cat_current_room(cursor, prefix):
+    """ห้องล่าสุดของแมว: หา "slot ล่าสุดที่พบ" (status='F') แล้วเอา cam ไป map ห้อง"""
+    if not prefix:
+        return None
+    status_col = prefix
+    cam_col = f"{prefix}_cam"
+    if not (_safe_identifier(status_col) and _safe_identifier(cam_col)):
+        return None
+    cols = _get_timeslot_columns(cursor)
+    if "date_slot" not in cols or status_col not in cols or cam_col not in cols:
+        return None
+    cursor.execute(f"""
+        SELECT `{cam_col}` AS cam
+        FROM timeslot
+        WHERE `{status_col}`='F'
+          AND `{cam_col}` IS NOT NULL
+        ORDER BY date_slot DESC
+        LIMIT 1
+    """)
+    row = cursor.fetchone() or {}
+    cam = row.get("cam")
+    return CAM_CODE_TO_ROOM.get(str(cam).strip(), None) if cam else None
+
+
 @app.route("/api/cats", methods=["GET"])
 def get_cats():
     """
@@ -2450,34 +3045,18 @@ def get_cats():
         out = []
         for r in cats_rows:
             name = r["name"]
-            prefix = prefix_map.get(name)
-            current_room = None
-
-            if prefix:
-                # หา "slot ล่าสุดที่พบ" ก่อน แล้วเอา cam ไป map ห้อง
-                status_col = prefix
-                cam_col = f"{prefix}_cam"
-                if _safe_identifier(status_col) and _safe_identifier(cam_col):
-                    cols = _get_timeslot_columns(cursor)
-                    if "date_slot" in cols and status_col in cols and cam_col in cols:
-                        sql = f"""
-                            SELECT `{cam_col}` AS cam
-                            FROM timeslot
-                            WHERE `{status_col}`='F'
-                              AND `{cam_col}` IS NOT NULL
-                            ORDER BY date_slot DESC
-                            LIMIT 1
-                        """
-                        cursor.execute(sql)
-                        row = cursor.fetchone() or {}
-                        cam = row.get("cam")
-                        current_room = CAM_CODE_TO_ROOM.get(str(cam).strip(), None) if cam else None
+            current_room = _cat_current_room(cursor, prefix_map.get(name))
 
+            image_url = normalize_image_to_url(r.get("image_url"))
+            real_image_url = normalize_image_to_url(r.get("real_image_url"))
             out.append(
                 {
                     "name": name,
-                    "image_url": normalize_image_to_url(r.get("image_url")),
-                    "real_image_url": normalize_image_to_url(r.get("real_image_url")),
+                    "image_url": image_url,
+                    "real_image_url": real_image_url,
+                    # {"<width>": url} ของรูปย่อ (ว่างถ้ายังย่อไม่เสร็จ -> ใช้ URL ต้นฉบับ)
+                    "image_variants": image_variant_urls(image_url),
+                    "real_image_variants": image_variant_urls(real_image_url),
                     "color": r.get("color"),
                     "display_status": r.get("display_status"),
                     "current_room": current_room,
@@ -2622,6 +3201,214 @@ def update_cat():
         conn.close()
 
 
+# Uploads เก็บแบบ content-addressed: Colorcat/uploads/<sha256>.<ext>
+# - hash ระหว่าง stream ลง temp file แล้ว rename; ถ้ามีไฟล์เดิมอยู่แล้วใช้ของเดิม (dedupe)
+# - ชื่อไฟล์ไม่เปลี่ยนตามเนื้อหา -> /assets เสิร์ฟแบบ immutable ได้
+# - _gc_upload_blobs() ย้ายไฟล์ชื่อแบบเก่า (<cat>_<uuid>.<ext>) ที่ยังถูกอ้างถึงมาเป็น blob
+#   และลบไฟล์ที่ไม่มี cats.real_image_url/image_url อ้างถึงแล้ว (เก่ากว่า UPLOAD_GC_GRACE_SECONDS)
+UPLOAD_GC_GRACE_SECONDS = int(os.environ.get("UPLOAD_GC_GRACE_SECONDS", "3600") or 3600)
+_UPLOAD_BLOB_RE = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]+$")
+_UPLOAD_EXT_ALIASES = {"jpeg": "jpg"}
+
+
+def _upload_blob_name(digest: str, ext: str) -> str:
+    ext = _UPLOAD_EXT_ALIASES.get(ext, ext)
+    return f"{digest}.{ext}"
+
+
+def _store_upload_blob(stream, ext: str) -> str:
+    """เขียน stream ลง uploads/ พร้อมคำนวณ sha256 ไปด้วย คืนชื่อไฟล์ blob"""
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    h = hashlib.sha256()
+    fd, tmp = tempfile.mkstemp(dir=UPLOADS_DIR, prefix=".upload-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(64 * 1024)
+                if not chunk:
+                    break
+                h.update(chunk)
+                out.write(chunk)
+
+        name = _upload_blob_name(h.hexdigest(), ext)
+        dst = os.path.join(UPLOADS_DIR, name)
+        if os.path.exists(dst):
+            os.remove(tmp)
+            os.utime(dst)  # ต่ออายุกัน GC ลบระหว่างที่กำลัง UPDATE cats
+        else:
+            os.replace(tmp, dst)
+        return name
+    except Exception:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(64 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _remove_image_variants(src_rel: str):
+    for width in IMAGE_VARIANT_WIDTHS:
+        try:
+            os.remove(os.path.join(ASSETS_DIR, _image_variant_rel(src_rel, width)))
+        except OSError:
+            pass
+
+
+def _link_upload_blob(path: str, blob_path: str):
+    """สร้าง blob จากไฟล์เดิมโดยไม่แตะไฟล์เดิม (hard link ถ้าได้ ไม่งั้น copy แล้ว rename)"""
+    try:
+        os.link(path, blob_path)
+        return
+    except FileExistsError:
+        return
+    except OSError:
+        pass
+    tmp = os.path.join(UPLOADS_DIR, f".upload-{uuid.uuid4().hex}")
+    try:
+        with open(path, "rb") as src, open(tmp, "wb") as dst:
+            for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                dst.write(chunk)
+        os.replace(tmp, blob_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _gc_upload_blobs(cursor, dry_run: bool = False) -> dict:
+    """ย้ายไฟล์ upload แบบเก่าเป็น blob + ลบ blob ที่ไม่มีใครอ้างถึง (cursor ต้องเป็น dictionary cursor)
+
+    migrate: สร้าง blob + UPDATE cats (caller commit) แต่ไม่ลบไฟล์เดิมในรอบนี้ — ถ้า commit ไม่ผ่าน
+    แถวเดิมยังชี้ไฟล์ที่มีอยู่จริง; รอบถัดไปไฟล์เดิมไม่มีใครอ้างถึงแล้วจึงถูกลบตามปกติ
+    """
+    stats = {"migrated": 0, "deduplicated": 0, "deleted": 0, "freed_bytes": 0, "kept": 0}
+    if not os.path.isdir(UPLOADS_DIR):
+        return stats
+
+    cursor.execute("SELECT name, image_url, real_image_url FROM cats")
+    cats_rows = cursor.fetchall() or []
+
+    # basename (uploads/) -> [(cat name, column)]
+    # resolve แบบเดียวกับ /assets (เช่น /assets/x.jpg ที่ fallback ไปเจอใน uploads/ ก็นับเป็นการอ้างถึง)
+    refs = {}
+    for r in cats_rows:
+        for col in ("image_url", "real_image_url"):
+            rel = _image_source_rel(normalize_image_to_url(r.get(col)))
+            if rel and rel.startswith("uploads/"):
+                refs.setdefault(rel[len("uploads/"):], []).append((r["name"], col))
+
+    now = time_module.time()
+    # ไฟล์แบบเก่าก่อน เพื่อให้ blob ที่เพิ่งถูกอ้างถึงจากการ migrate ไม่โดนลบ
+    names = sorted(os.listdir(UPLOADS_DIR), key=lambda n: (bool(_UPLOAD_BLOB_RE.match(n)), n))
+    for name in names:
+        path = os.path.join(UPLOADS_DIR, name)
+        if not os.path.isfile(path):
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        old_enough = (now - st.st_mtime) >= UPLOAD_GC_GRACE_SECONDS
+
+        if name.startswith(".upload-"):
+            # temp file ค้างจาก upload ที่ล้มเหลว
+            if old_enough and not dry_run:
+                os.remove(path)
+                stats["deleted"] += 1
+                stats["freed_bytes"] += st.st_size
+            continue
+
+        if name in refs:
+            if _UPLOAD_BLOB_RE.match(name):
+                stats["kept"] += 1
+                continue
+            if not _allowed_file(name):
+                stats["kept"] += 1
+                continue
+            blob = _upload_blob_name(_file_sha256(path), name.rsplit(".", 1)[-1].lower())
+            blob_path = os.path.join(UPLOADS_DIR, blob)
+            if os.path.exists(blob_path):
+                stats["deduplicated"] += 1
+            if not dry_run:
+                _link_upload_blob(path, blob_path)
+                for cat_name, col in refs[name]:
+                    cursor.execute(
+                        f"UPDATE cats SET `{col}`=%s WHERE name=%s",
+                        (f"/assets/uploads/{blob}", cat_name),
+                    )
+            refs.setdefault(blob, []).extend(refs[name])
+            stats["migrated"] += 1
+            continue
+
+        if not old_enough:
+            stats["kept"] += 1
+            continue
+        if not dry_run:
+            os.remove(path)
+            _remove_image_variants(f"uploads/{name}")
+        stats["deleted"] += 1
+        stats["freed_bytes"] += st.st_size
+
+    if not dry_run:
+        _asset_index_invalidate()
+    return stats
+
+
+def _run_upload_gc_job():
+    connection = mysql.connector.connect(**db_config)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        stats = _gc_upload_blobs(cursor)
+        connection.commit()
+        app.logger.info(f"[UPLOAD GC] {stats}")
+    except Exception as e:
+        connection.rollback()
+        app.logger.error(f"[UPLOAD GC] Error: {e}", exc_info=True)
+    try:
+        if EVENT_CLIPS_DIR:
+            app.logger.info(f"[CLIP GC] {_prune_event_clips(connection, cursor)}")
+    except Exception as e:
+        connection.rollback()
+        app.logger.error(f"[CLIP GC] Error: {e}", exc_info=True)
+    finally:
+        try:
+            cursor.close()
+        finally:
+            connection.close()
+
+
+@app.route("/api/admin/uploads/gc", methods=["POST"])
+def admin_uploads_gc():
+    """Migrate legacy upload files to content-addressed blobs and delete unreferenced ones.
+    JSON body (optional): { "dry_run": true }
+    """
+    err = _require_admin()
+    if err:
+        return err
+
+    data = request.get_json(silent=True) or {}
+    dry_run = bool(data.get("dry_run"))
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+    try:
+        stats = _gc_upload_blobs(cur, dry_run=dry_run)
+        if not dry_run:
+            conn.commit()
+        return jsonify({"ok": True, "dry_run": dry_run, **stats})
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
 @app.route("/api/cats/upload_image", methods=["POST"])
 def upload_cat_image():
     """Upload an image file and store it as cats.real_image_url.
@@ -2630,7 +3417,7 @@ def upload_cat_image():
       - cat_name (or catName)
       - file (image)
     Returns:
-      - { real_image_url: "/assets/uploads/<filename>" }
+      - { real_image_url: "/assets/uploads/<sha256>.<ext>" }
     """
     cat_name = (request.form.get("cat_name") or request.form.get("catName") or "").strip()
     if not cat_name:
@@ -2648,15 +3435,9 @@ def upload_cat_image():
         return jsonify({"error": "invalid file type"}), 400
 
     ext = filename.rsplit(".", 1)[-1].lower()
-    # Keep a readable filename (supports Thai), but avoid path separators.
-    safe_cat = (cat_name or "cat").strip().replace("/", "_").replace("\\", "_")
-    safe_cat = "_".join(safe_cat.split())
-    if len(safe_cat) > 40:
-        safe_cat = safe_cat[:40]
-    new_name = f"{safe_cat}_{uuid.uuid4().hex}.{ext}"
-    os.makedirs(UPLOADS_DIR, exist_ok=True)
-    save_path = os.path.join(UPLOADS_DIR, new_name)
-    f.save(save_path)
+    new_name = _store_upload_blob(f.stream, ext)
+    _asset_index_invalidate()
+    _schedule_image_variants(f"uploads/{new_name}")
 
     url_path = f"/assets/uploads/{new_name}"
 
@@ -2674,6 +3455,81 @@ def upload_cat_image():
 # =========================================
 # H) TIMESLOT (แทน cat_activities)
 # =========================================
+# format=columnar / format=msgpack สำหรับ /api/cat_activities และ /api/timeline
+# แทนที่จะส่ง object ต่อ slot จะส่ง array ขนานกัน:
+#   start / start_epoch: เวลาของแถวแรก (epoch นับจาก date_slot ตรง ๆ ไม่แปลง timezone)
+#   offsets: วินาทีจาก start ของแต่ละแถว
+#   status/cam/room/activity: index เข้า dict.<ชื่อคอลัมน์> (ค่า null ก็เป็นหนึ่งใน dict)
+try:
+    import msgpack as _msgpack  # optional
+except Exception:
+    _msgpack = None
+
+COLUMNAR_FORMATS = ("columnar", "msgpack")
+
+
+def _columnar_format():
+    """คืน 'columnar' | 'msgpack' | None (แบบเดิม) หรือ raise ValueError ถ้าขอ msgpack แต่ไม่มี lib"""
+    fmt = (request.args.get("format") or "").strip().lower()
+    if fmt not in COLUMNAR_FORMATS:
+        return None
+    if fmt == "msgpack" and _msgpack is None:
+        raise ValueError("msgpack is not installed on the server")
+    return fmt
+
+
+def _columnar_slots(rows, room_of) -> dict:
+    """rows: [{date_slot,status,cam,activity}] -> columnar dict; room_of(cam) -> ชื่อห้อง"""
+    dicts = {"status": [], "cam": [], "room": [], "activity": []}
+    index = {k: {} for k in dicts}
+    cols = {k: [] for k in dicts}
+    offsets = []
+    room_codes = {}  # cam -> index ของห้อง (room_of เรียกครั้งเดียวต่อ cam)
+    start = None
+    start_epoch = 0
+
+    def code(col, val):
+        ix = index[col]
+        i = ix.get(val)
+        if i is None:
+            i = ix[val] = len(dicts[col])
+            dicts[col].append(val)
+        return i
+
+    for r in rows:
+        dt = r.get("date_slot")
+        if dt is None:
+            continue
+        if start is None:
+            start = dt
+            start_epoch = calendar.timegm(dt.timetuple())
+        offsets.append(int((dt - start).total_seconds()))
+        cam = r.get("cam")
+        cols["status"].append(code("status", r.get("status")))
+        cols["cam"].append(code("cam", cam))
+        room_i = room_codes.get(cam)
+        if room_i is None:
+            room_i = room_codes[cam] = code("room", room_of(cam))
+        cols["room"].append(room_i)
+        cols["activity"].append(code("activity", r.get("activity")))
+
+    return {
+        "start": start.strftime("%Y-%m-%d %H:%M:%S") if start else None,
+        "start_epoch": start_epoch if start else None,
+        "slot_seconds": TIMESLOT_SECONDS,
+        "count": len(offsets),
+        "offsets": offsets,
+        **cols,
+        "dict": dicts,
+    }
+
+
+def _columnar_response(payload: dict, fmt: str):
+    if fmt == "msgpack":
+        return Response(_msgpack.packb(payload, use_bin_type=True), mimetype="application/x-msgpack")
+    return Response(json.dumps(payload, ensure_ascii=False, separators=(",", ":")), mimetype="application/json")
+
+
 @app.route("/api/cat_activities", methods=["GET"])
 def get_cat_activities_timeslot():
     """
@@ -2683,6 +3539,7 @@ def get_cat_activities_timeslot():
       cat_name: (required) ชื่อแมว
       start_date, end_date: YYYY-MM-DD (optional)
       limit: default 5000 (กันโหลดหนัก)
+      format: columnar | msgpack (optional) -> object ของ array ขนาน (ดู _columnar_slots)
     คืน:
       [
         {
@@ -2702,6 +3559,10 @@ def get_cat_activities_timeslot():
 
     if not cat_name:
         return jsonify({"message": "cat_name required"}), 400
+    try:
+        fmt = _columnar_format()
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
     try:
         limit_n = int(limit)
@@ -2729,6 +3590,7 @@ def get_cat_activities_timeslot():
         # date filters
         where = []
         params = []
+        sdt = edt = None
 
         if start:
             try:
@@ -2746,12 +3608,14 @@ def get_cat_activities_timeslot():
                 pass
 
         where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+        # ไม่ระบุ start = ล่าสุด N แถว อยู่ใน timeslot เสมอ
+        source = _timeslot_source(cursor, sdt, edt) if sdt else "timeslot"
         sql = f"""
             SELECT date_slot,
                    `{status_col}` AS status,
                    `{cam_col}` AS cam,
                    `{ac_col}` AS activity
-            FROM timeslot
+            FROM {source}
             {where_sql}
             ORDER BY date_slot DESC
             LIMIT {limit_n}
@@ -2759,6 +3623,11 @@ def get_cat_activities_timeslot():
         cursor.execute(sql, tuple(params))
         rows = cursor.fetchall() or []
 
+        if fmt:
+            payload = _columnar_slots(rows, lambda cam: CAM_CODE_TO_ROOM.get(str(cam).strip(), None) if cam else None)
+            payload["cat_name"] = cat_name
+            return _columnar_response(payload, fmt)
+
         out = []
         for r in rows:
             cam = r.get("cam")
@@ -2794,6 +3663,7 @@ def get_timeline_timeslot():
       date: YYYY-MM-DD (optional) จำกัดเฉพาะวันนั้น (default = today)
       before: ISO datetime (optional) โหลดรายการที่ date_slot < before (ใช้สำหรับ scroll ต่อ)
       limit: จำนวนแถว (default 300, max 2000)
+      format: columnar | msgpack (optional) -> rows เป็น array ขนาน (ดู _columnar_slots) ใน "columns"
 
     Response:
       {
@@ -2801,7 +3671,9 @@ def get_timeline_timeslot():
         "rows": [ ... ],
         "returned": N,
         "has_more": true/false,
-        "next_before": "YYYY-MM-DD HH:MM:SS" | null
+        "next_before": "YYYY-MM-DD HH:MM:SS" | null,
+        "next_after_id": <MAX(id) ของแถวที่ส่งกลับ> | null   (ใช้กับ /api/timeline/delta)
+        "revision": int | null   (timeslot revision ตอนโหลด ส่งกลับมาเป็น rev ของ delta)
       }
     """
     cat = request.args.get("cat", "").strip()
@@ -2811,6 +3683,10 @@ def get_timeline_timeslot():
 
     if not cat:
         return jsonify({"message": "cat required"}), 400
+    try:
+        fmt = _columnar_format()
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
     # limit
     try:
@@ -2869,14 +3745,19 @@ def get_timeline_timeslot():
             where.append("date_slot < %s")
             params.append(before_dt)
 
+        # หน้าแรก: high-water ก่อน query -> แถวที่ insert ระหว่างนี้มี id มากกว่า จึงไม่หลุดจาก delta
+        hwm_id = _timeslot_high_water(cursor)[0] if not before_dt else None
+        revision = _timeslot_revision_read(cursor) if not before_dt else None
+
         # ดึงมากกว่า 1 แถวเพื่อเช็ค has_more
         sql = f"""
             SELECT
+              id,
               date_slot,
               `{prefix}` AS status,
               `{prefix}_cam` AS cam,
               `{prefix}_ac` AS activity
-            FROM timeslot
+            FROM {_timeslot_source(cursor, day_start, day_end)}
             WHERE {' AND '.join(where)}
             ORDER BY date_slot DESC
             LIMIT %s
@@ -2888,6 +3769,27 @@ def get_timeline_timeslot():
         has_more = len(rows) > limit_n
         rows = rows[:limit_n]
 
+        # cursor สำหรับ delta-sync: หน้าแรกเท่านั้น (หน้าถัดไปเป็นของเก่า ไม่ต้องใช้)
+        # ใช้ id ของแถวที่ส่งกลับจริง (เหมือน get_timeline_delta) ไม่ใช่ MAX(id) ที่อ่านแยกทีหลัง
+        next_after_id = None
+        if not before_dt:
+            next_after_id = max((int(r["id"]) for r in rows), default=hwm_id)
+
+        if fmt:
+            last_dt = rows[-1].get("date_slot") if rows else None
+            return _columnar_response({
+                "date": date_str,
+                "cat_name": cat,
+                "columns": _columnar_slots(
+                    rows, lambda cam: (CAM_CODE_TO_ROOM.get(str(cam).strip().upper()) if cam else None) or "-"
+                ),
+                "returned": len(rows),
+                "has_more": bool(has_more),
+                "next_before": last_dt.strftime("%Y-%m-%d %H:%M:%S") if last_dt else None,
+                "next_after_id": next_after_id,
+                "revision": revision,
+            }, fmt)
+
         out = []
         for r in rows:
             cam = r.get("cam")
@@ -2908,569 +3810,3001 @@ def get_timeline_timeslot():
             "rows": out,
             "returned": len(out),
             "has_more": bool(has_more),
-            "next_before": next_before
+            "next_before": next_before,
+            "next_after_id": next_after_id,
+            "revision": revision,
         })
     finally:
         cursor.close()
         connection.close()
 
 
-# =========================================
-# I.1) TIMELINE TABLE (HOURLY / DAILY GRID)
-# =========================================
+TIMELINE_DELTA_MAX_ROWS = int(os.environ.get("TIMELINE_DELTA_MAX_ROWS", "500") or 500)
 
-# =========================================
-@app.route("/api/timeline_table")
-def api_timeline_table():
+
+@app.route("/api/timeline/delta", methods=["GET"])
+def get_timeline_delta():
     """
-    ตาราง Timeline รายชั่วโมง (00-23) สำหรับ "ทุกแมวที่ display_status=1"
-    อิงจาก timeslot ในช่วงวันเดียวตาม query param:
-      - date=YYYY-MM-DD (required)
+    Delta-sync สำหรับ auto-refresh ของ timeline 10 วินาที:
+    ส่งเฉพาะแถวที่ "ใหม่กว่า" cursor ของ client แทนการโหลดทั้งหน้าใหม่
+
+    Query params:
+      cat: (required) ชื่อแมว
+      after_id: timeslot.id ล่าสุดที่ client เห็น (แนะนำ — ได้จาก next_after_id)
+      after: ISO datetime (ใช้เมื่อไม่มี after_id) -> แถวที่ date_slot > after
+      date: YYYY-MM-DD (optional) จำกัดเฉพาะวันนั้น (ตรงกับหน้าที่เปิดอยู่)
+      limit: จำนวนแถวสูงสุด (default/max TIMELINE_DELTA_MAX_ROWS)
+      rev: revision ที่ได้จาก /api/timeline (optional) — ถ้าแถวเดิมถูกแก้ตั้งแต่นั้น
+           (ingest แก้ย้อนหลัง, id ไม่เปลี่ยน) จะได้ {"reload": true, "revision": n} ให้โหลดหน้าแรกใหม่
 
     Response:
-      {
-        "date": "YYYY-MM-DD",
-        "hours": ["00","01",...,"23"],
-        "rows": [
-          {
-            "date": "...",
-            "color": "...",
-            "cat_name": "...",
-            "cells": { "00": "...", ... }
-          }, ...
-        ]
+      204 (ไม่มี body) เมื่อไม่มีอะไรใหม่
+      200 {
+        "rows": [ ... ]             (รูปแบบเดียวกับ /api/timeline, ใหม่ -> เก่า),
+        "returned": N,
+        "truncated": true/false,    (true = ใหม่เกิน limit -> client ควรโหลดหน้าแรกใหม่)
+        "next_after_id": int | null,
+        "next_after": "YYYY-MM-DD HH:MM:SS" | null
       }
+
+    after_id ดีกว่า after เพราะ date_slot ไม่ unique และแถวที่เขียนย้อนหลังจะยังได้ id ใหม่
+    ค่าใช้จ่ายในสภาวะปกติ = range scan บน PK เท่ากับจำนวนแถวใหม่ (หรือ 0 ถ้า high-water mark ไม่ขยับ)
     """
-    date_str = request.args.get("date")
-    if not date_str:
-        return jsonify({"message": "date is required (YYYY-MM-DD)"}), 400
+    cat = request.args.get("cat", "").strip()
+    after_id_str = request.args.get("after_id", "").strip()
+    after_str = request.args.get("after", "").strip()
+    date_str = request.args.get("date", "").strip()
+    limit_str = request.args.get("limit", "").strip()
 
+    if not cat:
+        return jsonify({"message": "cat required"}), 400
+    if not after_id_str and not after_str:
+        return jsonify({"message": "after_id or after required"}), 400
     try:
-        day = datetime.strptime(date_str, "%Y-%m-%d").date()
+        client_rev = int(request.args["rev"]) if request.args.get("rev", "").strip() else None
     except ValueError:
-        return jsonify({"message": "date must be YYYY-MM-DD"}), 400
-
-    start = datetime.combine(day, time.min)
-    end = start + timedelta(days=1)
+        return jsonify({"message": "rev must be integer"}), 400
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
+    after_id = None
+    after_dt = None
+    if after_id_str:
+        try:
+            after_id = int(after_id_str)
+        except ValueError:
+            return jsonify({"message": "after_id must be integer"}), 400
+    else:
+        try:
+            after_dt = datetime.strptime(after_str, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            try:
+                after_dt = datetime.fromisoformat(after_str)
+            except ValueError:
+                return jsonify({"message": "after must be datetime"}), 400
 
     try:
-        cur.execute("SELECT name, color FROM cats WHERE display_status=1 ORDER BY name")
-        cats = cur.fetchall() or []
-        cols = _get_timeslot_columns(cur)
-
-        hours = [f"{h:02d}" for h in range(24)]
-        rows = []
-
-        for cat in cats:
-            prefix = _normalize_prefix(cat.get("color"))
-            if not prefix:
-                continue
-
-            # ต้องมีคอลัมน์ prefix/prefix_cam/prefix_ac ใน timeslot
-            if not all(c in cols for c in (prefix, f"{prefix}_cam", f"{prefix}_ac")):
-                continue
+        limit_n = int(limit_str or TIMELINE_DELTA_MAX_ROWS)
+        limit_n = max(1, min(limit_n, TIMELINE_DELTA_MAX_ROWS))
+    except ValueError:
+        limit_n = TIMELINE_DELTA_MAX_ROWS
 
-            cur.execute(
-                f"""
-                SELECT date_slot,
-                       `{prefix}` AS status,
-                       `{prefix}_cam` AS cam,
-                       `{prefix}_ac` AS activity
-                FROM timeslot
-                WHERE date_slot >= %s AND date_slot < %s
-                ORDER BY date_slot ASC
-                """,
-                (start, end),
-            )
+    day_start = day_end = None
+    if date_str:
+        try:
+            day = datetime.strptime(date_str, "%Y-%m-%d").date()
+        except ValueError:
+            return jsonify({"message": "date must be YYYY-MM-DD"}), 400
+        day_start = datetime.combine(day, time.min)
+        day_end = day_start + timedelta(days=1)
 
-            slots = cur.fetchall() or []
-            per_hour = {h: [] for h in range(24)}
-            for s in slots:
-                dt = s.get("date_slot")
-                if not dt:
-                    continue
-                per_hour[int(dt.hour)].append(s)
+    def _not_modified():
+        resp = Response(status=204)
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
 
-            cells = {}
-            for h in range(24):
-                slot_list = per_hour[h]
-                if not slot_list:
-                    cells[f"{h:02d}"] = "-"
-                    continue
+    # high-water mark (cache ~1 วินาที ร่วมกับ response cache) -> ไม่ต้องแตะ timeslot เลยถ้าไม่มีอะไรใหม่
+    try:
+        (max_id, max_dt), _ = _response_cache_state()
+        revision = _timeslot_revision()
+    except Exception:
+        max_id = max_dt = revision = None
+    if client_rev is not None and revision is not None and client_rev != revision:
+        resp = jsonify({"reload": True, "revision": revision})
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+    if after_id is not None and max_id is not None and after_id >= max_id:
+        return _not_modified()
+    if after_dt is not None and max_dt is not None and after_dt >= max_dt:
+        return _not_modified()
 
-                found = [x for x in slot_list if (x.get("status") or "").upper() == "F"]
-                if not found:
-                    cells[f"{h:02d}"] = "Not found (NF)"
-                    continue
+    connection = mysql.connector.connect(**db_config)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT color FROM cats WHERE name=%s LIMIT 1", (cat,))
+        row = cursor.fetchone()
+        if not row or not row.get("color"):
+            return jsonify({"message": f"cat not found: {cat}"}), 404
 
-                # สรุป (1) "จำนวนครั้ง" ของพฤติกรรมต่อชั่วโมง (นับแบบ transition)
-                #     และ (2) "ระยะเวลา" ที่อยู่ในพฤติกรรมนั้นต่อชั่วโมง (นับจากจำนวน timeslot)
-                # key = (activity, room) เช่น ("eat","kitchen")
-                counts = {}          # transition counts (ครั้ง)
-                slot_counts = {}     # raw slot counts (จำนวน timeslot) สำหรับคำนวณเวลา
-                order = []           # preserve first-seen order for nicer display
-                last_key = None
-
-                for s in found:
-                    act_raw = s.get("activity")
-                    act = (str(act_raw).strip().lower() if act_raw is not None else "")
-                    if act in ("no", "", "none", "no activity"):
-                        # ไม่ใช่พฤติกรรมที่ต้องการนับ และให้รีเซ็ต transition
-                        last_key = None
-                        continue
+        prefix = str(row["color"]).strip().lower()
+        cols = _get_timeslot_columns(cursor)
+        needed = {prefix, f"{prefix}_cam", f"{prefix}_ac"}
+        if not needed.issubset(cols):
+            return jsonify({
+                "message": "timeslot columns not found for this cat color",
+                "expected_columns": sorted(list(needed))
+            }), 400
 
-                    if act not in ("eat", "excrete"):
-                        # ถ้ามี activity อื่น ๆ ก็ไม่เอามานับ แต่รีเซ็ต transition เช่นกัน
-                        last_key = None
-                        continue
+        if after_id is not None:
+            where = ["id > %s"]
+            params = [after_id]
+            order = "id ASC"
+        else:
+            where = ["date_slot > %s"]
+            params = [after_dt]
+            order = "date_slot ASC, id ASC"
+        if day_start:
+            where += ["date_slot >= %s", "date_slot < %s"]
+            params += [day_start, day_end]
+
+        # เก่า -> ใหม่ เพื่อให้ cursor ขยับต่อเนื่องแม้ถูกตัดที่ limit
+        cursor.execute(f"""
+            SELECT
+              id,
+              date_slot,
+              `{prefix}` AS status,
+              `{prefix}_cam` AS cam,
+              `{prefix}_ac` AS activity
+            FROM timeslot
+            WHERE {' AND '.join(where)}
+            ORDER BY {order}
+            LIMIT %s
+        """, tuple(params + [limit_n + 1]))
+        rows = cursor.fetchall() or []
 
-                    cam = s.get("cam")
-                    room = CAM_CODE_TO_ROOM.get(str(cam).strip(), "") if cam else ""
-                    room = room or "-"
+        truncated = len(rows) > limit_n
+        rows = rows[:limit_n]
+        if not rows:
+            # แถวใหม่เป็นของวันอื่น (นอก date) -> ขยับ cursor ผ่าน header เพื่อไม่ต้อง scan ซ้ำรอบหน้า
+            resp = _not_modified()
+            if after_id is not None and max_id is not None:
+                resp.headers["X-Next-After-Id"] = str(max_id)
+            return resp
+
+        next_after_id = max(int(r["id"]) for r in rows)
+        if after_id is not None and not truncated and max_id is not None:
+            next_after_id = max(next_after_id, int(max_id))
+        slot_times = [r["date_slot"] for r in rows if r.get("date_slot")]
+        last_dt = max(slot_times) if slot_times else None
 
-                    key = (act, room)
+        out = []
+        for r in sorted(rows, key=lambda x: (x.get("date_slot") or datetime.min, x["id"]), reverse=True):
+            cam = r.get("cam")
+            room = CAM_CODE_TO_ROOM.get(str(cam).strip().upper()) if cam else None
+            out.append({
+                "cat_name": cat,
+                "date_slot": r.get("date_slot").strftime("%Y-%m-%d %H:%M:%S") if r.get("date_slot") else None,
+                "status": r.get("status"),
+                "cam": cam,
+                "room": room or "-",
+                "activity": r.get("activity"),
+            })
 
-                    # duration: นับทุก slot ที่เป็นพฤติกรรมนี้ (ไม่สน transition)
-                    slot_counts[key] = slot_counts.get(key, 0) + 1
+        resp = jsonify({
+            "rows": out,
+            "returned": len(out),
+            "truncated": bool(truncated),
+            "next_after_id": next_after_id,
+            "next_after": last_dt.strftime("%Y-%m-%d %H:%M:%S") if last_dt else None,
+            "revision": revision,
+        })
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+    finally:
+        cursor.close()
+        connection.close()
 
-                    # count: นับแบบ transition (เปลี่ยนพฤติกรรม/ห้องแล้วค่อย +1)
-                    if key != last_key:
-                        if key not in counts:
-                            order.append(key)
-                            counts[key] = 0
-                        counts[key] += 1
-                        last_key = key
 
-                if not counts:
-                    cells[f"{h:02d}"] = "-"
-                else:
-                    # 1 slot = 10 วินาที
-                    def _fmt_minutes(slots: int) -> str:
-                        mins = (slots * 10.0) / 60.0
-                        # ปัดเป็น 1 ตำแหน่ง (เช่น 2.0 -> 2)
-                        mins_1 = round(mins, 1)
-                        if abs(mins_1 - int(mins_1)) < 1e-9:
-                            return str(int(mins_1))
-                        return f"{mins_1:.1f}"
-
-                    parts = []
-                    for k in order:
-                        c = counts.get(k, 0)
-                        sc = slot_counts.get(k, 0)
-                        m = _fmt_minutes(sc)
-                        parts.append(f"{c} {k[0]} @{k[1]} ({m} นาที)")
-
-                    cells[f"{h:02d}"] = ", ".join(parts)
-
-
-            rows.append(
-                {
-                    "date": date_str,
-                    "color": cat.get("color"),
-                    "cat_name": cat.get("name"),
-                    "cells": cells,
-                }
-            )
+# =========================================
+# I.-1) BULK EXPORT (streaming CSV / NDJSON)
+# =========================================
+# /api/export/timeslot: stream ราย slot ต่อแมว (long format) ตามช่วงวันที่
+#   - อ่านด้วย unbuffered cursor + fetchmany ทีละ EXPORT_CHUNK_ROWS -> RAM คงที่
+#   - gzip ระหว่างส่งเมื่อ client ส่ง Accept-Encoding: gzip
+#   - 1 request ส่งไม่เกิน limit แถวของ timeslot (ไม่ค้าง thread นาน ๆ)
+#     ต่อหน้าถัดไปด้วย after=<date_slot>&after_id=<id> ของแถวสุดท้ายที่ได้ (ดู export_timeslot.py)
+import csv
+import io
+import zlib
+
+EXPORT_TOKEN = os.environ.get("EXPORT_TOKEN", "").strip()
+EXPORT_PAGE_ROWS = int(os.environ.get("EXPORT_PAGE_ROWS", "200000") or 200000)
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "2000") or 2000)
+EXPORT_COLUMNS = ("id", "date_slot", "cat_name", "status", "cam", "room", "activity")
+
+
+def _export_auth_error():
+    """admin session หรือ header X-EXPORT-TOKEN (สำหรับ CLI)"""
+    token = request.headers.get("X-EXPORT-TOKEN", "")
+    if EXPORT_TOKEN and token and hmac.compare_digest(token, EXPORT_TOKEN):
+        return None
+    return _require_admin()
 
-        return jsonify({"date": date_str, "hours": hours, "rows": rows})
-    finally:
-        cur.close()
-        conn.close()
 
-@app.route("/api/statistics/years", methods=["GET"])
-def api_statistics_years():
-    """คืน 'ทุกปี' ที่มีข้อมูลใน timeslot (เรียง ASC)"""
-    connection = mysql.connector.connect(**db_config)
-    cursor = connection.cursor(dictionary=True)
+def _parse_export_bound(val: str, is_end: bool):
+    """YYYY-MM-DD (end = สิ้นวันนั้น) หรือ datetime เต็ม; คืน None ถ้าไม่ได้ส่งมา"""
+    val = (val or "").strip()
+    if not val:
+        return None
     try:
-        cursor.execute(
-            """
-            SELECT DISTINCT YEAR(date_slot) AS y
-            FROM timeslot
-            WHERE date_slot IS NOT NULL
-            ORDER BY y ASC
-            """
-        )
-        years = [int(r["y"]) for r in cursor.fetchall() if r.get("y") is not None]
-        return jsonify({"years": years})
-    finally:
-        cursor.close()
-        connection.close()
+        d = datetime.strptime(val, "%Y-%m-%d")
+        return d + timedelta(days=1) if is_end else d
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(val, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return datetime.fromisoformat(val)
 
 
-def _aggregate_counts_by_period(prefix: str, slots, period: str):
-    """
-    สร้าง labels + series จาก slots (list of dict)
-    period: daily/monthly/yearly/range
-    นับแบบ "transition count" ต่อช่วงเวลา
-    """
-    buckets = {}  # label -> list(slots)
-    for s in slots:
-        dt = s.get("date_slot")
-        if not dt:
-            continue
-        if period == "monthly":
-            label = f"{dt.year:04d}-{dt.month:02d}"
-        elif period == "yearly":
-            label = f"{dt.year:04d}"
-        else:
-            label = dt.strftime("%Y-%m-%d")
-        buckets.setdefault(label, []).append(s)
+def _export_lines(cursor, cats, fmt: str):
+    """แปลงแถว timeslot (tuple: id, date_slot, แล้วคอลัมน์ status/cam/ac ของแต่ละแมว) เป็น chunk ของข้อความ"""
+    room_of = {}
+    first = True
+    while True:
+        rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+        if not rows:
+            return
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n") if fmt == "csv" else None
+        if writer and first:
+            writer.writerow(EXPORT_COLUMNS)
+        first = False
+        for row in rows:
+            sid, dt = row[0], row[1]
+            dt_s = dt.strftime("%Y-%m-%d %H:%M:%S") if dt else None
+            for i, name in enumerate(cats):
+                status, cam, act = row[2 + 3 * i: 5 + 3 * i]
+                if cam not in room_of:
+                    room_of[cam] = (CAM_CODE_TO_ROOM.get(str(cam).strip().upper()) if cam else None) or "-"
+                if writer:
+                    writer.writerow((sid, dt_s, name, status, cam, room_of[cam], act))
+                else:
+                    buf.write(json.dumps({
+                        "id": sid, "date_slot": dt_s, "cat_name": name, "status": status,
+                        "cam": cam, "room": room_of[cam], "activity": act,
+                    }, ensure_ascii=False, separators=(",", ":")))
+                    buf.write("\n")
+        yield buf.getvalue().encode("utf-8")
 
-    labels = sorted(buckets.keys())
-    eat_series = []
-    exc_series = []
-    for lb in labels:
-        bslots = buckets[lb]
-        eat_series.append(_count_activity_transitions(bslots, "eat"))
-        exc_series.append(_count_activity_transitions(bslots, "excrete"))
 
-    return labels, eat_series, exc_series
+@app.route("/api/export/timeslot", methods=["GET"])
+def export_timeslot():
+    """
+    Bulk export ราย slot ของแมวที่เลือก (stream, ไม่โหลดทั้งหมดลง RAM)
 
+    Auth: admin session หรือ header X-EXPORT-TOKEN = EXPORT_TOKEN
 
-@app.route("/api/statistics", methods=["GET"])
-def api_statistics():
-    """
     Query params:
-      cat: ชื่อแมว (จำเป็น)
-      period: daily | monthly | yearly | range
-      year: ใช้กับ daily/monthly (ปีสิ้นสุด)
-      month: ใช้กับ daily (เดือน 01-12)
-      start_year, end_year: ใช้กับ yearly
-      start_date, end_date: ใช้กับ range (YYYY-MM-DD)
-    NOTE: ใช้ timeslot แทน cat_activities แล้ว
+      cats: ชื่อแมวคั่นด้วย comma (default = ทุกแมวที่มีคอลัมน์ใน timeslot)
+      start, end: YYYY-MM-DD หรือ "YYYY-MM-DD HH:MM:SS" (end แบบวันที่ = รวมทั้งวัน)
+      format: csv (default) | ndjson
+      after, after_id: resume cursor = date_slot และ id ของแถวสุดท้ายที่ได้รับแล้ว
+      limit: จำนวนแถว timeslot สูงสุดต่อ request (default/max EXPORT_PAGE_ROWS)
+
+    Response: text/csv หรือ application/x-ndjson (gzip ถ้า Accept-Encoding รองรับ)
+      คอลัมน์: id, date_slot, cat_name, status, cam, room, activity — เรียงตาม (date_slot, id)
+      header X-Export-Limit: ถ้าได้ id ไม่ซ้ำครบจำนวนนี้ แปลว่าอาจมีหน้าถัดไป
     """
-    cat = request.args.get("cat")
-    period = (request.args.get("period") or "daily").lower()
-    year = request.args.get("year")
-    month = request.args.get("month")
-    start_year = request.args.get("start_year")
-    end_year = request.args.get("end_year") or year
-    start_date = request.args.get("start_date")
-    end_date = request.args.get("end_date")
+    err = _export_auth_error()
+    if err:
+        return err
 
-    if not cat:
-        return jsonify({"message": "missing cat"}), 400
+    fmt = (request.args.get("format") or "csv").strip().lower()
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"message": "format must be csv or ndjson"}), 400
 
-    connection = mysql.connector.connect(**db_config)
-    cursor = connection.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT color FROM cats WHERE name=%s LIMIT 1", (cat,))
-        crow = cursor.fetchone()
-        if not crow:
-            return jsonify({"labels": [], "series": {}, "summary": {}})
+        start_dt = _parse_export_bound(request.args.get("start"), False)
+        end_dt = _parse_export_bound(request.args.get("end"), True)
+        after_dt = _parse_export_bound(request.args.get("after"), False)
+    except ValueError:
+        return jsonify({"message": "start/end/after must be YYYY-MM-DD or datetime"}), 400
+    after_id_str = (request.args.get("after_id") or "").strip()
+    try:
+        after_id = int(after_id_str) if after_id_str else None
+        limit_n = int(request.args.get("limit") or EXPORT_PAGE_ROWS)
+        limit_n = max(1, min(limit_n, EXPORT_PAGE_ROWS))
+    except ValueError:
+        return jsonify({"message": "after_id/limit must be integer"}), 400
 
-        prefix = _normalize_prefix(crow.get("color") or cat)
+    names = [n.strip() for n in (request.args.get("cats") or "").split(",") if n.strip()]
 
-        # bounds
-        cursor.execute(
-            """
-            SELECT MIN(YEAR(date_slot)) AS miny,
-                   MAX(YEAR(date_slot)) AS maxy
-            FROM timeslot
-            WHERE date_slot IS NOT NULL
-            """
-        )
-        bounds = cursor.fetchone() or {}
-        miny = int(bounds["miny"]) if bounds.get("miny") else None
-        maxy = int(bounds["maxy"]) if bounds.get("maxy") else None
+    connection = mysql.connector.connect(**db_config)
+    streaming = False
+    try:
+        meta = connection.cursor(dictionary=True)
+        try:
+            meta.execute("SELECT name, color FROM cats ORDER BY name")
+            cats_rows = meta.fetchall() or []
+            cols = _get_timeslot_columns(meta)
+            # ช่วงที่เริ่มก่อนขอบ archive (รวมถึงไม่ระบุ start) อ่าน archive table ของเดือนที่ทับช่วงด้วย
+            lower = max((d for d in (start_dt, after_dt) if d), default=datetime.min)
+            source = _timeslot_source(meta, lower, end_dt)
+        finally:
+            meta.close()
 
-        labels, eat_cnt, excrete_cnt = [], [], []
-        total_eat_cnt = 0
-        total_excrete = 0
+        by_name = {r["name"]: _normalize_prefix(r.get("color") or r["name"]) for r in cats_rows}
+        if names:
+            missing = [n for n in names if n not in by_name]
+            if missing:
+                return jsonify({"message": "cat not found", "missing": missing}), 404
+        else:
+            names = [n for n, p in by_name.items() if p and {p, f"{p}_cam", f"{p}_ac"}.issubset(cols)]
+        no_cols = [n for n in names if not {by_name[n], f"{by_name[n]}_cam", f"{by_name[n]}_ac"}.issubset(cols)]
+        if no_cols:
+            return jsonify({"message": "timeslot columns not found for these cats", "cats": no_cols}), 400
+        if not names:
+            return jsonify({"message": "no cats to export"}), 400
+
+        select = ["id", "date_slot"]
+        for n in names:
+            p = by_name[n]
+            select += [f"`{p}`", f"`{p}_cam`", f"`{p}_ac`"]
+
+        where, params = [], []
+        if start_dt:
+            where.append("date_slot >= %s")
+            params.append(start_dt)
+        if end_dt:
+            where.append("date_slot < %s")
+            params.append(end_dt)
+        if after_dt and after_id is not None:
+            # keyset (date_slot, id) > (after, after_id) — เขียนแบบนี้ให้ใช้ range บน index date_slot ได้
+            where.append("date_slot >= %s AND (date_slot > %s OR id > %s)")
+            params += [after_dt, after_dt, after_id]
+        elif after_dt:
+            where.append("date_slot > %s")
+            params.append(after_dt)
 
-        if period == "range":
-            if not start_date or not end_date:
-                return jsonify({"labels": [], "series": {}, "summary": {}})
+        sql = f"""
+            SELECT {', '.join(select)}
+            FROM {source}
+            {('WHERE ' + ' AND '.join(where)) if where else ''}
+            ORDER BY date_slot ASC, id ASC
+            LIMIT %s
+        """
+        # unbuffered: แถวถูกดึงจาก server ทีละ fetchmany ไม่ใช่ทั้งชุด
+        cursor = connection.cursor(buffered=False)
+        cursor.execute(sql, tuple(params + [limit_n]))
 
-            sdt = datetime.strptime(start_date, "%Y-%m-%d")
-            edt = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+        use_gzip = "gzip" in (request.headers.get("Accept-Encoding") or "").lower()
 
-            slots = _fetch_timeslots_for_cat(cursor, prefix, sdt, edt)
-            labels, eat_cnt, excrete_cnt = _aggregate_counts_by_period(prefix, slots, "daily")
+        def generate():
+            try:
+                if not use_gzip:
+                    yield from _export_lines(cursor, names, fmt)
+                    return
+                z = zlib.compressobj(6, zlib.DEFLATED, 31)
+                for chunk in _export_lines(cursor, names, fmt):
+                    out = z.compress(chunk)
+                    if out:
+                        yield out
+                yield z.flush()
+            finally:
+                # client ตัดกลางทาง -> ยังมีแถวค้างใน unbuffered cursor; ปิดแบบไม่สนใจ error
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+                try:
+                    connection.close()
+                except Exception:
+                    pass
 
-        elif period == "daily":
-            if not year:
-                if maxy:
-                    year = str(maxy)
-                else:
-                    return jsonify({"labels": [], "series": {}, "summary": {}})
-            if not month:
-                month = "01"
-
-            y = int(year)
-            m = int(month)
-            start_dt = datetime(y, m, 1)
-            if m == 12:
-                end_dt = datetime(y + 1, 1, 1)
-            else:
-                end_dt = datetime(y, m + 1, 1)
+        headers = {
+            "Cache-Control": "no-store",
+            "X-Export-Limit": str(limit_n),
+            "X-Accel-Buffering": "no",
+            "Vary": "Accept-Encoding",
+        }
+        if use_gzip:
+            headers["Content-Encoding"] = "gzip"
+        mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+        streaming = True
+        return Response(generate(), mimetype=mimetype, headers=headers)
+    finally:
+        if not streaming:
+            connection.close()
 
-            slots = _fetch_timeslots_for_cat(cursor, prefix, start_dt, end_dt)
-            labels, eat_cnt, excrete_cnt = _aggregate_counts_by_period(prefix, slots, "daily")
 
-        elif period == "monthly":
-            if not year:
-                if maxy:
-                    year = str(maxy)
-                else:
-                    return jsonify({"labels": [], "series": {}, "summary": {}})
+# =========================================
+# I.-2) BATCH INGEST (detector -> timeslot)
+# =========================================
+# POST /api/ingest/timeslot: รับ record ราย (slot, แมว) เป็น JSON lines หรือ CSV (คอลัมน์เดียวกับ export)
+#   - validate ตาม enum ของ timeslot ทั้ง batch ก่อนเขียน (ผิดแม้แถวเดียว = ไม่เขียนเลย)
+#   - รวม record ของ slot เดียวกันเป็นแถวกว้าง แล้วเขียนด้วย multi-row INSERT ... ON DUPLICATE KEY UPDATE
+#     date_slot ไม่ unique: slot ที่มีอยู่แล้วจะอัปเดตแถว id น้อยสุดของ slot นั้น ส่วน slot ใหม่ insert แถวใหม่
+#   - ใน transaction เดียวกัน: สร้าง timeslot_hourly / timeslot_segments ของชั่วโมง/วันที่โดนแก้ใหม่
+#     (แถวที่ถูก update มี id ต่ำกว่า watermark worker จะไม่เห็นเอง)
+#   - หลัง commit: ล้าง response cache (รวม disk) และรัน no_cat evaluator ถ้า batch มี slot ของวันนี้
+INGEST_TOKEN = os.environ.get("INGEST_TOKEN", "").strip()
+INGEST_MAX_RECORDS = int(os.environ.get("INGEST_MAX_RECORDS", "500000") or 500000)
+INGEST_CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", "1000") or 1000)
+INGEST_MAX_ERRORS = 50
+INGEST_STATUS = {"F": "F", "NF": "NF"}
+INGEST_CAMS = {c: c for c in ("C1", "C2", "C3", "C4")}
+INGEST_ACTIVITIES = {"eat": "eat", "excrete": "excrete", "no": "NO"}
+_INGEST_LOCK = Lock()
+
+
+def _ingest_records(stream, is_csv: bool):
+    """(line_no, dict) จาก body แบบ CSV (มี header) หรือ JSON lines"""
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="" if is_csv else None)
+    if is_csv:
+        for i, row in enumerate(csv.DictReader(text), start=2):
+            yield i, row
+        return
+    for i, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield i, None
+            continue
+        yield i, row if isinstance(row, dict) else None
+
+
+def _ingest_parse(records, prefix_of_name: dict, prefix_of_color: dict, cols: set):
+    """validate + รวมเป็น {date_slot: {prefix: (status, cam, ac)}}; คืน (slots, n_records, errors)"""
+    slots = {}
+    errors = []
+    n = 0
+    # เดือนก่อนขอบ archive ย้ายออกจาก timeslot แล้ว (rollup/segments ของเดือนนั้นถูกเก็บไว้)
+    # แถวใหม่จะตกลง partition สดแล้ว rebuild ทับ rollup ของเดือนที่ archive -> ไม่รับ
+    archived_before = _timeslot_archived_before()
+
+    def bad(line_no, msg):
+        if len(errors) < INGEST_MAX_ERRORS:
+            errors.append({"line": line_no, "error": msg})
+
+    for line_no, r in records:
+        n += 1
+        if n > INGEST_MAX_RECORDS:
+            bad(line_no, f"too many records (max {INGEST_MAX_RECORDS})")
+            break
+        if r is None:
+            bad(line_no, "invalid JSON object")
+            continue
 
-            y = int(year)
-            start_dt = datetime(y, 1, 1)
-            end_dt = datetime(y + 1, 1, 1)
+        ds = str(r.get("date_slot") or "").strip()
+        try:
+            dt = datetime.strptime(ds, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            try:
+                dt = datetime.fromisoformat(ds).replace(tzinfo=None)
+            except ValueError:
+                bad(line_no, "date_slot must be 'YYYY-MM-DD HH:MM:SS'")
+                continue
+        if dt.microsecond or dt.second % TIMESLOT_SECONDS:
+            bad(line_no, f"date_slot must align to {TIMESLOT_SECONDS}s slots")
+            continue
+        if archived_before is not None and dt < archived_before:
+            bad(line_no, f"date_slot is in an archived month (before {archived_before:%Y-%m-%d})")
+            continue
 
-            slots = _fetch_timeslots_for_cat(cursor, prefix, start_dt, end_dt)
-            labels, eat_cnt, excrete_cnt = _aggregate_counts_by_period(prefix, slots, "monthly")
+        name = str(r.get("cat_name") or "").strip()
+        color = str(r.get("color") or "").strip().lower()
+        prefix = prefix_of_name.get(name) if name else prefix_of_color.get(color)
+        if not prefix:
+            bad(line_no, f"unknown cat: {name or color or '-'}")
+            continue
+        if not {prefix, f"{prefix}_cam", f"{prefix}_ac"}.issubset(cols):
+            bad(line_no, f"timeslot columns not found for: {prefix}")
+            continue
 
-        else:
-            # yearly
-            if not end_year and maxy:
-                end_year = str(maxy)
-            if not start_year and miny:
-                start_year = str(miny)
-            if not start_year or not end_year:
-                return jsonify({"labels": [], "series": {}, "summary": {}})
-
-            s_y = int(start_year)
-            e_y = int(end_year)
-            if miny is not None:
-                s_y = max(s_y, miny)
-            if maxy is not None:
-                e_y = min(e_y, maxy)
-            if s_y > e_y:
-                s_y, e_y = e_y, s_y
-
-            start_dt = datetime(s_y, 1, 1)
-            end_dt = datetime(e_y + 1, 1, 1)
+        status = INGEST_STATUS.get(str(r.get("status") or "").strip().upper())
+        if status is None:
+            bad(line_no, "status must be F or NF")
+            continue
+        cam_raw = str(r.get("cam") or "").strip().upper()
+        cam = INGEST_CAMS.get(cam_raw) if cam_raw else None
+        if cam_raw and cam is None:
+            bad(line_no, "cam must be C1..C4 or empty")
+            continue
+        ac_raw = str(r.get("activity") or "").strip().lower()
+        ac = INGEST_ACTIVITIES.get(ac_raw) if ac_raw else None
+        if ac_raw and ac is None:
+            bad(line_no, "activity must be eat, excrete, NO or empty")
+            continue
 
-            slots = _fetch_timeslots_for_cat(cursor, prefix, start_dt, end_dt)
-            labels, eat_cnt, excrete_cnt = _aggregate_counts_by_period(prefix, slots, "yearly")
+        # record ซ้ำ (slot, แมว) ใน batch -> ตัวหลังชนะ
+        slots.setdefault(dt, {})[prefix] = (status, cam, ac)
+    return slots, n, errors
 
-        total_eat_cnt = sum(int(x or 0) for x in eat_cnt)
-        total_excrete = sum(int(x or 0) for x in excrete_cnt)
 
-        return jsonify(
-            {
-                "labels": labels,
-                "series": {
-                    "eatCount": eat_cnt,
-                    "excreteCount": excrete_cnt,
-                },
-                "summary": {
-                    "totalEatCount": total_eat_cnt,
-                    "totalExcreteCount": total_excrete,
-                },
-            }
+def _ingest_write(cursor, slots: dict, all_prefixes) -> dict:
+    """multi-row upsert ลง timeslot; คืนจำนวน inserted/updated
+
+    slot ใหม่: คอลัมน์ status ของแมวที่ไม่ได้ส่งมาเป็น NOT NULL -> ใส่ 'NF' ให้ชัดเจน
+    ('F' = เจอแมว จะกลายเป็นการเห็นแมวตัวอื่นใน slot นั้น; แถวที่มีอยู่แล้วไม่แตะคอลัมน์แมวอื่น)
+    """
+    # id ของแถวที่มีอยู่แล้ว (แถวแรกของแต่ละ slot) — query ทีละวัน
+    by_day = {}
+    for dt in slots:
+        by_day.setdefault(dt.date(), []).append(dt)
+    existing = {}
+    for day, dts in by_day.items():
+        cursor.execute(
+            """
+            SELECT date_slot, MIN(id) AS id
+            FROM timeslot
+            WHERE date_slot >= %s AND date_slot <= %s
+            GROUP BY date_slot
+            """,
+            (min(dts), max(dts)),
         )
-    finally:
-        cursor.close()
-        connection.close()
+        for r in cursor.fetchall() or []:
+            if r["date_slot"] in slots:
+                existing[r["date_slot"]] = int(r["id"])
+
+    # VALUES แบบหลายแถวต้องมีคอลัมน์ชุดเดียวกัน -> จัดกลุ่มตาม (ใหม่/มีอยู่แล้ว, ชุดแมวใน slot)
+    groups = {}
+    for dt in sorted(slots):
+        groups.setdefault((dt not in existing, tuple(sorted(slots[dt]))), []).append(dt)
+
+    for (is_new, prefixes), dts in groups.items():
+        cols = ["id", "date_slot"]
+        for p in prefixes:
+            cols += [f"`{p}`", f"`{p}_cam`", f"`{p}_ac`"]
+        update = ", ".join(f"{c}=VALUES({c})" for c in cols[2:])
+        fill = [p for p in all_prefixes if p not in prefixes] if is_new else []
+        cols += [f"`{p}`" for p in fill]
+        row_ph = "(" + ",".join(["%s"] * len(cols)) + ")"
+        for i in range(0, len(dts), INGEST_CHUNK_ROWS):
+            chunk = dts[i:i + INGEST_CHUNK_ROWS]
+            params = []
+            for dt in chunk:
+                params += [existing.get(dt), dt]
+                for p in prefixes:
+                    params += list(slots[dt][p])
+                params += ["NF"] * len(fill)
+            cursor.execute(
+                f"INSERT INTO timeslot ({', '.join(cols)}) VALUES {','.join([row_ph] * len(chunk))} "
+                f"ON DUPLICATE KEY UPDATE {update}",
+                tuple(params),
+            )
+    return {"inserted": len(slots) - len(existing), "updated": len(existing)}
 
 
-# =========================================
-# J) ROOM TIMELINE (LATEST DAY) - FROM TIMESLOT
-# =========================================
-@app.route("/api/statistics/room_timeline", methods=["GET"])
-def api_room_timeline_latest_day():
+def _ingest_refresh_derived(cursor, slots: dict):
+    """สร้าง rollup/segments ของช่วงที่ batch แตะใหม่ (เฉพาะเมื่อ table นั้นตาม prefix ปัจจุบันอยู่แล้ว
+    ถ้า prefix เปลี่ยน worker จะ rebuild ทั้งหมดเองอยู่แล้ว)"""
+    if _coverage_watermark(cursor) > 0:
+        with _COVERAGE_LOCK:
+            _rebuild_coverage_days(cursor, {dt.date() for dt in slots})
+
+    prefixes = _hourly_rollup_prefixes(cursor)
+    if not prefixes:
+        return
+    prefixes_key = ",".join(prefixes)
+
+    if HOURLY_ROLLUP_ENABLED:
+        with _HOURLY_ROLLUP_LOCK:
+            if _state_get_tx(cursor, "hourly_rollup_prefixes", "") == prefixes_key:
+                _ensure_hourly_rollup_table(cursor)
+                hours = {dt.replace(minute=0, second=0, microsecond=0) for dt in slots}
+                _rebuild_hourly_rollup(cursor, hours, prefixes)
+
+    if SEGMENTS_ENABLED:
+        with _SEGMENTS_LOCK:
+            if _state_get_tx(cursor, "segments_prefixes", "") == prefixes_key:
+                _ensure_segments_table(cursor)
+                min_new = {}
+                for dt in slots:
+                    d = dt.date()
+                    if d not in min_new or dt < min_new[d]:
+                        min_new[d] = dt
+                for d in sorted(min_new):
+                    _rebuild_segments_for_day(cursor, d, min_new[d], prefixes)
+
+
+@app.route("/api/ingest/timeslot", methods=["POST"])
+def ingest_timeslot():
     """
-    คืนตาราง 'ห้องที่แมวอยู่' รายชั่วโมง (00:00-23:00) ของ 'วันล่าสุด' ที่ปรากฏในฐานข้อมูล (timeslot)
-    Query params:
-      cat: ชื่อแมว (จำเป็น)
+    รับผลตรวจจับเป็น batch (trusted detector)
+
+    Auth: header X-INGEST-TOKEN = INGEST_TOKEN
+    Body: JSON lines (default) หรือ CSV (Content-Type: text/csv) — gzip ได้ (Content-Encoding: gzip)
+      แต่ละ record: date_slot, cat_name (หรือ color), status (F|NF), cam (C1..C4|ว่าง), activity (eat|excrete|NO|ว่าง)
+    Query: dry_run=1 -> validate อย่างเดียว
+
     Response:
-      {
-        "date": "YYYY-MM-DD",
-        "hours": ["00:00",...,"23:00"],
-        "rooms": ["kitchen",...]
-      }
+      200 {"ok": true, "records": N, "slots": M, "inserted": a, "updated": b, "no_cat_alerts": k}
+      400 {"ok": false, "error": "invalid_records", "errors": [{"line": n, "error": "..."}]}
     """
-    cat = request.args.get("cat")
-    if not cat:
-        return jsonify({"date": None, "hours": [], "rooms": []}), 400
+    if not INGEST_TOKEN:
+        return jsonify({"ok": False, "error": "server_not_configured"}), 500
+    token = request.headers.get("X-INGEST-TOKEN", "")
+    if not token or not hmac.compare_digest(token, INGEST_TOKEN):
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+
+    is_csv = "csv" in (request.content_type or "").lower()
+    stream = request.stream
+    if (request.headers.get("Content-Encoding") or "").lower() == "gzip":
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    dry_run = request.args.get("dry_run") in ("1", "true")
 
     connection = mysql.connector.connect(**db_config)
     cursor = connection.cursor(dictionary=True)
     try:
-        cursor.execute("SELECT color FROM cats WHERE name=%s LIMIT 1", (cat,))
-        crow = cursor.fetchone()
-        if not crow:
-            return jsonify({"date": None, "hours": [], "rooms": []})
-
-        prefix = _normalize_prefix(crow.get("color") or cat)
-        latest_day = _latest_date_in_timeslot(cursor)
-        if not latest_day:
-            return jsonify({"date": None, "hours": [], "rooms": []})
-
-        day_start = datetime.combine(latest_day, time.min)
-        day_end = day_start + timedelta(days=1)
-
-        slots = _fetch_timeslots_for_cat(cursor, prefix, day_start, day_end)
-
-        # สร้าง mapping ชั่วโมง -> ห้อง (ใช้ slot ล่าสุดที่ status='F' ภายในชั่วโมงนั้น)
-        hours = [f"{h:02d}:00" for h in range(24)]
-        rooms = []
-
-        # เตรียม list ต่อชั่วโมง
-        idx = 0
-        for h in range(24):
-            h_start = day_start + timedelta(hours=h)
-            h_end = h_start + timedelta(hours=1)
+        cursor.execute("SELECT name, color FROM cats")
+        cats_rows = cursor.fetchall() or []
+        cols = _get_timeslot_columns(cursor)
+        prefix_of_name = {r["name"]: _normalize_prefix(r.get("color") or r["name"]) for r in cats_rows}
+        prefix_of_color = {str(r.get("color") or "").strip().lower(): _normalize_prefix(r.get("color"))
+                           for r in cats_rows if r.get("color")}
 
-            last_cam = None
-            # เดิน idx ต่อเนื่องเพื่อลดเวลา (slots เรียง ASC)
-            while idx < len(slots) and slots[idx].get("date_slot") < h_start:
-                idx += 1
+        try:
+            slots, n_records, errors = _ingest_parse(
+                _ingest_records(stream, is_csv), prefix_of_name, prefix_of_color, cols
+            )
+        except (UnicodeDecodeError, OSError, EOFError, zlib.error, csv.Error) as e:
+            # gzip เสีย/ขาดกลางทาง -> OSError (BadGzipFile) / EOFError / zlib.error
+            return jsonify({"ok": False, "error": "unreadable_body", "message": str(e)}), 400
+        if errors:
+            return jsonify({"ok": False, "error": "invalid_records", "records": n_records, "errors": errors}), 400
+        if not slots:
+            return jsonify({"ok": True, "records": 0, "slots": 0, "inserted": 0, "updated": 0, "no_cat_alerts": 0})
+        if dry_run:
+            return jsonify({"ok": True, "dry_run": True, "records": n_records, "slots": len(slots)})
+
+        with _INGEST_LOCK:
+            try:
+                all_prefixes = sorted(c for c in cols if f"{c}_cam" in cols and f"{c}_ac" in cols)
+                counts = _ingest_write(cursor, slots, all_prefixes)
+                _ingest_refresh_derived(cursor, slots)
+                revision = _timeslot_revision_read(cursor)
+                if counts.get("updated"):
+                    # แถวเดิมถูกแก้ (id ไม่เปลี่ยน) -> bump revision ให้ timeline delta / SSE รู้ว่าต้องโหลดใหม่
+                    revision += 1
+                    _state_set_tx(cursor, "timeslot_revision", str(revision))
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
 
-            j = idx
-            while j < len(slots):
-                dt = slots[j].get("date_slot")
-                if not dt or dt >= h_end:
-                    break
-                if (slots[j].get("status") or "").upper() == "F":
-                    cam = slots[j].get("cam")
-                    if cam:
-                        last_cam = str(cam).strip()
-                j += 1
+        _response_cache_clear(disk=True)
 
-            room = CAM_CODE_TO_ROOM.get(last_cam) if last_cam else None
-            rooms.append(room if room else "-")
+        no_cat = 0
+        if max(slots).date() == date.today():
+            try:
+                no_cat = int(_ingest_realtime_no_cat(cursor) or 0)
+                connection.commit()
+            except Exception as e:
+                connection.rollback()
+                app.logger.warning(f"[INGEST] no_cat evaluator error: {e}")
 
-        return jsonify(
-            {
-                "date": latest_day.strftime("%Y-%m-%d"),
-                "hours": hours,
-                "rooms": rooms,
-            }
-        )
+        return jsonify({
+            "ok": True, "records": n_records, "slots": len(slots), **counts,
+            "no_cat_alerts": no_cat, "revision": revision,
+        })
     finally:
         cursor.close()
         connection.close()
 
 
 # =========================================
-# MAIN
+# I.0) RESPONSE CACHE (historical periods)
 # =========================================
-# ============================================================
-# Daily vs Realtime alert modes
-# ============================================================
+# cache ผลลัพธ์ JSON ของ endpoint ที่คำนวณจาก timeslot ตามช่วงเวลา
+#   key = (path, params ที่ normalize แล้ว, fingerprint ของตาราง cats)
+#   - ช่วงที่ "ปิดแล้ว" (end <= MAX(date_slot)) ถือว่าไม่เปลี่ยนอีก -> strong ETag + เก็บลง disk ได้
+#   - ช่วงที่ยังเปิดอยู่ ใช้ได้จนกว่า high-water mark ของ timeslot (MAX(id), MAX(date_slot)) จะเปลี่ยน
+# memory: LRU จำกัดด้วย RESPONSE_CACHE_MAX_BYTES; disk (optional): RESPONSE_CACHE_DIR
+import functools
+from collections import OrderedDict
+
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)) or 0)
+RESPONSE_CACHE_DIR = (os.environ.get("RESPONSE_CACHE_DIR") or "").strip()
+RESPONSE_CACHE_STATE_TTL = float(os.environ.get("RESPONSE_CACHE_STATE_TTL", "1.0") or 1.0)
+
+_RESPONSE_CACHE = OrderedDict()  # key -> {"body","etag","closed","hwm","size"}
+_RESPONSE_CACHE_BYTES = 0
+_RESPONSE_CACHE_LOCK = Lock()
+_RESPONSE_CACHE_STATE = {"at": 0.0, "hwm": None, "cats": None, "rev": 0}
+
+
+def _timeslot_high_water(cursor):
+    """(MAX(id), MAX(date_slot)) ของ timeslot — ทั้งคู่อ่านจาก index จึงถูก"""
+    cursor.execute("SELECT MAX(id) AS max_id, MAX(date_slot) AS max_dt FROM timeslot")
+    row = cursor.fetchone() or {}
+    return (row.get("max_id"), row.get("max_dt"))
 
-def _ingest_alerts_list(cursor, target_day: date, alerts: list[dict]) -> int:
-    """Insert alerts list into alerts_log using same duplicate rules as _ingest_alerts_for_day.
 
-    alerts item schema:
-      {"cat_name": str, "alert_type": str, "message": str}
-    Returns number of inserted rows.
-    """
-    table = "alerts_log"
-    inserted = 0
+def _timeslot_revision_read(cursor) -> int:
+    """revision ของการแก้แถว timeslot ที่มีอยู่แล้ว (ingest แก้ย้อนหลัง id เดิม -> high-water mark ไม่ขยับ)"""
+    try:
+        cursor.execute("SELECT v FROM notification_state WHERE k='timeslot_revision' LIMIT 1")
+        return int((cursor.fetchone() or {}).get("v") or 0)
+    except (mysql.connector.Error, ValueError):
+        return 0
 
-    has_color = _table_has_column(cursor, table, "color")
-    alert_date_generated = _is_generated_column(cursor, table, "alert_date")
 
-    for al in alerts:
-        cat_name = al.get("cat_name")
-        alert_type = al.get("alert_type")
-        message = al.get("message")
-        if not (cat_name and alert_type and message):
-            continue
+def _timeslot_revision() -> int:
+    """revision ปัจจุบัน (cache ร่วมกับ _response_cache_state)"""
+    _response_cache_state()
+    return int(_RESPONSE_CACHE_STATE.get("rev") or 0)
 
-        # กันซ้ำ: (cat_name, alert_type, alert_date) และ is_read <> 2
-        cursor.execute(
-            f"""
-            SELECT id
-            FROM `{table}`
-            WHERE cat_name = %s AND alert_type = %s AND alert_date = %s AND is_read <> 2
-            LIMIT 1
-            """,
-            (cat_name, alert_type, target_day),
-        )
-        if cursor.fetchone():
-            continue
 
-        # color (ถ้าตารางมี)
-        color_val = None
-        if has_color:
-            cursor.execute("SELECT color FROM cats WHERE name=%s LIMIT 1", (cat_name,))
-            r = cursor.fetchone() or {}
-            color_val = r.get("color")
+def _response_cache_state():
+    """(hwm, cats fingerprint) จำไว้ RESPONSE_CACHE_STATE_TTL วินาที เพื่อไม่ต้องถาม DB ทุก request
+    fingerprint รวม timeslot revision ด้วย -> แถวที่ถูกแก้ย้อนหลังทำให้ cache ทุก process หมดอายุ"""
+    now = time_module.monotonic()
+    st = _RESPONSE_CACHE_STATE
+    if st["hwm"] is not None and now - st["at"] < RESPONSE_CACHE_STATE_TTL:
+        return st["hwm"], st["cats"]
 
-        # ถ้า alert_date เป็น generated: ห้าม insert alert_date เอง
-        if alert_date_generated:
-            created_at = datetime.combine(target_day, time(23, 59, 0))
-            if has_color:
-                cursor.execute(
-                    f"""
-                    INSERT INTO `{table}` (cat_name, color, alert_type, message, is_read, created_at)
-                    VALUES (%s, %s, %s, %s, 0, %s)
-                    """,
-                    (cat_name, color_val, alert_type, message, created_at),
-                )
-            else:
-                cursor.execute(
-                    f"""
-                    INSERT INTO `{table}` (cat_name, alert_type, message, is_read, created_at)
-                    VALUES (%s, %s, %s, 0, %s)
-                    """,
-                    (cat_name, alert_type, message, created_at),
-                )
-        else:
-            if has_color:
-                cursor.execute(
-                    f"""
-                    INSERT INTO `{table}` (cat_name, color, alert_type, message, is_read, alert_date, created_at)
-                    VALUES (%s, %s, %s, %s, 0, %s, NOW())
-                    """,
-                    (cat_name, color_val, alert_type, message, target_day),
-                )
-            else:
-                cursor.execute(
-                    f"""
-                    INSERT INTO `{table}` (cat_name, alert_type, message, is_read, alert_date, created_at)
-                    VALUES (%s, %s, %s, 0, %s, NOW())
-                    """,
-                    (cat_name, alert_type, message, target_day),
-                )
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+    try:
+        hwm = _timeslot_high_water(cur)
+        cur.execute("SELECT name, color, display_status FROM cats ORDER BY name")
+        cats_rows = cur.fetchall() or []
+        rev = _timeslot_revision_read(cur)
+    finally:
+        cur.close()
+        conn.close()
 
-        inserted += 1
+    cats_fp = hashlib.sha1(
+        repr(([(r.get("name"), r.get("color"), r.get("display_status")) for r in cats_rows], rev)).encode("utf-8")
+    ).hexdigest()[:16]
+    st.update({"at": now, "hwm": hwm, "cats": cats_fp, "rev": rev})
+    return hwm, cats_fp
+
+
+def _response_cache_clear(disk: bool = False):
+    """ล้าง cache ใน memory; disk=True ล้าง RESPONSE_CACHE_DIR ด้วย (เมื่อช่วงที่ "ปิดแล้ว" ถูกแก้ย้อนหลัง)"""
+    global _RESPONSE_CACHE_BYTES
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE.clear()
+        _RESPONSE_CACHE_BYTES = 0
+        _RESPONSE_CACHE_STATE["hwm"] = None
+    if disk and RESPONSE_CACHE_DIR and os.path.isdir(RESPONSE_CACHE_DIR):
+        for name in os.listdir(RESPONSE_CACHE_DIR):
+            if name.endswith(".json"):
+                try:
+                    os.remove(os.path.join(RESPONSE_CACHE_DIR, name))
+                except OSError:
+                    pass
 
-    return inserted
 
+def _response_cache_disk_path(key) -> str:
+    return os.path.join(RESPONSE_CACHE_DIR, hashlib.sha256(repr(key).encode("utf-8")).hexdigest() + ".json")
 
-def _ingest_daily_behavior_for_day(cursor, target_day: date) -> int:
-    """Daily mode: ingest only eating/excretion alerts for target_day."""
-    all_alerts = _compute_alerts_for_day(cursor, target_day)
-    behavior = [a for a in all_alerts if a.get("alert_type") in ("no_eating", "low_excrete", "high_excrete")]
-    return _ingest_alerts_list(cursor, target_day, behavior)
 
+def _response_cache_put(key, entry: dict):
+    global _RESPONSE_CACHE_BYTES
+    if entry["size"] > RESPONSE_CACHE_MAX_BYTES:
+        return
+    with _RESPONSE_CACHE_LOCK:
+        old = _RESPONSE_CACHE.pop(key, None)
+        if old:
+            _RESPONSE_CACHE_BYTES -= old["size"]
+        _RESPONSE_CACHE[key] = entry
+        _RESPONSE_CACHE_BYTES += entry["size"]
+        while _RESPONSE_CACHE_BYTES > RESPONSE_CACHE_MAX_BYTES and _RESPONSE_CACHE:
+            _, ev = _RESPONSE_CACHE.popitem(last=False)
+            _RESPONSE_CACHE_BYTES -= ev["size"]
+
+
+def _response_cache_get(key, hwm, closed: bool):
+    global _RESPONSE_CACHE_BYTES
+    with _RESPONSE_CACHE_LOCK:
+        entry = _RESPONSE_CACHE.get(key)
+        if entry is not None:
+            if entry["closed"] or entry["hwm"] == hwm:
+                _RESPONSE_CACHE.move_to_end(key)
+                return entry
+            # ช่วงที่ยังเปิดอยู่และมีข้อมูลใหม่เข้ามาแล้ว -> ทิ้ง
+            _RESPONSE_CACHE.pop(key, None)
+            _RESPONSE_CACHE_BYTES -= entry["size"]
+
+    if closed and RESPONSE_CACHE_DIR:
+        try:
+            with open(_response_cache_disk_path(key), "rb") as fh:
+                blob = json.loads(fh.read().decode("utf-8"))
+            body = blob["body"].encode("utf-8")
+            entry = {"body": body, "etag": blob["etag"], "closed": True, "hwm": None, "size": len(body)}
+            _response_cache_put(key, entry)
+            return entry
+        except (OSError, ValueError, KeyError):
+            pass
+    return None
 
-def _compute_no_cat_realtime(cursor) -> list[dict]:
-    """Realtime mode: compute only no_cat using NOW() as reference time."""
-    alerts = []
 
-    global_cfg = _get_system_config_global(cursor)
-    global_no_cat_hours = int(global_cfg.get("alert_no_cat", 12) or 12)
+def _response_cache_store(key, body: bytes, hwm, closed: bool) -> dict:
+    entry = {
+        "body": body,
+        "etag": hashlib.sha256(body).hexdigest()[:32] if closed else None,
+        "closed": closed,
+        "hwm": None if closed else hwm,
+        "size": len(body),
+    }
+    _response_cache_put(key, entry)
+    if closed and RESPONSE_CACHE_DIR:
+        try:
+            os.makedirs(RESPONSE_CACHE_DIR, exist_ok=True)
+            path = _response_cache_disk_path(key)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as fh:
+                fh.write(json.dumps({"key": repr(key), "etag": entry["etag"], "body": body.decode("utf-8")}).encode("utf-8"))
+            os.replace(tmp, path)
+        except OSError as e:
+            print("⚠️ response cache disk write failed:", e)
+    return entry
+
+
+def _response_cache_response(entry: dict, hit: bool):
+    resp = Response(status=200, mimetype="application/json")
+    resp.headers["X-Cache"] = "HIT" if hit else "MISS"
+    if entry["etag"]:
+        resp.set_etag(entry["etag"])
+        resp.headers["Cache-Control"] = "no-cache"
+        if request.if_none_match.contains(entry["etag"]):
+            resp.status_code = 304
+            return resp
+    resp.set_data(entry["body"])
+    return resp
 
-    cat_prefix = _get_cat_prefix_map(cursor)
 
-    now_dt = datetime.now()
+def _response_cached(period_of):
+    """decorator: period_of(args, hwm) -> (start, end, normalized_params) หรือ None (ไม่ cache)"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not RESPONSE_CACHE_ENABLED or RESPONSE_CACHE_MAX_BYTES <= 0:
+                return fn(*args, **kwargs)
+            try:
+                hwm, cats_fp = _response_cache_state()
+                period = period_of(request.args, hwm)
+            except Exception:
+                period = None
+            if period is None:
+                return fn(*args, **kwargs)
+
+            start, end, norm = period
+            max_dt = hwm[1]
+            closed = bool(max_dt is not None and end <= max_dt)
+            key = (request.path, tuple(sorted(norm.items())), cats_fp)
+
+            entry = _response_cache_get(key, hwm, closed)
+            if entry is not None:
+                return _response_cache_response(entry, hit=True)
+
+            resp = fn(*args, **kwargs)
+            if not isinstance(resp, Response) or resp.status_code != 200 or not resp.is_json:
+                return resp
+            entry = _response_cache_store(key, resp.get_data(), hwm, closed)
+            return _response_cache_response(entry, hit=False)
+        return wrapper
+    return deco
+
+
+def _period_timeline_table(args, hwm):
+    try:
+        day = datetime.strptime(args.get("date") or "", "%Y-%m-%d").date()
+    except ValueError:
+        return None
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1), {"date": day.isoformat()}
 
-    for cat_name, prefix in cat_prefix.items():
-        # per-cat config fallback
-        cursor.execute("SELECT color FROM cats WHERE name=%s LIMIT 1", (cat_name,))
-        crow = cursor.fetchone() or {}
-        cat_color = (crow.get("color") or "").strip()
-        cfg = _get_effective_config(cursor, cat_color)
-        no_cat_hours = int(cfg.get("alert_no_cat", global_no_cat_hours) or global_no_cat_hours)
 
-        last_found = _time_last_found(cursor, prefix)
-        if not last_found:
-            continue
+def _period_statistics(args, hwm):
+    cat = args.get("cat")
+    cats = args.get("cats")
+    if not cat and not cats:
+        return None
+    max_dt = hwm[1]
+    maxy = max_dt.year if max_dt else None
+    period = (args.get("period") or "daily").lower()
+    norm = {"cats": cats} if cats else {"cat": cat}
+    norm["period"] = period
 
-        hours_since = (now_dt - last_found).total_seconds() / 3600.0
-        if hours_since >= no_cat_hours:
+    if period == "range":
+        try:
+            sdt = datetime.strptime(args.get("start_date") or "", "%Y-%m-%d")
+            edt = datetime.strptime(args.get("end_date") or "", "%Y-%m-%d") + timedelta(days=1)
+        except ValueError:
+            return None
+        norm.update({"start_date": sdt.date().isoformat(), "end_date": args.get("end_date")})
+        return sdt, edt, norm
+
+    year = args.get("year") or (str(maxy) if maxy else None)
+    if period == "daily":
+        if not year:
+            return None
+        y, m = int(year), int(args.get("month") or "01")
+        start = datetime(y, m, 1)
+        end = datetime(y + 1, 1, 1) if m == 12 else datetime(y, m + 1, 1)
+        norm.update({"year": y, "month": m})
+        return start, end, norm
+    if period == "monthly":
+        if not year:
+            return None
+        y = int(year)
+        norm["year"] = y
+        return datetime(y, 1, 1), datetime(y + 1, 1, 1), norm
+
+    # yearly: ปีเริ่มต้นถูก clamp ด้วย MIN(year) ในตัว endpoint; ปีสุดท้ายด้วย MAX(year)
+    end_year = args.get("end_year") or args.get("year") or (str(maxy) if maxy else None)
+    if not end_year:
+        return None
+    e_y = int(end_year)
+    if maxy is not None:
+        e_y = min(e_y, maxy)
+    norm.update({"period": "yearly", "start_year": args.get("start_year") or "", "end_year": e_y})
+    return datetime.min, datetime(e_y + 1, 1, 1), norm
+
+
+def _period_room_timeline(args, hwm):
+    cat = args.get("cat")
+    if not cat or hwm[1] is None:
+        return None
+    # ใช้ "วันล่าสุด" เสมอ -> เป็นช่วงเปิด (หมดอายุเมื่อมี slot ใหม่)
+    start = datetime.combine(hwm[1].date(), time.min)
+    return start, start + timedelta(days=1), {"cat": cat, "date": start.date().isoformat()}
+
+
+# =========================================
+# I.0b) HOURLY ROLLUP (timeslot_hourly)
+# =========================================
+# สรุปรายชั่วโมงต่อ prefix (สีแมว) จาก timeslot:
+#   - แถวสรุปชั่วโมง (activity='', room=''): slot_count = จำนวน slot ทั้งหมดในชั่วโมง,
+#     f_count = slot ที่ status='F', last_cam = cam ล่าสุดที่เจอ (status='F')
+#   - แถวพฤติกรรม (activity=eat|excrete, room): transitions (นับแบบเปลี่ยนพฤติกรรม/ห้อง, รีเซ็ตทุกชั่วโมง),
+#     slot_count (ใช้คำนวณเวลา), first_slot (ลำดับที่เจอครั้งแรกในชั่วโมง)
+# อัปเดตจาก watermark ของ timeslot.id: ชั่วโมงที่มีแถวใหม่จะถูกคำนวณใหม่ทั้งชั่วโมง (<= 360 slot)
+# worker เท่านั้นที่อัปเดต (ทีละ HOURLY_ROLLUP_BATCH_ROWS แถว); endpoint อ่านอย่างเดียว — ใช้ rollup เมื่อแถวที่ค้าง
+# (ไม่เกิน HOURLY_ROLLUP_SYNC_ROWS) ไม่อยู่ในวันที่ขอ ไม่งั้นคำนวณจาก timeslot ตรง ๆ แทน
+HOURLY_ROLLUP_ENABLED = os.environ.get("HOURLY_ROLLUP_ENABLED", "1") == "1"
+HOURLY_ROLLUP_BATCH_ROWS = int(os.environ.get("HOURLY_ROLLUP_BATCH_ROWS", "20000") or 20000)
+HOURLY_ROLLUP_SYNC_ROWS = int(os.environ.get("HOURLY_ROLLUP_SYNC_ROWS", "2000") or 2000)
+_HOURLY_ROLLUP_LOCK = Lock()
+_hourly_rollup_table_ready = False
+
+
+def _ensure_hourly_rollup_table(cursor):
+    global _hourly_rollup_table_ready
+    if _hourly_rollup_table_ready:
+        return
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS timeslot_hourly (
+          hour_start DATETIME NOT NULL,
+          cat_prefix VARCHAR(32) NOT NULL,
+          activity VARCHAR(16) NOT NULL DEFAULT '',
+          room VARCHAR(32) NOT NULL DEFAULT '',
+          slot_count INT NOT NULL DEFAULT 0,
+          f_count INT NOT NULL DEFAULT 0,
+          transitions INT NOT NULL DEFAULT 0,
+          first_slot DATETIME NULL,
+          last_cam VARCHAR(8) NULL,
+          PRIMARY KEY (hour_start, cat_prefix, activity, room),
+          KEY idx_timeslot_hourly_prefix (cat_prefix, hour_start)
+        )
+        """
+    )
+    _hourly_rollup_table_ready = True
+
+
+def _hourly_rollup_prefixes(cursor) -> list:
+    """prefix ของแมวทุกตัว (ไม่สน display_status) ที่มีคอลัมน์ครบใน timeslot"""
+    cursor.execute("SELECT name, color FROM cats")
+    cols = _get_timeslot_columns(cursor)
+    out = set()
+    for r in cursor.fetchall() or []:
+        prefix = _normalize_prefix(r.get("color") or r.get("name"))
+        if prefix and _safe_identifier(prefix) and all(
+            c in cols for c in (prefix, f"{prefix}_cam", f"{prefix}_ac")
+        ):
+            out.add(prefix)
+    return sorted(out)
+
+
+def _summarize_hours(rows, prefixes) -> dict:
+    """rows (เรียง date_slot ASC) -> {(hour_start, prefix): {"slot_count","f_count","last_cam","acts"}}
+    acts = {(act, room): [transitions, slot_count, first_slot]} — กติกาเดียวกับ /api/timeline_table
+    """
+    out = {}
+    last_key = {}
+    room_of = {}
+    cur_hour = None
+    for r in rows:
+        dt = r.get("date_slot")
+        if not dt:
+            continue
+        hour = dt.replace(minute=0, second=0, microsecond=0)
+        if hour != cur_hour:
+            cur_hour = hour
+            last_key = {}
+        for p in prefixes:
+            st = out.get((hour, p))
+            if st is None:
+                st = out[(hour, p)] = {"slot_count": 0, "f_count": 0, "last_cam": None, "acts": {}}
+            st["slot_count"] += 1
+
+            status = r.get(p)
+            if not status or str(status).upper() != "F":
+                continue
+            st["f_count"] += 1
+
+            cam = r.get(f"{p}_cam")
+            if cam:
+                st["last_cam"] = str(cam).strip()
+
+            act_raw = r.get(f"{p}_ac")
+            act = str(act_raw).strip().lower() if act_raw is not None else ""
+            if act not in ("eat", "excrete"):
+                last_key[p] = None
+                continue
+
+            room = room_of.get(cam)
+            if room is None:
+                room = (CAM_CODE_TO_ROOM.get(str(cam).strip(), "") if cam else "") or "-"
+                room_of[cam] = room
+
+            key = (act, room)
+            a = st["acts"].get(key)
+            if a is None:
+                a = st["acts"][key] = [0, 0, dt]
+            a[1] += 1
+            if key != last_key.get(p):
+                a[0] += 1
+                last_key[p] = key
+    return out
+
+
+def _rebuild_hourly_rollup(cursor, hours, prefixes):
+    """คำนวณชั่วโมงที่ระบุใหม่จาก timeslot (query ละ 1 วัน) แล้วแทนที่แถวเดิม"""
+    by_day = {}
+    for h in hours:
+        by_day.setdefault(h.date(), []).append(h)
+
+    select_cols = ", ".join(f"`{p}`, `{p}_cam`, `{p}_ac`" for p in prefixes)
+    prefix_ph = ",".join(["%s"] * len(prefixes))
+    for day in sorted(by_day):
+        day_hours = sorted(by_day[day])
+        cursor.execute(
+            f"""
+            SELECT date_slot, {select_cols}
+            FROM timeslot
+            WHERE date_slot >= %s AND date_slot < %s
+            ORDER BY date_slot ASC
+            """,
+            (day_hours[0], day_hours[-1] + timedelta(hours=1)),
+        )
+        wanted = set(day_hours)
+        summary = _summarize_hours(cursor.fetchall() or [], prefixes)
+
+        hour_ph = ",".join(["%s"] * len(day_hours))
+        cursor.execute(
+            f"DELETE FROM timeslot_hourly WHERE hour_start IN ({hour_ph}) AND cat_prefix IN ({prefix_ph})",
+            tuple(day_hours) + tuple(prefixes),
+        )
+
+        values = []
+        for (hour, p), st in summary.items():
+            if hour not in wanted:
+                continue
+            values.append((hour, p, "", "", st["slot_count"], st["f_count"], 0, None, st["last_cam"]))
+            for (act, room), (trans, cnt, first) in st["acts"].items():
+                values.append((hour, p, act, room, cnt, cnt, trans, first, None))
+        if values:
+            cursor.executemany(
+                """
+                INSERT INTO timeslot_hourly
+                  (hour_start, cat_prefix, activity, room, slot_count, f_count, transitions, first_slot, last_cam)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                values,
+            )
+
+
+def _hourly_rollup_catch_up(cursor, max_rows: int) -> bool:
+    """อัปเดต rollup จาก timeslot.id ที่ยังไม่ได้ประมวลผล ทีละไม่เกิน max_rows แถว คืน True ถ้าตามทันแล้ว
+
+    เรียกจาก worker เท่านั้น (GET ใช้ _derived_ready แบบอ่านอย่างเดียว) — caller ต้อง commit เอง
+    watermark อ่านแบบ FOR UPDATE บน cursor ของ caller: อีก process ที่ catch-up พร้อมกันจะรอจน commit
+    """
+    if not HOURLY_ROLLUP_ENABLED:
+        return False
+    with _HOURLY_ROLLUP_LOCK:
+        _ensure_hourly_rollup_table(cursor)
+        prefixes = _hourly_rollup_prefixes(cursor)
+        if not prefixes:
+            return False
+
+        # เพิ่ม/เปลี่ยนสีแมว -> สร้างใหม่ทั้งหมด
+        prefixes_key = ",".join(prefixes)
+        if _state_get_tx(cursor, "hourly_rollup_prefixes", "", for_update=True) != prefixes_key:
+            # เดือนที่ archive ไปแล้วสร้างใหม่จาก timeslot ไม่ได้ -> เก็บ rollup เดิมไว้
+            archived_before = _timeslot_archived_before()
+            if archived_before:
+                cursor.execute("DELETE FROM timeslot_hourly WHERE hour_start >= %s", (archived_before,))
+            else:
+                cursor.execute("DELETE FROM timeslot_hourly")
+            _state_set_tx(cursor, "hourly_rollup_last_id", "0")
+            _state_set_tx(cursor, "hourly_rollup_prefixes", prefixes_key)
+            last_id = 0
+        else:
+            last_id = int(_state_get_tx(cursor, "hourly_rollup_last_id", "0", for_update=True) or 0)
+        cursor.execute(
+            "SELECT id, date_slot FROM timeslot WHERE id > %s ORDER BY id ASC LIMIT %s",
+            (last_id, int(max_rows) + 1),
+        )
+        pending = cursor.fetchall() or []
+        if not pending:
+            return True
+        if len(pending) > max_rows:
+            pending = pending[:max_rows]
+
+        hours = {
+            r["date_slot"].replace(minute=0, second=0, microsecond=0)
+            for r in pending
+            if r.get("date_slot")
+        }
+        if hours:
+            _rebuild_hourly_rollup(cursor, hours, prefixes)
+        _state_set_tx(cursor, "hourly_rollup_last_id", str(int(pending[-1]["id"])))
+        return len(pending) < max_rows
+
+
+def _hourly_rollup_rows(cursor, prefixes, start: datetime, end: datetime):
+    """แถว rollup ในช่วง [start, end) เรียงตามชั่วโมงและลำดับที่เจอครั้งแรก (ใช้กับ day/week/month views)"""
+    if not prefixes:
+        return []
+    prefix_ph = ",".join(["%s"] * len(prefixes))
+    cursor.execute(
+        f"""
+        SELECT hour_start, cat_prefix, activity, room, slot_count, f_count, transitions, first_slot, last_cam
+        FROM timeslot_hourly
+        WHERE hour_start >= %s AND hour_start < %s AND cat_prefix IN ({prefix_ph})
+        ORDER BY hour_start ASC, first_slot ASC
+        """,
+        (start, end) + tuple(prefixes),
+    )
+    return cursor.fetchall() or []
+
+
+# =========================================
+# I.0c) RUN-LENGTH SEGMENTS (timeslot_segments)
+# =========================================
+# ช่วงต่อเนื่องของ slot ที่ (status, cam, activity) เหมือนกัน ต่อ prefix:
+#   (start_slot, end_slot, slot_count, status, cam, activity)
+# ตัดช่วงเมื่อค่าเปลี่ยน, ข้ามวัน, หรือ slot ห่างกันเกิน SEGMENT_MAX_GAP_SECONDS (ข้อมูลหาย)
+# อัปเดตจาก watermark ของ timeslot.id: สำหรับแต่ละวันที่มีแถวใหม่ จะลบ segment ตั้งแต่ segment สุดท้าย
+# ที่เริ่มก่อนแถวใหม่ (ตัวที่อาจถูกต่อความยาว) แล้วสร้างใหม่จาก timeslot เฉพาะส่วนนั้น
+# _count_activity_transitions ใช้กับ segment ได้ตรง ๆ (ค่าคงที่ภายใน segment)
+SEGMENTS_ENABLED = os.environ.get("SEGMENTS_ENABLED", "1") == "1"
+SEGMENT_MAX_GAP_SECONDS = int(os.environ.get("SEGMENT_MAX_GAP_SECONDS", str(TIMESLOT_SECONDS)) or TIMESLOT_SECONDS)
+SEGMENTS_BATCH_ROWS = int(os.environ.get("SEGMENTS_BATCH_ROWS", "20000") or 20000)
+SEGMENTS_SYNC_ROWS = int(os.environ.get("SEGMENTS_SYNC_ROWS", "2000") or 2000)
+_SEGMENTS_LOCK = Lock()
+_segments_table_ready = False
+
+
+def _ensure_segments_table(cursor):
+    global _segments_table_ready
+    if _segments_table_ready:
+        return
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS timeslot_segments (
+          id BIGINT AUTO_INCREMENT PRIMARY KEY,
+          cat_prefix VARCHAR(32) NOT NULL,
+          start_slot DATETIME NOT NULL,
+          end_slot DATETIME NOT NULL,
+          slot_count INT NOT NULL,
+          status VARCHAR(8) NULL,
+          cam VARCHAR(8) NULL,
+          activity VARCHAR(16) NULL,
+          KEY idx_segments_prefix_start (cat_prefix, start_slot)
+        )
+        """
+    )
+    _segments_table_ready = True
+
+
+def _segments_from_rows(rows, prefixes, resume=None) -> dict:
+    """rows (เรียง date_slot ASC, dict ที่มี date_slot/<p>/<p>_cam/<p>_ac) -> {prefix: [[start, end, n, status, cam, act], ...]}
+    resume: {prefix: datetime} ข้ามแถวที่เก่ากว่าจุดเริ่มของ prefix นั้น
+    """
+    out = {p: [] for p in prefixes}
+    gap = timedelta(seconds=SEGMENT_MAX_GAP_SECONDS)
+    for r in rows:
+        dt = r.get("date_slot")
+        if not dt:
+            continue
+        for p in prefixes:
+            if resume and dt < resume.get(p, dt):
+                continue
+            val = (r.get(p), r.get(f"{p}_cam"), r.get(f"{p}_ac"))
+            segs = out[p]
+            last = segs[-1] if segs else None
+            if (
+                last is not None
+                and (last[3], last[4], last[5]) == val
+                and last[1].date() == dt.date()
+                and dt - last[1] <= gap
+            ):
+                last[1] = dt
+                last[2] += 1
+            else:
+                segs.append([dt, dt, 1, val[0], val[1], val[2]])
+    return out
+
+
+def _rebuild_segments_for_day(cursor, day: date, min_new: datetime, prefixes):
+    day_start = datetime.combine(day, time.min)
+    day_end = day_start + timedelta(days=1)
+    prefix_ph = ",".join(["%s"] * len(prefixes))
+
+    # จุดเริ่มของแต่ละ prefix = segment สุดท้ายที่เริ่มก่อนแถวใหม่ (อาจถูกต่อ) หรือต้นวัน
+    cursor.execute(
+        f"""
+        SELECT cat_prefix, MAX(start_slot) AS s
+        FROM timeslot_segments
+        WHERE cat_prefix IN ({prefix_ph}) AND start_slot >= %s AND start_slot < %s
+        GROUP BY cat_prefix
+        """,
+        tuple(prefixes) + (day_start, min_new),
+    )
+    resume = {p: day_start for p in prefixes}
+    for r in cursor.fetchall() or []:
+        if r.get("s"):
+            resume[r["cat_prefix"]] = r["s"]
+
+    for p in prefixes:
+        cursor.execute(
+            "DELETE FROM timeslot_segments WHERE cat_prefix=%s AND start_slot >= %s AND start_slot < %s",
+            (p, resume[p], day_end),
+        )
+
+    select_cols = ", ".join(f"`{p}`, `{p}_cam`, `{p}_ac`" for p in prefixes)
+    cursor.execute(
+        f"""
+        SELECT date_slot, {select_cols}
+        FROM timeslot
+        WHERE date_slot >= %s AND date_slot < %s
+        ORDER BY date_slot ASC
+        """,
+        (min(resume.values()), day_end),
+    )
+    built = _segments_from_rows(cursor.fetchall() or [], prefixes, resume=resume)
+
+    values = [
+        (p, seg[0], seg[1], seg[2], seg[3], seg[4], seg[5])
+        for p, segs in built.items()
+        for seg in segs
+    ]
+    if values:
+        cursor.executemany(
+            """
+            INSERT INTO timeslot_segments (cat_prefix, start_slot, end_slot, slot_count, status, cam, activity)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """,
+            values,
+        )
+
+
+def _segments_catch_up(cursor, max_rows: int) -> bool:
+    """เหมือน _hourly_rollup_catch_up แต่สำหรับ timeslot_segments (caller ต้อง commit)"""
+    if not SEGMENTS_ENABLED:
+        return False
+    with _SEGMENTS_LOCK:
+        _ensure_segments_table(cursor)
+        prefixes = _hourly_rollup_prefixes(cursor)
+        if not prefixes:
+            return False
+
+        prefixes_key = ",".join(prefixes)
+        if _state_get_tx(cursor, "segments_prefixes", "", for_update=True) != prefixes_key:
+            archived_before = _timeslot_archived_before()
+            if archived_before:
+                cursor.execute("DELETE FROM timeslot_segments WHERE start_slot >= %s", (archived_before,))
+            else:
+                cursor.execute("DELETE FROM timeslot_segments")
+            _state_set_tx(cursor, "segments_last_id", "0")
+            _state_set_tx(cursor, "segments_prefixes", prefixes_key)
+            last_id = 0
+        else:
+            last_id = int(_state_get_tx(cursor, "segments_last_id", "0", for_update=True) or 0)
+
+        cursor.execute(
+            "SELECT id, date_slot FROM timeslot WHERE id > %s ORDER BY id ASC LIMIT %s",
+            (last_id, int(max_rows) + 1),
+        )
+        pending = cursor.fetchall() or []
+        if not pending:
+            return True
+        if len(pending) > max_rows:
+            pending = pending[:max_rows]
+
+        min_new = {}
+        for r in pending:
+            dt = r.get("date_slot")
+            if dt:
+                d = dt.date()
+                if d not in min_new or dt < min_new[d]:
+                    min_new[d] = dt
+        for d in sorted(min_new):
+            _rebuild_segments_for_day(cursor, d, min_new[d], prefixes)
+        _state_set_tx(cursor, "segments_last_id", str(int(pending[-1]["id"])))
+        return len(pending) < max_rows
+
+
+def _fetch_segments_for_cat(cursor, prefix: str, start_dt: datetime, end_dt: datetime):
+    """segment ของแมวตัวเดียวในช่วง [start_dt, end_dt) เป็น dict แบบเดียวกับ _fetch_timeslots_for_cat
+    (date_slot = จุดเริ่ม segment) + end_slot, slot_count
+    """
+    cursor.execute(
+        """
+        SELECT start_slot AS date_slot, end_slot, slot_count, status, cam, activity
+        FROM timeslot_segments
+        WHERE cat_prefix=%s AND start_slot >= %s AND start_slot < %s
+        ORDER BY start_slot ASC, id ASC
+        """,
+        (prefix, start_dt, end_dt),
+    )
+    return cursor.fetchall() or []
+
+
+def _derived_ready(cursor, name: str, prefixes, start: datetime, end: datetime, max_rows: int) -> bool:
+    """อ่านอย่างเดียว: True ถ้า table สรุป name ("hourly_rollup"/"segments") ใช้ตอบช่วง [start, end) ได้
+    - สร้างตาม prefix ปัจจุบันแล้วและมีทุก prefix ที่ต้องการ
+    - แถวที่ worker ยังไม่ประมวลผล (ไม่เกิน max_rows) ไม่อยู่ในวันของช่วงนั้น
+      (segment ของวันถูก rebuild ตั้งแต่ slot ใหม่ที่เก่าสุด -> นับตั้งแต่ต้นวันของ start)
+    GET handler ไม่ catch-up เอง (ให้ worker ทำ) — ไม่พร้อมก็ใช้ raw path"""
+    try:
+        current = _hourly_rollup_prefixes(cursor)
+        if not current or not set(prefixes).issubset(current):
+            return False
+        if _state_get_tx(cursor, f"{name}_prefixes", "") != ",".join(current):
+            return False
+        last_id = int(_state_get_tx(cursor, f"{name}_last_id", "0") or 0)
+        cursor.execute(
+            "SELECT date_slot FROM timeslot WHERE id > %s ORDER BY id ASC LIMIT %s",
+            (last_id, int(max_rows) + 1),
+        )
+        pending = cursor.fetchall() or []
+    except (mysql.connector.Error, ValueError):
+        return False
+    if len(pending) > max_rows:
+        return False
+    lo = datetime.combine(start.date(), time.min)
+    return not any(r.get("date_slot") and lo <= r["date_slot"] < end for r in pending)
+
+
+@app.route("/api/segments", methods=["GET"])
+def api_segments():
+    """ช่วงต่อเนื่อง (run-length) ของ status/cam/activity ของแมว 1 ตัว
+
+    Query params:
+      cat: ชื่อแมว (จำเป็น)
+      date=YYYY-MM-DD หรือ start_date/end_date (YYYY-MM-DD, รวม end_date) — default วันล่าสุดที่มีข้อมูล
+    Response:
+      { "cat": "...", "start": "...", "end": "...", "source": "table|timeslot",
+        "segments": [ {"start","end","slots","status","cam","room","activity"}, ... ] }
+    """
+    cat = (request.args.get("cat") or "").strip()
+    if not cat:
+        return jsonify({"message": "cat required"}), 400
+
+    date_str = request.args.get("date")
+    start_date = request.args.get("start_date")
+    end_date = request.args.get("end_date")
+
+    connection = mysql.connector.connect(**db_config)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        try:
+            if date_str:
+                start_dt = datetime.strptime(date_str, "%Y-%m-%d")
+                end_dt = start_dt + timedelta(days=1)
+            elif start_date and end_date:
+                start_dt = datetime.strptime(start_date, "%Y-%m-%d")
+                end_dt = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+            else:
+                latest = _latest_date_in_timeslot(cursor)
+                if not latest:
+                    return jsonify({"cat": cat, "start": None, "end": None, "segments": []})
+                start_dt = datetime.combine(latest, time.min)
+                end_dt = start_dt + timedelta(days=1)
+        except ValueError:
+            return jsonify({"message": "dates must be YYYY-MM-DD"}), 400
+        if end_dt - start_dt > timedelta(days=31):
+            return jsonify({"message": "range too large (max 31 days)"}), 400
+
+        cursor.execute("SELECT color FROM cats WHERE name=%s LIMIT 1", (cat,))
+        crow = cursor.fetchone()
+        if not crow:
+            return jsonify({"message": f"cat not found: {cat}"}), 404
+        prefix = _normalize_prefix(crow.get("color") or cat)
+
+        if _derived_ready(cursor, "segments", [prefix], start_dt, end_dt, SEGMENTS_SYNC_ROWS):
+            segs = _fetch_segments_for_cat(cursor, prefix, start_dt, end_dt)
+            source = "table"
+        else:
+            # ยังไม่ backfill เสร็จ -> สร้างจาก timeslot ตรง ๆ
+            cols = _get_timeslot_columns(cursor)
+            if not {prefix, f"{prefix}_cam", f"{prefix}_ac"}.issubset(cols):
+                return jsonify({"message": "timeslot columns not found for this cat color"}), 400
+            cursor.execute(
+                f"""
+                SELECT date_slot, `{prefix}`, `{prefix}_cam`, `{prefix}_ac`
+                FROM {_timeslot_source(cursor, start_dt, end_dt)}
+                WHERE date_slot >= %s AND date_slot < %s
+                ORDER BY date_slot ASC
+                """,
+                (start_dt, end_dt),
+            )
+            built = _segments_from_rows(cursor.fetchall() or [], [prefix])[prefix]
+            segs = [
+                {"date_slot": g[0], "end_slot": g[1], "slot_count": g[2], "status": g[3], "cam": g[4], "activity": g[5]}
+                for g in built
+            ]
+            source = "timeslot"
+
+        out = []
+        for g in segs:
+            cam = g.get("cam")
+            out.append({
+                "start": g["date_slot"].strftime("%Y-%m-%d %H:%M:%S"),
+                "end": g["end_slot"].strftime("%Y-%m-%d %H:%M:%S"),
+                "slots": int(g.get("slot_count") or 0),
+                "status": g.get("status"),
+                "cam": cam,
+                "room": CAM_CODE_TO_ROOM.get(str(cam).strip().upper()) if cam else None,
+                "activity": g.get("activity"),
+            })
+
+        return jsonify({
+            "cat": cat,
+            "start": start_dt.strftime("%Y-%m-%d %H:%M:%S"),
+            "end": end_dt.strftime("%Y-%m-%d %H:%M:%S"),
+            "source": source,
+            "segments": out,
+        })
+    finally:
+        cursor.close()
+        connection.close()
+
+
+# =========================================
+# I.0c2) DAY COVERAGE (timeslot_coverage)
+# =========================================
+# 1 แถวต่อวัน: จำนวน slot (ไม่นับซ้ำ), slot แรก/สุดท้าย, จำนวนช่วงที่ขาด (gap) และจำนวน slot ที่หายในช่วงนั้น
+#   gap_count/missing_slots ในตารางนับเฉพาะช่วงระหว่าง first_slot..last_slot; ช่วงต้นวัน/ท้ายวัน
+#   คำนวณตอนอ่านจาก first/last (_day_edge_gaps) เพราะท้ายวันของ "วันนี้" ยังเปลี่ยนตามเวลา
+# อัปเดตจาก watermark ของ timeslot.id แบบเดียวกับ rollup (worker + ingest) — วันที่มีแถวใหม่คำนวณใหม่ทั้งวัน
+# ใช้แทนการ scan timeslot ใน: เช็คเดือนครบ, catalog (วันล่าสุด/ปีที่มีข้อมูล), /api/admin/data_gaps
+# วันที่ถูก archive (ดู I.0d) ยังคงอยู่ในตารางนี้ เป็นประวัติว่าเคยมีข้อมูล (catalog ข้ามวันเหล่านั้น)
+COVERAGE_ENABLED = os.environ.get("COVERAGE_ENABLED", "1") == "1"
+COVERAGE_BATCH_ROWS = int(os.environ.get("COVERAGE_BATCH_ROWS", "20000") or 20000)
+SLOTS_PER_DAY = 86400 // TIMESLOT_SECONDS
+_COVERAGE_LOCK = Lock()
+_coverage_table_ready = False
+
+
+def _ensure_coverage_table(cursor):
+    global _coverage_table_ready
+    if _coverage_table_ready:
+        return
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS timeslot_coverage (
+          day DATE NOT NULL PRIMARY KEY,
+          slot_count INT NOT NULL,
+          first_slot DATETIME NOT NULL,
+          last_slot DATETIME NOT NULL,
+          gap_count INT NOT NULL,
+          missing_slots INT NOT NULL,
+          updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        )
+        """
+    )
+    _coverage_table_ready = True
+
+
+def _day_gaps(slots):
+    """slots (datetime ไม่ซ้ำ เรียง ASC) -> [(gap_start, gap_end, missing_slots)] ของช่วงที่ขาดระหว่าง slot"""
+    out = []
+    step = timedelta(seconds=TIMESLOT_SECONDS)
+    for prev, cur in zip(slots, slots[1:]):
+        if cur - prev > step:
+            out.append((prev + step, cur - step, int((cur - prev).total_seconds()) // TIMESLOT_SECONDS - 1))
+    return out
+
+
+def _day_edge_gaps(day: date, first: datetime, last: datetime, now: datetime):
+    """ช่วงที่ขาดตอนต้นวัน (00:00 .. ก่อน first) และท้ายวัน (หลัง last .. slot สุดท้ายที่ควรมี)
+    วันนี้: slot สุดท้ายที่ควรมี = slot ก่อน slot ปัจจุบัน (slot ปัจจุบันอาจยังเขียนไม่เสร็จ)"""
+    step = timedelta(seconds=TIMESLOT_SECONDS)
+    day_start = datetime.combine(day, time.min)
+    if day >= now.date():
+        elapsed = int((now - day_start).total_seconds()) // TIMESLOT_SECONDS
+        tail_end = day_start + step * (elapsed - 1)
+    else:
+        tail_end = day_start + timedelta(days=1) - step
+    out = []
+    if first > day_start:
+        out.append((day_start, first - step, int((first - day_start).total_seconds()) // TIMESLOT_SECONDS))
+    if last < tail_end:
+        out.append((last + step, tail_end, int((tail_end - last).total_seconds()) // TIMESLOT_SECONDS))
+    return out
+
+
+def _day_slots(cursor, day: date) -> list:
+    day_start = datetime.combine(day, time.min)
+    cursor.execute(
+        f"SELECT DISTINCT date_slot FROM {_timeslot_source(cursor, day_start, day_start + timedelta(days=1))} WHERE date_slot >= %s AND date_slot < %s ORDER BY date_slot ASC",
+        (day_start, day_start + timedelta(days=1)),
+    )
+    return [r["date_slot"] for r in cursor.fetchall() or [] if r.get("date_slot")]
+
+
+def _rebuild_coverage_days(cursor, days):
+    """คำนวณ coverage ของวันที่ระบุใหม่จาก timeslot (index-only scan ของ date_slot วันละครั้ง)"""
+    for day in sorted(days):
+        slots = _day_slots(cursor, day)
+        if not slots:
+            cursor.execute("DELETE FROM timeslot_coverage WHERE day=%s", (day,))
+            continue
+        gaps = _day_gaps(slots)
+        cursor.execute(
+            """
+            INSERT INTO timeslot_coverage (day, slot_count, first_slot, last_slot, gap_count, missing_slots)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE slot_count=VALUES(slot_count), first_slot=VALUES(first_slot),
+              last_slot=VALUES(last_slot), gap_count=VALUES(gap_count), missing_slots=VALUES(missing_slots)
+            """,
+            (day, len(slots), slots[0], slots[-1], len(gaps), sum(g[2] for g in gaps)),
+        )
+
+
+def _coverage_catch_up(cursor, max_rows: int) -> bool:
+    """เหมือน _hourly_rollup_catch_up แต่สำหรับ timeslot_coverage (caller ต้อง commit)"""
+    if not COVERAGE_ENABLED:
+        return False
+    with _COVERAGE_LOCK:
+        _ensure_coverage_table(cursor)
+        last_id = int(_state_get_tx(cursor, "coverage_last_id", "0", for_update=True) or 0)
+        cursor.execute(
+            "SELECT id, date_slot FROM timeslot WHERE id > %s ORDER BY id ASC LIMIT %s",
+            (last_id, int(max_rows) + 1),
+        )
+        pending = cursor.fetchall() or []
+        if not pending:
+            return True
+        if len(pending) > max_rows:
+            pending = pending[:max_rows]
+
+        days = {r["date_slot"].date() for r in pending if r.get("date_slot")}
+        if days:
+            _rebuild_coverage_days(cursor, days)
+        _state_set_tx(cursor, "coverage_last_id", str(int(pending[-1]["id"])))
+        return len(pending) < max_rows
+
+
+def _coverage_watermark(cursor) -> int:
+    """timeslot.id ล่าสุดที่ coverage ประมวลผลแล้ว (0 = ยังไม่เคยสร้าง -> caller ใช้ทางเดิม)
+    อ่านบน cursor ของ caller (เรียกทุก /api/alerts ผ่าน _maybe_monthly_rollup — ห้ามเปิด connection ใหม่)"""
+    if not COVERAGE_ENABLED:
+        return 0
+    try:
+        cursor.execute("SELECT v FROM notification_state WHERE k='coverage_last_id' LIMIT 1")
+        return int((cursor.fetchone() or {}).get("v") or 0)
+    except (mysql.connector.Error, ValueError):
+        return 0
+
+
+def _coverage_days_in_range(cursor, start_day: date, end_day: date):
+    """set ของวันใน [start_day, end_day) ที่มีข้อมูล: coverage + แถวที่ยังไม่ถูกประมวลผล (หลัง watermark)
+    คืน None ถ้า coverage ยังไม่พร้อม"""
+    wm = _coverage_watermark(cursor)
+    if wm <= 0:
+        return None
+    try:
+        cursor.execute(
+            "SELECT day FROM timeslot_coverage WHERE day >= %s AND day < %s",
+            (start_day, end_day),
+        )
+        days = {r["day"] for r in cursor.fetchall() or []}
+        cursor.execute(
+            """
+            SELECT DISTINCT DATE(date_slot) AS d FROM timeslot
+            WHERE id > %s AND date_slot >= %s AND date_slot < %s
+            """,
+            (wm, datetime.combine(start_day, time.min), datetime.combine(end_day, time.min)),
+        )
+        days.update(r["d"] for r in cursor.fetchall() or [] if r.get("d"))
+        return days
+    except mysql.connector.Error:
+        return None
+
+
+def _coverage_catalog_days(cursor):
+    """(watermark, {day: (slot_count, first, last)}) จาก timeslot_coverage สำหรับสร้าง catalog; None ถ้ายังไม่พร้อม"""
+    wm = _coverage_watermark(cursor)
+    if wm <= 0:
+        return None
+    # coverage เก็บวันที่ archive ไปแล้วด้วย แต่ catalog อธิบายเฉพาะข้อมูลใน timeslot สด
+    # (วันล่าสุด/raw lookup ต้องไม่ชี้ไปวันที่ไม่มีแถวแล้ว — ปี/bounds ที่รวมวัน archive ใช้ _data_catalog)
+    archived_before = _timeslot_archived_before()
+    try:
+        if archived_before:
+            cursor.execute(
+                "SELECT day, slot_count, first_slot, last_slot FROM timeslot_coverage WHERE day >= %s",
+                (archived_before.date(),),
+            )
+        else:
+            cursor.execute("SELECT day, slot_count, first_slot, last_slot FROM timeslot_coverage")
+        rows = cursor.fetchall() or []
+    except mysql.connector.Error:
+        return None
+    return wm, {r["day"]: (int(r["slot_count"] or 0), r["first_slot"], r["last_slot"]) for r in rows}
+
+
+# วันที่ archive ไปแล้ว (จาก timeslot_coverage ซึ่งไม่ถูกลบตอน archive) — ใช้กับปี/bounds เท่านั้น
+# เปลี่ยนเฉพาะตอน job archive เลื่อนขอบ -> cache ตามค่า archived_before
+_ARCHIVED_COVERAGE = {"before": None, "days": {}}
+
+
+def _archived_coverage_days(cursor) -> dict:
+    """{day: (slot_count, first, last)} ของวันก่อน _timeslot_archived_before() ({} ถ้าไม่เคย archive/ไม่มี coverage)"""
+    before = _timeslot_archived_before()
+    if before is None or not COVERAGE_ENABLED:
+        return {}
+    cached = _ARCHIVED_COVERAGE
+    if cached["before"] == before:
+        return cached["days"]
+    try:
+        cursor.execute(
+            "SELECT day, slot_count, first_slot, last_slot FROM timeslot_coverage WHERE day < %s",
+            (before.date(),),
+        )
+        rows = cursor.fetchall() or []
+    except mysql.connector.Error:
+        return {}
+    days = {r["day"]: (int(r["slot_count"] or 0), r["first_slot"], r["last_slot"]) for r in rows}
+    _ARCHIVED_COVERAGE.update({"before": before, "days": days})
+    return days
+
+
+def _data_catalog(cursor) -> dict:
+    """catalog ของ 'วันที่มีข้อมูล' ทั้งหมด (timeslot สด + วันที่ archive แล้ว) สำหรับปี/bounds/ช่วงสถิติ
+    ส่วนวันล่าสุดและ raw lookup ให้ใช้ _timeslot_catalog (เฉพาะ timeslot สด)"""
+    snap = _timeslot_catalog(cursor)
+    archived = _archived_coverage_days(cursor)
+    if not archived:
+        return snap
+    days = dict(archived)
+    days.update(snap["days"])
+    return _catalog_snapshot(snap["last_id"], days)
+
+
+@app.route("/api/admin/data_gaps", methods=["GET"])
+def admin_data_gaps():
+    """ภาพรวมความครบของข้อมูล timeslot รายวัน (จาก timeslot_coverage)
+
+    Query:
+      start, end: YYYY-MM-DD (รวม end) — default 30 วันล่าสุดที่มีข้อมูล
+      day: YYYY-MM-DD -> รายการช่วงที่ขาดของวันนั้น (คำนวณจาก timeslot)
+    Response:
+      { "days": [{day, slot_count, expected, coverage, first_slot, last_slot, gap_count, missing_slots}],
+        "missing_days": ["YYYY-MM-DD", ...] }
+      หรือ (day=...) { "day", "slot_count", "gaps": [{start, end, slots}] }
+    """
+    err = _require_admin()
+    if err:
+        return err
+
+    def fmt_dt(v):
+        return v.strftime("%Y-%m-%d %H:%M:%S") if v else None
+
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+    try:
+        day_str = (request.args.get("day") or "").strip()
+        if day_str:
+            try:
+                day = datetime.strptime(day_str, "%Y-%m-%d").date()
+            except ValueError:
+                return jsonify({"ok": False, "message": "day must be YYYY-MM-DD"}), 400
+            slots = _day_slots(cur, day)
+            # ช่วงระหว่าง slot + ช่วงต้นวัน/ท้ายวัน (นับแบบเดียวกับ gap_count ในภาพรวม)
+            gaps = []
+            if slots:
+                gaps = sorted(_day_gaps(slots) + _day_edge_gaps(day, slots[0], slots[-1], datetime.now()))
+            return jsonify({
+                "ok": True,
+                "day": day.strftime("%Y-%m-%d"),
+                "slot_count": len(slots),
+                "gaps": [{"start": fmt_dt(a), "end": fmt_dt(b), "slots": n} for a, b, n in gaps],
+            })
+
+        if _coverage_watermark(cur) <= 0:
+            return jsonify({"ok": False, "message": "coverage not built yet (worker catching up)"}), 503
+
+        try:
+            end_day = datetime.strptime(request.args["end"], "%Y-%m-%d").date() if request.args.get("end") else None
+            start_day = datetime.strptime(request.args["start"], "%Y-%m-%d").date() if request.args.get("start") else None
+        except ValueError:
+            return jsonify({"ok": False, "message": "start/end must be YYYY-MM-DD"}), 400
+        if end_day is None:
+            cur.execute("SELECT MAX(day) AS d FROM timeslot_coverage")
+            end_day = (cur.fetchone() or {}).get("d") or date.today()
+        if start_day is None:
+            start_day = end_day - timedelta(days=29)
+        if start_day > end_day:
+            return jsonify({"ok": False, "message": "start must be <= end"}), 400
+
+        cur.execute(
+            """
+            SELECT day, slot_count, first_slot, last_slot, gap_count, missing_slots
+            FROM timeslot_coverage
+            WHERE day >= %s AND day <= %s
+            ORDER BY day ASC
+            """,
+            (start_day, end_day),
+        )
+        rows = cur.fetchall() or []
+        today = date.today()
+        now = datetime.now()
+        out = []
+        for r in rows:
+            if r["day"] == today:
+                expected = int((now - datetime.combine(today, time.min)).total_seconds()) // TIMESLOT_SECONDS + 1
+            else:
+                expected = SLOTS_PER_DAY
+            edge = _day_edge_gaps(r["day"], r["first_slot"], r["last_slot"], now)
+            out.append({
+                "day": r["day"].strftime("%Y-%m-%d"),
+                "slot_count": int(r["slot_count"]),
+                "expected": expected,
+                "coverage": round(min(1.0, int(r["slot_count"]) / expected), 4) if expected else None,
+                "first_slot": fmt_dt(r["first_slot"]),
+                "last_slot": fmt_dt(r["last_slot"]),
+                "gap_count": int(r["gap_count"]) + len(edge),
+                "missing_slots": int(r["missing_slots"]) + sum(g[2] for g in edge),
+            })
+        have = {r["day"] for r in rows}
+        missing = []
+        d = start_day
+        while d <= min(end_day, today):
+            if d not in have:
+                missing.append(d.strftime("%Y-%m-%d"))
+            d += timedelta(days=1)
+        return jsonify({
+            "ok": True,
+            "start": start_day.strftime("%Y-%m-%d"),
+            "end": end_day.strftime("%Y-%m-%d"),
+            "days": out,
+            "missing_days": missing,
+        })
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+# =========================================
+# I.0d) MONTHLY PARTITIONS + COLD ARCHIVE (timeslot)
+# =========================================
+# timeslot แบ่ง partition รายเดือนด้วย RANGE COLUMNS(date_slot): p202601 = [2026-01-01, 2026-02-01) + pmax
+#   - MySQL บังคับให้ทุก unique key มีคอลัมน์ partition -> PK เปลี่ยนเป็น (id, date_slot)
+#     (id ยัง AUTO_INCREMENT และ unique ตามเดิม, query เดิมไม่ต้องแก้ — date_slot range ถูก prune อัตโนมัติ)
+#   - job รายวันแยก pmax ออกเป็นเดือนล่วงหน้า TIMESLOT_PARTITION_MONTHS_AHEAD เดือน (pmax ว่าง -> เร็ว)
+#   - เดือนที่เก่ากว่า TIMESLOT_RETENTION_MONTHS (0 = ไม่ archive) ย้ายออก:
+#       table: EXCHANGE PARTITION กับ timeslot_archive_YYYYMM (metadata only) แล้วบีบอัด table นั้น
+#              + view timeslot_with_archive = timeslot UNION ALL archive ทั้งหมด (สำหรับ query ย้อนหลังแบบ ad-hoc)
+#       file : เขียน CSV.gz ลง TIMESLOT_ARCHIVE_DIR แล้ว DROP PARTITION
+#     timeslot_hourly / timeslot_segments ของเดือนนั้นยังอยู่ -> หน้าสถิติ/ตารางรายชั่วโมงย้อนหลังยังใช้ได้
+#     (rebuild เพราะแมว/สีเปลี่ยน ลบเฉพาะช่วงตั้งแต่ _timeslot_archived_before() เพราะสร้างได้จาก timeslot สด เท่านั้น)
+# การแปลงตารางครั้งแรก (ALTER ทั้งตาราง) ทำเมื่อ TIMESLOT_PARTITIONING=1 หรือสั่งผ่าน admin endpoint
+TIMESLOT_PARTITIONING = os.environ.get("TIMESLOT_PARTITIONING", "0") == "1"
+TIMESLOT_PARTITION_MONTHS_AHEAD = int(os.environ.get("TIMESLOT_PARTITION_MONTHS_AHEAD", "3") or 3)
+TIMESLOT_RETENTION_MONTHS = int(os.environ.get("TIMESLOT_RETENTION_MONTHS", "0") or 0)
+TIMESLOT_ARCHIVE_MODE = (os.environ.get("TIMESLOT_ARCHIVE_MODE", "table") or "table").strip().lower()
+TIMESLOT_ARCHIVE_DIR = os.environ.get("TIMESLOT_ARCHIVE_DIR", os.path.join(BASE_DIR, "archive")).strip()
+_TIMESLOT_PARTITION_LOCK = Lock()
+_PARTITION_NAME_RE = re.compile(r"^p(\d{4})(\d{2})$")
+TIMESLOT_ARCHIVE_STATE_TTL = 60.0
+_TIMESLOT_ARCHIVE_STATE = {"at": 0.0, "before": None}
+
+
+def _timeslot_archived_before():
+    """datetime ที่ข้อมูลก่อนหน้านั้นถูก archive ออกจาก timeslot แล้ว (None = ยังไม่เคย archive)
+    อ่านจาก notification_state (เขียนโดย job partition) cache TIMESLOT_ARCHIVE_STATE_TTL วินาที"""
+    st = _TIMESLOT_ARCHIVE_STATE
+    now = time_module.monotonic()
+    if now - st["at"] >= TIMESLOT_ARCHIVE_STATE_TTL:
+        try:
+            v = _state_get("timeslot_archived_before", "")
+            before = datetime.strptime(v, "%Y-%m-%d") if v else None
+        except (mysql.connector.Error, ValueError):
+            before = None
+        st.update({"at": now, "before": before})
+    return st["before"]
+
+
+_ARCHIVE_TABLES = {"before": None, "tables": {}}
+
+
+def _archive_tables(cursor) -> dict:
+    """{เดือน: set คอลัมน์} ของ archive table (เดือนที่ archive เป็นไฟล์ไม่อยู่ในนี้)
+    archive table ไม่เปลี่ยนหลังสร้าง -> cache ตามค่า _timeslot_archived_before()"""
+    before = _timeslot_archived_before()
+    if before is None:
+        return {}
+    if _ARCHIVE_TABLES["before"] == before:
+        return _ARCHIVE_TABLES["tables"]
+    cursor.execute(
+        """
+        SELECT c.TABLE_NAME AS t, c.COLUMN_NAME AS c
+        FROM information_schema.COLUMNS c
+        JOIN information_schema.TABLES tb ON tb.TABLE_SCHEMA = c.TABLE_SCHEMA AND tb.TABLE_NAME = c.TABLE_NAME
+        WHERE c.TABLE_SCHEMA = DATABASE() AND c.TABLE_NAME LIKE 'timeslot_archive_%' AND tb.TABLE_TYPE = 'BASE TABLE'
+        """
+    )
+    tables = {}
+    for r in cursor.fetchall() or []:
+        m = re.match(r"^timeslot_archive_(\d{4})(\d{2})$", r.get("t") or "")
+        if m:
+            tables.setdefault(date(int(m.group(1)), int(m.group(2)), 1), set()).add(r["c"])
+    _ARCHIVE_TABLES.update({"before": before, "tables": tables})
+    return tables
+
+
+def _timeslot_source(cursor, start, end=None) -> str:
+    """FROM สำหรับ reader ช่วง [start, end) (end=None = ถึงปัจจุบัน)
+    ช่วงที่เริ่มก่อนขอบ archive -> UNION ALL เฉพาะ archive table ของเดือนที่ทับช่วง (+ timeslot ถ้าเลยขอบ)
+    โดยใส่เงื่อนไขช่วงไว้ในแต่ละ branch: MySQL < 8.0.29 ไม่ push predicate เข้า UNION derived table
+    จึงห้ามอ่านผ่าน view timeslot_with_archive (materialize ทุกเดือน) — เดือนที่ archive เป็นไฟล์อ่านไม่ได้"""
+    before = _timeslot_archived_before()
+    if before is None or start is None:
+        return "timeslot"
+    if not isinstance(start, datetime):
+        start = datetime.combine(start, time.min)
+    if end is not None and not isinstance(end, datetime):
+        end = datetime.combine(end, time.min)
+    if start >= before:
+        return "timeslot"
+
+    tables = _archive_tables(cursor)
+    months = []
+    for m in sorted(tables):
+        m_start, m_end = datetime.combine(m, time.min), datetime.combine(_add_months(m, 1), time.min)
+        if m_end > start and (end is None or m_start < end):
+            months.append((m, m_start, m_end))
+    if not months:
+        return "timeslot"
+
+    def lit(dt):
+        return "'" + dt.isoformat(sep=" ", timespec="microseconds") + "'"
+
+    cols = sorted(_get_timeslot_columns(cursor))
+    parts = []
+    for m, m_start, m_end in months:
+        have = tables[m]
+        cond = []
+        if start > m_start:
+            cond.append(f"date_slot >= {lit(start)}")
+        if end is not None and end < m_end:
+            cond.append(f"date_slot < {lit(end)}")
+        select = ", ".join(f"`{c}`" if c in have else f"NULL AS `{c}`" for c in cols)
+        parts.append(f"SELECT {select} FROM `timeslot_archive_{m:%Y%m}`" + (" WHERE " + " AND ".join(cond) if cond else ""))
+    if end is None or end > before:
+        cond = ([f"date_slot >= {lit(start)}"] if start > datetime.min else []) + (
+            [f"date_slot < {lit(end)}"] if end is not None else []
+        )
+        parts.append("SELECT " + ", ".join(f"`{c}`" for c in cols) + " FROM timeslot" + (" WHERE " + " AND ".join(cond) if cond else ""))
+    return "(" + " UNION ALL ".join(parts) + ") AS ts_src"
+
+
+def _archived_months(cursor) -> list:
+    """เดือนที่ถูก archive แล้ว (archive table + ไฟล์ CSV.gz) เรียงจากเก่า -> ใหม่"""
+    cursor.execute(
+        """
+        SELECT TABLE_NAME AS t FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE 'timeslot_archive_%' AND TABLE_TYPE = 'BASE TABLE'
+        """
+    )
+    names = [r.get("t") or "" for r in cursor.fetchall() or []]
+    if os.path.isdir(TIMESLOT_ARCHIVE_DIR):
+        names += os.listdir(TIMESLOT_ARCHIVE_DIR)
+    months = set()
+    for n in names:
+        m = re.match(r"^timeslot_(?:archive_)?(\d{4})(\d{2})(?:\.csv\.gz)?$", n)
+        if m:
+            months.add(date(int(m.group(1)), int(m.group(2)), 1))
+    return sorted(months)
+
+
+def _record_archive_state(cursor):
+    """เก็บขอบเขต archive ล่าสุด (เดือนถัดจากเดือนที่ archive ล่าสุด) ให้ reader/rollup ใช้"""
+    months = _archived_months(cursor)
+    before = _add_months(months[-1], 1) if months else None
+    _state_set("timeslot_archived_before", before.strftime("%Y-%m-%d") if before else "")
+    _ARCHIVE_TABLES["before"] = None
+    _TIMESLOT_ARCHIVE_STATE.update({"at": time_module.monotonic(), "before": datetime.combine(before, time.min) if before else None})
+
+
+def _month_start(d) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _add_months(d: date, n: int) -> date:
+    y, m = divmod(d.month - 1 + n, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def _partition_def(month: date) -> str:
+    nxt = _add_months(month, 1)
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{nxt:%Y-%m-%d}')"
+
+
+def _timeslot_partitions(cursor) -> list:
+    """[{name, month (date|None สำหรับ pmax), rows (ประมาณ)}] เรียงตามลำดับ partition; [] ถ้ายังไม่ได้ partition"""
+    cursor.execute(
+        """
+        SELECT PARTITION_NAME AS name, TABLE_ROWS AS row_est
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'timeslot' AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+        """
+    )
+    out = []
+    for r in cursor.fetchall() or []:
+        m = _PARTITION_NAME_RE.match(r.get("name") or "")
+        out.append({
+            "name": r.get("name"),
+            "month": date(int(m.group(1)), int(m.group(2)), 1) if m else None,
+            "rows": int(r.get("row_est") or 0),
+        })
+    return out
+
+
+def _partition_timeslot_table(cursor) -> int:
+    """แปลง timeslot เป็น partition รายเดือน (rebuild ทั้งตาราง) คืนจำนวน partition รายเดือน"""
+    cursor.execute("SELECT MIN(date_slot) AS first_dt FROM timeslot")
+    first_dt = (cursor.fetchone() or {}).get("first_dt")
+    this_month = _month_start(date.today())
+    month = _month_start(first_dt) if first_dt else this_month
+    last = _add_months(this_month, TIMESLOT_PARTITION_MONTHS_AHEAD)
+    defs = []
+    while month <= last:
+        defs.append(_partition_def(month))
+        month = _add_months(month, 1)
+    defs.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+
+    cursor.execute("ALTER TABLE timeslot DROP PRIMARY KEY, ADD PRIMARY KEY (id, date_slot)")
+    cursor.execute(f"ALTER TABLE timeslot PARTITION BY RANGE COLUMNS(date_slot) ({', '.join(defs)})")
+    return len(defs) - 1
+
+
+def _ensure_future_partitions(cursor, parts) -> list:
+    """แยก pmax ให้มีเดือนล่วงหน้าครบ คืนชื่อ partition ที่สร้างใหม่"""
+    months = [p["month"] for p in parts if p["month"]]
+    if not months or not any(p["name"] == "pmax" for p in parts):
+        return []
+    target = _add_months(_month_start(date.today()), TIMESLOT_PARTITION_MONTHS_AHEAD)
+    month = _add_months(max(months), 1)
+    defs, names = [], []
+    while month <= target:
+        defs.append(_partition_def(month))
+        names.append(f"p{month:%Y%m}")
+        month = _add_months(month, 1)
+    if defs:
+        defs.append("PARTITION pmax VALUES LESS THAN (MAXVALUE)")
+        cursor.execute(f"ALTER TABLE timeslot REORGANIZE PARTITION pmax INTO ({', '.join(defs)})")
+    return names
+
+
+def _archive_partition_to_file(cursor, part: dict) -> str:
+    """เขียน partition เป็น CSV.gz (ไฟล์ชั่วคราว -> rename เมื่อเสร็จ) คืน path"""
+    os.makedirs(TIMESLOT_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(TIMESLOT_ARCHIVE_DIR, f"timeslot_{part['month']:%Y%m}.csv.gz")
+    tmp = path + ".tmp"
+    conn = mysql.connector.connect(**db_config)
+    cur = conn.cursor(buffered=False)
+    try:
+        cur.execute(f"SELECT * FROM timeslot PARTITION (`{part['name']}`) ORDER BY date_slot, id")
+        with gzip.open(tmp, "wt", encoding="utf-8", newline="") as f:
+            w = csv.writer(f)
+            w.writerow([d[0] for d in cur.description])
+            while True:
+                rows = cur.fetchmany(EXPORT_CHUNK_ROWS)
+                if not rows:
+                    break
+                w.writerows(rows)
+    finally:
+        cur.close()
+        conn.close()
+    os.replace(tmp, path)
+    return path
+
+
+def _refresh_archive_view(cursor) -> int:
+    """สร้าง view timeslot_with_archive ใหม่ตามคอลัมน์ปัจจุบันของ timeslot คืนจำนวน archive table
+    (สำหรับ query ad-hoc เท่านั้น — reader ในแอปใช้ _timeslot_source ที่เลือกเฉพาะเดือนที่ทับช่วง)"""
+    cursor.execute(
+        """
+        SELECT TABLE_NAME AS t FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME LIKE 'timeslot_archive_%' AND TABLE_TYPE = 'BASE TABLE'
+        ORDER BY TABLE_NAME
+        """
+    )
+    tables = [r["t"] for r in cursor.fetchall() or [] if re.match(r"^timeslot_archive_\d{6}$", r.get("t") or "")]
+
+    # คอลัมน์ระบุชื่อตาม timeslot ปัจจุบัน: archive ที่สร้างก่อนเพิ่มแมวตัวใหม่ไม่มีคอลัมน์นั้น -> NULL
+    # (SELECT * จะมีจำนวนคอลัมน์ไม่เท่ากันแล้ว CREATE VIEW ล้มหลัง partition ถูก drop ไปแล้ว)
+    cursor.execute(
+        """
+        SELECT TABLE_NAME AS t, COLUMN_NAME AS c FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND (TABLE_NAME = 'timeslot' OR TABLE_NAME LIKE 'timeslot_archive_%')
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """
+    )
+    table_cols = {}
+    for r in cursor.fetchall() or []:
+        table_cols.setdefault(r["t"], []).append(r["c"])
+    cols = table_cols.get("timeslot") or []
+    parts = ["SELECT " + ", ".join(f"`{c}`" for c in cols) + " FROM timeslot"]
+    for t in tables:
+        have = set(table_cols.get(t) or [])
+        select = ", ".join(f"`{c}`" if c in have else f"NULL AS `{c}`" for c in cols)
+        parts.append(f"SELECT {select} FROM `{t}`")
+    cursor.execute(f"CREATE OR REPLACE VIEW timeslot_with_archive AS {' UNION ALL '.join(parts)}")
+    return len(tables)
+
+
+def _archive_old_partitions(cursor, parts, dry_run: bool = False) -> list:
+    """ย้ายเดือนที่เก่ากว่า retention ออกจาก timeslot คืน [{partition, month, rows, target}]"""
+    if TIMESLOT_RETENTION_MONTHS <= 0:
+        return []
+    horizon = _add_months(_month_start(date.today()), -TIMESLOT_RETENTION_MONTHS)
+    done = []
+    for part in parts:
+        if not part["month"] or part["month"] >= horizon:
+            continue
+        if TIMESLOT_ARCHIVE_MODE == "file":
+            target = os.path.join(TIMESLOT_ARCHIVE_DIR, f"timeslot_{part['month']:%Y%m}.csv.gz")
+            if not dry_run:
+                _archive_partition_to_file(cursor, part)
+        else:
+            target = f"timeslot_archive_{part['month']:%Y%m}"
+            if not dry_run:
+                cursor.execute(
+                    "SELECT COUNT(*) AS n FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                    (target,),
+                )
+                if int((cursor.fetchone() or {}).get("n") or 0):
+                    # รอบก่อน exchange ไปแล้วแต่ยังไม่ได้ drop -> drop ได้เฉพาะเมื่อ partition ว่างจริง
+                    cursor.execute(f"SELECT 1 AS x FROM timeslot PARTITION (`{part['name']}`) LIMIT 1")
+                    if cursor.fetchone():
+                        app.logger.warning(f"[PARTITION] {target} exists but {part['name']} is not empty; skipped")
+                        continue
+                else:
+                    cursor.execute(f"CREATE TABLE `{target}` LIKE timeslot")
+                    cursor.execute(f"ALTER TABLE `{target}` REMOVE PARTITIONING")
+                    cursor.execute(f"ALTER TABLE timeslot EXCHANGE PARTITION `{part['name']}` WITH TABLE `{target}`")
+                try:
+                    cursor.execute(f"ALTER TABLE `{target}` ROW_FORMAT=COMPRESSED")
+                except mysql.connector.Error as e:
+                    # innodb_file_per_table ปิดอยู่ / engine ไม่รองรับ -> เก็บแบบไม่บีบอัด
+                    app.logger.warning(f"[PARTITION] cannot compress {target}: {e}")
+        if not dry_run:
+            cursor.execute(f"ALTER TABLE timeslot DROP PARTITION `{part['name']}`")
+        done.append({"partition": part["name"], "month": part["month"].strftime("%Y-%m"),
+                     "rows": part["rows"], "target": target})
+    return done
+
+
+def _maintain_timeslot_partitions(cursor, convert: bool = False, dry_run: bool = False) -> dict:
+    """แปลง (ถ้าสั่ง) -> สร้าง partition ล่วงหน้า -> archive เดือนเก่า (DDL ของ MySQL commit เองทีละคำสั่ง)"""
+    with _TIMESLOT_PARTITION_LOCK:
+        parts = _timeslot_partitions(cursor)
+        result = {"partitioned": bool(parts), "converted": 0, "created": [], "archived": []}
+        if not parts:
+            if not convert or dry_run:
+                return result
+            result["converted"] = _partition_timeslot_table(cursor)
+            result["partitioned"] = True
+            parts = _timeslot_partitions(cursor)
+        if not dry_run:
+            result["created"] = _ensure_future_partitions(cursor, parts)
+        result["archived"] = _archive_old_partitions(cursor, parts, dry_run=dry_run)
+        if not dry_run:
+            # ทุกรอบ ไม่ใช่เฉพาะตอน archive: คอลัมน์แมวใหม่ที่เพิ่มใน timeslot ต้องเข้า view ด้วย
+            result["archive_tables"] = _refresh_archive_view(cursor)
+            _record_archive_state(cursor)
+        if result["archived"] and not dry_run:
+            # แถวหายไปจาก timeslot -> catalog (วัน/จำนวน slot) ต้องนับใหม่, cache ที่อ่าน raw ใช้ไม่ได้
+            _timeslot_catalog_reset()
+            _response_cache_clear(disk=True)
+        return result
+
+
+def _run_timeslot_partition_job():
+    if not TIMESLOT_PARTITIONING:
+        return
+    connection = mysql.connector.connect(**db_config)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        stats = _maintain_timeslot_partitions(cursor, convert=True)
+        app.logger.info(f"[PARTITION] {stats}")
+    except Exception as e:
+        app.logger.error(f"[PARTITION] Error: {e}", exc_info=True)
+    finally:
+        try:
+            cursor.close()
+        finally:
+            connection.close()
+
+
+@app.route("/api/admin/timeslot/partitions", methods=["GET", "POST"])
+def admin_timeslot_partitions():
+    """GET: รายการ partition ของ timeslot
+    POST JSON (optional): { "convert": true, "dry_run": true } -> รัน maintenance ทันที
+      convert=true แปลงตารางที่ยังไม่ได้ partition (rebuild ทั้งตาราง ใช้เวลาตามขนาดข้อมูล)
+    """
+    err = _require_admin()
+    if err:
+        return err
+
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+    try:
+        if request.method == "POST":
+            data = request.get_json(silent=True) or {}
+            stats = _maintain_timeslot_partitions(
+                cur, convert=bool(data.get("convert")), dry_run=bool(data.get("dry_run"))
+            )
+            return jsonify({"ok": True, "dry_run": bool(data.get("dry_run")), **stats})
+
+        parts = _timeslot_partitions(cur)
+        return jsonify({
+            "ok": True,
+            "partitioned": bool(parts),
+            "retention_months": TIMESLOT_RETENTION_MONTHS,
+            "archive_mode": TIMESLOT_ARCHIVE_MODE,
+            "partitions": [
+                {"name": p["name"], "month": p["month"].strftime("%Y-%m") if p["month"] else None, "rows": p["rows"]}
+                for p in parts
+            ],
+        })
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+# =========================================
+# I.1) TIMELINE TABLE (HOURLY / DAILY GRID)
+# =========================================
+
+# =========================================
+def _timeline_hours_from_slots(conn, prefixes, start: datetime, end: datetime):
+    """สรุปรายชั่วโมงของทุก prefix จาก timeslot ดิบ (query เดียว + วนรอบเดียว)"""
+    per_prefix = {
+        p: {
+            "found": [False] * 24,   # มี slot status=F ในชั่วโมงนั้น
+            "counts": [{} for _ in range(24)],       # transition counts (ครั้ง)
+            "slot_counts": [{} for _ in range(24)],  # จำนวน timeslot สำหรับคำนวณเวลา
+            "order": [[] for _ in range(24)],        # first-seen order
+            "last": None,
+        }
+        for p in prefixes
+    }
+    hour_has_rows = [False] * 24
+
+    if prefixes:
+        # ดึงทั้งวันครั้งเดียว ทุกแมว แล้วไล่ row stream รอบเดียว
+        select_cols = ", ".join(f"`{p}`, `{p}_cam`, `{p}_ac`" for p in prefixes)
+        meta = conn.cursor(dictionary=True)
+        try:
+            source = _timeslot_source(meta, start, end)
+        finally:
+            meta.close()
+        plain = conn.cursor()
+        try:
+            plain.execute(
+                f"""
+                SELECT date_slot, {select_cols}
+                FROM {source}
+                WHERE date_slot >= %s AND date_slot < %s
+                ORDER BY date_slot ASC
+                """,
+                (start, end),
+            )
+
+            # lookup ที่ใช้ซ้ำทุกแถว: cam -> room, activity ดิบ -> eat/excrete/None
+            room_of = {}
+            act_of = {}
+            states = [(per_prefix[p], 1 + 3 * i) for i, p in enumerate(prefixes)]
+            cur_hour = -1
+
+            for r in plain:
+                dt = r[0]
+                if not dt:
+                    continue
+                h = dt.hour
+                if h != cur_hour:
+                    # transition นับแยกรายชั่วโมง
+                    cur_hour = h
+                    hour_has_rows[h] = True
+                    for st, _ in states:
+                        st["last"] = None
+
+                for st, i in states:
+                    status = r[i]
+                    if not status or str(status).upper() != "F":
+                        continue
+                    st["found"][h] = True
+
+                    act_raw = r[i + 2]
+                    act = act_of.get(act_raw, False)
+                    if act is False:
+                        a_ = str(act_raw).strip().lower() if act_raw is not None else ""
+                        act = a_ if a_ in ("eat", "excrete") else None
+                        act_of[act_raw] = act
+                    if act is None:
+                        # NO/ว่าง/activity อื่น: ไม่นับ และรีเซ็ต transition
+                        st["last"] = None
+                        continue
+
+                    cam = r[i + 1]
+                    room = room_of.get(cam)
+                    if room is None:
+                        room = (CAM_CODE_TO_ROOM.get(str(cam).strip(), "") if cam else "") or "-"
+                        room_of[cam] = room
+
+                    key = (act, room)
+                    sc = st["slot_counts"][h]
+                    sc[key] = sc.get(key, 0) + 1
+                    if key != st["last"]:
+                        counts = st["counts"][h]
+                        if key not in counts:
+                            st["order"][h].append(key)
+                            counts[key] = 0
+                        counts[key] += 1
+                        st["last"] = key
+        finally:
+            plain.close()
+
+    return per_prefix, hour_has_rows
+
+
+def _timeline_hours_from_rollup(cursor, prefixes, day_start: datetime):
+    """โครงสร้างเดียวกับ _timeline_hours_from_slots แต่อ่านจาก timeslot_hourly (24 x prefix แถว)"""
+    per_prefix = {
+        p: {
+            "found": [False] * 24,
+            "counts": [{} for _ in range(24)],
+            "slot_counts": [{} for _ in range(24)],
+            "order": [[] for _ in range(24)],
+        }
+        for p in prefixes
+    }
+    hour_has_rows = [False] * 24
+    for r in _hourly_rollup_rows(cursor, prefixes, day_start, day_start + timedelta(days=1)):
+        h = r["hour_start"].hour
+        st = per_prefix[r["cat_prefix"]]
+        if not r["activity"]:
+            if int(r["slot_count"] or 0) > 0:
+                hour_has_rows[h] = True
+            if int(r["f_count"] or 0) > 0:
+                st["found"][h] = True
+            continue
+        key = (r["activity"], r["room"])
+        st["order"][h].append(key)
+        st["counts"][h][key] = int(r["transitions"] or 0)
+        st["slot_counts"][h][key] = int(r["slot_count"] or 0)
+    return per_prefix, hour_has_rows
+
+
+@app.route("/api/timeline_table")
+@_response_cached(_period_timeline_table)
+def api_timeline_table():
+    """
+    ตาราง Timeline รายชั่วโมง (00-23) สำหรับ "ทุกแมวที่ display_status=1"
+    อิงจาก timeslot ในช่วงวันเดียวตาม query param:
+      - date=YYYY-MM-DD (required)
+
+    Response:
+      {
+        "date": "YYYY-MM-DD",
+        "hours": ["00","01",...,"23"],
+        "rows": [
+          {
+            "date": "...",
+            "color": "...",
+            "cat_name": "...",
+            "cells": { "00": "...", ... }
+          }, ...
+        ]
+      }
+    """
+    date_str = request.args.get("date")
+    if not date_str:
+        return jsonify({"message": "date is required (YYYY-MM-DD)"}), 400
+
+    try:
+        day = datetime.strptime(date_str, "%Y-%m-%d").date()
+    except ValueError:
+        return jsonify({"message": "date must be YYYY-MM-DD"}), 400
+
+    start = datetime.combine(day, time.min)
+    end = start + timedelta(days=1)
+
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+
+    try:
+        cur.execute("SELECT name, color FROM cats WHERE display_status=1 ORDER BY name")
+        cats = cur.fetchall() or []
+        cols = _get_timeslot_columns(cur)
+
+        hours = [f"{h:02d}" for h in range(24)]
+
+        # แมวที่มีคอลัมน์ prefix/prefix_cam/prefix_ac ใน timeslot (แมวหลายตัวใช้สีเดียวกันได้ -> คำนวณครั้งเดียว)
+        shown = []
+        prefixes = []
+        for cat in cats:
+            prefix = _normalize_prefix(cat.get("color"))
+            if not prefix:
+                continue
+            if not all(c in cols for c in (prefix, f"{prefix}_cam", f"{prefix}_ac")):
+                continue
+            shown.append((cat, prefix))
+            if prefix not in prefixes:
+                prefixes.append(prefix)
+
+        per_prefix = None
+        if prefixes:
+            try:
+                if _derived_ready(cur, "hourly_rollup", prefixes, start, end, HOURLY_ROLLUP_SYNC_ROWS):
+                    per_prefix, hour_has_rows = _timeline_hours_from_rollup(cur, prefixes, start)
+            except mysql.connector.Error:
+                per_prefix = None
+        if per_prefix is None:
+            per_prefix, hour_has_rows = _timeline_hours_from_slots(conn, prefixes, start, end)
+
+        # 1 slot = 10 วินาที
+        def _fmt_minutes(slots: int) -> str:
+            mins = (slots * 10.0) / 60.0
+            # ปัดเป็น 1 ตำแหน่ง (เช่น 2.0 -> 2)
+            mins_1 = round(mins, 1)
+            if abs(mins_1 - int(mins_1)) < 1e-9:
+                return str(int(mins_1))
+            return f"{mins_1:.1f}"
+
+        cells_by_prefix = {}
+        for p, st in per_prefix.items():
+            cells = {}
+            for h in range(24):
+                if not hour_has_rows[h]:
+                    cells[hours[h]] = "-"
+                elif not st["found"][h]:
+                    cells[hours[h]] = "Not found (NF)"
+                elif not st["counts"][h]:
+                    cells[hours[h]] = "-"
+                else:
+                    cells[hours[h]] = ", ".join(
+                        f"{st['counts'][h][k]} {k[0]} @{k[1]} ({_fmt_minutes(st['slot_counts'][h][k])} นาที)"
+                        for k in st["order"][h]
+                    )
+            cells_by_prefix[p] = cells
+
+        rows = [
+            {
+                "date": date_str,
+                "color": cat.get("color"),
+                "cat_name": cat.get("name"),
+                "cells": dict(cells_by_prefix[prefix]),
+            }
+            for cat, prefix in shown
+        ]
+
+        return jsonify({"date": date_str, "hours": hours, "rows": rows})
+    finally:
+        cur.close()
+        conn.close()
+
+@app.route("/api/statistics/years", methods=["GET"])
+def api_statistics_years():
+    """คืน 'ทุกปี' ที่มีข้อมูล (timeslot + เดือนที่ archive แล้ว เรียง ASC)"""
+    connection = mysql.connector.connect(**db_config)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        years = list(_data_catalog(cursor)["years"])
+        return jsonify({"years": years})
+    finally:
+        cursor.close()
+        connection.close()
+
+
+@app.route("/api/statistics/bounds", methods=["GET"])
+def api_statistics_bounds():
+    """ขอบเขตข้อมูล (timeslot + เดือนที่ archive แล้ว) จาก catalog
+    Query (optional): year=YYYY, month=MM -> กรองรายการวัน
+    Response: { first, last, years: [...], days: { "YYYY-MM-DD": slot_count, ... } }
+    """
+    year = request.args.get("year")
+    month = request.args.get("month")
+    try:
+        year_i = int(year) if year else None
+        month_i = int(month) if month else None
+    except ValueError:
+        return jsonify({"message": "year/month must be numbers"}), 400
+
+    connection = mysql.connector.connect(**db_config)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        snap = _data_catalog(cursor)
+    finally:
+        cursor.close()
+        connection.close()
+
+    days = {
+        d.strftime("%Y-%m-%d"): v[0]
+        for d, v in sorted(snap["days"].items())
+        if (year_i is None or d.year == year_i) and (month_i is None or d.month == month_i)
+    }
+    return jsonify({
+        "first": snap["first"].strftime("%Y-%m-%d %H:%M:%S") if snap["first"] else None,
+        "last": snap["last"].strftime("%Y-%m-%d %H:%M:%S") if snap["last"] else None,
+        "years": list(snap["years"]),
+        "days": days,
+    })
+
+
+def _aggregate_counts_by_period(prefix: str, slots, period: str):
+    """
+    สร้าง labels + series จาก slots (list of dict)
+    period: daily/monthly/yearly/range
+    นับแบบ "transition count" ต่อช่วงเวลา
+    """
+    buckets = {}  # label -> list(slots)
+    for s in slots:
+        dt = s.get("date_slot")
+        if not dt:
+            continue
+        if period == "monthly":
+            label = f"{dt.year:04d}-{dt.month:02d}"
+        elif period == "yearly":
+            label = f"{dt.year:04d}"
+        else:
+            label = dt.strftime("%Y-%m-%d")
+        buckets.setdefault(label, []).append(s)
+
+    labels = sorted(buckets.keys())
+    eat_series = []
+    exc_series = []
+    for lb in labels:
+        bslots = buckets[lb]
+        eat_series.append(_count_activity_transitions(bslots, "eat"))
+        exc_series.append(_count_activity_transitions(bslots, "excrete"))
+
+    return labels, eat_series, exc_series
+
+
+def _statistics_window(period, year, month, start_year, end_year, start_date, end_date, miny, maxy):
+    """แปลง query ของ /api/statistics เป็น (start_dt, end_dt, aggregate_period) หรือ None (ไม่มีข้อมูล)"""
+    if period == "range":
+        if not start_date or not end_date:
+            return None
+        sdt = datetime.strptime(start_date, "%Y-%m-%d")
+        edt = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+        return sdt, edt, "daily"
+
+    if period == "daily":
+        if not year:
+            if maxy:
+                year = str(maxy)
+            else:
+                return None
+        if not month:
+            month = "01"
+
+        y = int(year)
+        m = int(month)
+        start_dt = datetime(y, m, 1)
+        if m == 12:
+            end_dt = datetime(y + 1, 1, 1)
+        else:
+            end_dt = datetime(y, m + 1, 1)
+        return start_dt, end_dt, "daily"
+
+    if period == "monthly":
+        if not year:
+            if maxy:
+                year = str(maxy)
+            else:
+                return None
+
+        y = int(year)
+        return datetime(y, 1, 1), datetime(y + 1, 1, 1), "monthly"
+
+    # yearly
+    if not end_year and maxy:
+        end_year = str(maxy)
+    if not start_year and miny:
+        start_year = str(miny)
+    if not start_year or not end_year:
+        return None
+
+    s_y = int(start_year)
+    e_y = int(end_year)
+    if miny is not None:
+        s_y = max(s_y, miny)
+    if maxy is not None:
+        e_y = min(e_y, maxy)
+    if s_y > e_y:
+        s_y, e_y = e_y, s_y
+
+    return datetime(s_y, 1, 1), datetime(e_y + 1, 1, 1), "yearly"
+
+
+def _aggregate_counts_multi(conn, prefixes, start_dt: datetime, end_dt: datetime, period: str):
+    """เหมือน _aggregate_counts_by_period แต่หลาย prefix จาก scan เดียว (stream แถว ไม่ fetchall)
+    คืน (labels, {prefix: (eat_series, excrete_series)}) — labels ตรงกันทุกแมว
+    """
+    select_cols = ", ".join(f"`{p}`, `{p}_ac`" for p in prefixes)
+    labels = []
+    counts = {p: ([], []) for p in prefixes}
+    prev = {}
+    cur_key = None
+
+    meta = conn.cursor(dictionary=True)
+    try:
+        source = _timeslot_source(meta, start_dt, end_dt)
+    finally:
+        meta.close()
+    plain = conn.cursor()
+    try:
+        plain.execute(
+            f"""
+            SELECT date_slot, {select_cols}
+            FROM {source}
+            WHERE date_slot >= %s AND date_slot < %s
+            ORDER BY date_slot ASC
+            """,
+            (start_dt, end_dt),
+        )
+        for r in plain:
+            dt = r[0]
+            if not dt:
+                continue
+            if period == "monthly":
+                key = (dt.year, dt.month)
+            elif period == "yearly":
+                key = dt.year
+            else:
+                key = dt.date()
+            if key != cur_key:
+                # bucket ใหม่: transition นับแยกแต่ละ bucket
+                cur_key = key
+                if period == "monthly":
+                    labels.append(f"{dt.year:04d}-{dt.month:02d}")
+                elif period == "yearly":
+                    labels.append(f"{dt.year:04d}")
+                else:
+                    labels.append(dt.strftime("%Y-%m-%d"))
+                for eat, exc in counts.values():
+                    eat.append(0)
+                    exc.append(0)
+                prev = {}
+
+            for i, p in enumerate(prefixes):
+                status = r[1 + 2 * i]
+                if (status or "").upper() != "F":
+                    continue
+                act = (r[2 + 2 * i] or "").lower()
+                before = prev.get(p)
+                if act != before:
+                    if act == "eat":
+                        counts[p][0][-1] += 1
+                    elif act == "excrete":
+                        counts[p][1][-1] += 1
+                prev[p] = act
+    finally:
+        plain.close()
+    return labels, counts
+
+
+@app.route("/api/statistics", methods=["GET"])
+@_response_cached(_period_statistics)
+def api_statistics():
+    """
+    Query params:
+      cat: ชื่อแมว (จำเป็น ถ้าไม่ส่ง cats)
+      cats: หลายตัวคั่นด้วย comma (เช่น cats=Black,Orange) -> scan ช่วงเวลาครั้งเดียวสำหรับทุกตัว
+      period: daily | monthly | yearly | range
+      year: ใช้กับ daily/monthly (ปีสิ้นสุด)
+      month: ใช้กับ daily (เดือน 01-12)
+      start_year, end_year: ใช้กับ yearly
+      start_date, end_date: ใช้กับ range (YYYY-MM-DD)
+    NOTE: ใช้ timeslot แทน cat_activities แล้ว
+
+    Response (cats=...):
+      {
+        "labels": [...],
+        "cats": { "<name>": { "series": {...}, "summary": {...} }, ... },
+        "missing": ["<name ที่ไม่พบ>"]
+      }
+    """
+    cat = request.args.get("cat")
+    cats_param = request.args.get("cats")
+    period = (request.args.get("period") or "daily").lower()
+    year = request.args.get("year")
+    month = request.args.get("month")
+    start_year = request.args.get("start_year")
+    end_year = request.args.get("end_year") or year
+    start_date = request.args.get("start_date")
+    end_date = request.args.get("end_date")
+
+    if cats_param:
+        return _api_statistics_multi(cats_param, period, year, month, start_year, end_year, start_date, end_date)
+
+    if not cat:
+        return jsonify({"message": "missing cat"}), 400
+
+    connection = mysql.connector.connect(**db_config)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT color FROM cats WHERE name=%s LIMIT 1", (cat,))
+        crow = cursor.fetchone()
+        if not crow:
+            return jsonify({"labels": [], "series": {}, "summary": {}})
+
+        prefix = _normalize_prefix(crow.get("color") or cat)
+
+        # bounds
+        years = _data_catalog(cursor)["years"]
+        miny = years[0] if years else None
+        maxy = years[-1] if years else None
+
+        window = _statistics_window(period, year, month, start_year, end_year, start_date, end_date, miny, maxy)
+        if window is None:
+            return jsonify({"labels": [], "series": {}, "summary": {}})
+        start_dt, end_dt, agg_period = window
+
+        # segment ให้ผลเท่ากับ slot ดิบ (transition นับจากค่าที่เปลี่ยน) แต่จำนวนแถวน้อยกว่ามาก
+        if _derived_ready(cursor, "segments", [prefix], start_dt, end_dt, SEGMENTS_SYNC_ROWS):
+            slots = _fetch_segments_for_cat(cursor, prefix, start_dt, end_dt)
+        else:
+            slots = _fetch_timeslots_for_cat(cursor, prefix, start_dt, end_dt)
+        labels, eat_cnt, excrete_cnt = _aggregate_counts_by_period(prefix, slots, agg_period)
+
+        total_eat_cnt = sum(int(x or 0) for x in eat_cnt)
+        total_excrete = sum(int(x or 0) for x in excrete_cnt)
+
+        return jsonify(
+            {
+                "labels": labels,
+                "series": {
+                    "eatCount": eat_cnt,
+                    "excreteCount": excrete_cnt,
+                },
+                "summary": {
+                    "totalEatCount": total_eat_cnt,
+                    "totalExcreteCount": total_excrete,
+                },
+            }
+        )
+    finally:
+        cursor.close()
+        connection.close()
+
+
+STATISTICS_MAX_CATS = int(os.environ.get("STATISTICS_MAX_CATS", "20") or 20)
+
+
+def _api_statistics_multi(cats_param, period, year, month, start_year, end_year, start_date, end_date):
+    names = []
+    for n in str(cats_param).split(","):
+        n = n.strip()
+        if n and n not in names:
+            names.append(n)
+    if not names:
+        return jsonify({"message": "missing cats"}), 400
+    if len(names) > STATISTICS_MAX_CATS:
+        return jsonify({"message": f"too many cats (max {STATISTICS_MAX_CATS})"}), 400
+
+    connection = mysql.connector.connect(**db_config)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        placeholders = ",".join(["%s"] * len(names))
+        cursor.execute(f"SELECT name, color FROM cats WHERE name IN ({placeholders})", tuple(names))
+        color_of = {r["name"]: r.get("color") for r in (cursor.fetchall() or [])}
+
+        cols = _get_timeslot_columns(cursor)
+        prefix_of = {}
+        for n in names:
+            if n not in color_of:
+                continue
+            prefix = _normalize_prefix(color_of.get(n) or n)
+            if _safe_identifier(prefix) and prefix in cols and f"{prefix}_ac" in cols:
+                prefix_of[n] = prefix
+            else:
+                prefix_of[n] = None  # ไม่มีคอลัมน์ใน timeslot -> series ว่าง (เหมือนแบบตัวเดียว)
+        missing = [n for n in names if n not in color_of]
+
+        years = _data_catalog(cursor)["years"]
+        miny = years[0] if years else None
+        maxy = years[-1] if years else None
+
+        window = _statistics_window(period, year, month, start_year, end_year, start_date, end_date, miny, maxy)
+        prefixes = sorted({p for p in prefix_of.values() if p})
+        if window is None or not prefix_of:
+            labels, counts = [], {}
+        else:
+            start_dt, end_dt, agg_period = window
+            if prefixes:
+                labels, counts = _aggregate_counts_multi(connection, prefixes, start_dt, end_dt, agg_period)
+            else:
+                labels, counts = [], {}
+
+        out = {}
+        for n, prefix in prefix_of.items():
+            if prefix and prefix in counts:
+                eat_cnt, excrete_cnt = counts[prefix]
+                series_labels = labels
+            else:
+                eat_cnt, excrete_cnt, series_labels = [], [], []
+            out[n] = {
+                "labels": series_labels,
+                "series": {
+                    "eatCount": list(eat_cnt),
+                    "excreteCount": list(excrete_cnt),
+                },
+                "summary": {
+                    "totalEatCount": sum(int(x or 0) for x in eat_cnt),
+                    "totalExcreteCount": sum(int(x or 0) for x in excrete_cnt),
+                },
+            }
+
+        return jsonify({"labels": labels, "cats": out, "missing": missing})
+    finally:
+        cursor.close()
+        connection.close()
+
+
+# =========================================
+# J) ROOM TIMELINE (LATEST DAY) - FROM TIMESLOT
+# =========================================
+@app.route("/api/statistics/room_timeline", methods=["GET"])
+@_response_cached(_period_room_timeline)
+def api_room_timeline_latest_day():
+    """
+    คืนตาราง 'ห้องที่แมวอยู่' รายชั่วโมง (00:00-23:00) ของ 'วันล่าสุด' ที่ปรากฏในฐานข้อมูล (timeslot)
+    Query params:
+      cat: ชื่อแมว (จำเป็น)
+    Response:
+      {
+        "date": "YYYY-MM-DD",
+        "hours": ["00:00",...,"23:00"],
+        "rooms": ["kitchen",...]
+      }
+    """
+    cat = request.args.get("cat")
+    if not cat:
+        return jsonify({"date": None, "hours": [], "rooms": []}), 400
+
+    connection = mysql.connector.connect(**db_config)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT color FROM cats WHERE name=%s LIMIT 1", (cat,))
+        crow = cursor.fetchone()
+        if not crow:
+            return jsonify({"date": None, "hours": [], "rooms": []})
+
+        prefix = _normalize_prefix(crow.get("color") or cat)
+        latest_day = _latest_date_in_timeslot(cursor)
+        if not latest_day:
+            return jsonify({"date": None, "hours": [], "rooms": []})
+
+        day_start = datetime.combine(latest_day, time.min)
+        day_end = day_start + timedelta(days=1)
+
+        # สร้าง mapping ชั่วโมง -> ห้อง (ใช้ slot ล่าสุดที่ status='F' ภายในชั่วโมงนั้น)
+        hours = [f"{h:02d}:00" for h in range(24)]
+
+        # อ่านจาก timeslot_hourly (last_cam ของแถวสรุปชั่วโมง) ถ้า rollup ตามทัน
+        try:
+            if _derived_ready(cursor, "hourly_rollup", [prefix], day_start, day_end, HOURLY_ROLLUP_SYNC_ROWS):
+                last_cams = {}
+                for r in _hourly_rollup_rows(cursor, [prefix], day_start, day_end):
+                    if not r["activity"] and r.get("last_cam"):
+                        last_cams[r["hour_start"].hour] = r["last_cam"]
+                rooms = [CAM_CODE_TO_ROOM.get(last_cams.get(h)) or "-" for h in range(24)]
+                return jsonify(
+                    {
+                        "date": latest_day.strftime("%Y-%m-%d"),
+                        "hours": hours,
+                        "rooms": rooms,
+                    }
+                )
+        except mysql.connector.Error:
+            connection.rollback()
+
+        slots = _fetch_timeslots_for_cat(cursor, prefix, day_start, day_end)
+        rooms = []
+
+        # เตรียม list ต่อชั่วโมง
+        idx = 0
+        for h in range(24):
+            h_start = day_start + timedelta(hours=h)
+            h_end = h_start + timedelta(hours=1)
+
+            last_cam = None
+            # เดิน idx ต่อเนื่องเพื่อลดเวลา (slots เรียง ASC)
+            while idx < len(slots) and slots[idx].get("date_slot") < h_start:
+                idx += 1
+
+            j = idx
+            while j < len(slots):
+                dt = slots[j].get("date_slot")
+                if not dt or dt >= h_end:
+                    break
+                if (slots[j].get("status") or "").upper() == "F":
+                    cam = slots[j].get("cam")
+                    if cam:
+                        last_cam = str(cam).strip()
+                j += 1
+
+            room = CAM_CODE_TO_ROOM.get(last_cam) if last_cam else None
+            rooms.append(room if room else "-")
+
+        return jsonify(
+            {
+                "date": latest_day.strftime("%Y-%m-%d"),
+                "hours": hours,
+                "rooms": rooms,
+            }
+        )
+    finally:
+        cursor.close()
+        connection.close()
+
+
+# =========================================
+# MAIN
+# =========================================
+# ============================================================
+# Daily vs Realtime alert modes
+# ============================================================
+
+def _ingest_alerts_list(cursor, target_day: date, alerts: list[dict]) -> int:
+    """Insert alerts list into alerts_log using same duplicate rules as _ingest_alerts_for_day.
+
+    alerts item schema:
+      {"cat_name": str, "alert_type": str, "message": str}
+    Returns number of inserted rows.
+    """
+    table = "alerts_log"
+    inserted = 0
+
+    has_color = _table_has_column(cursor, table, "color")
+    alert_date_generated = _is_generated_column(cursor, table, "alert_date")
+
+    for al in alerts:
+        cat_name = al.get("cat_name")
+        alert_type = al.get("alert_type")
+        message = al.get("message")
+        if not (cat_name and alert_type and message):
+            continue
+
+        # กันซ้ำ: (cat_name, alert_type, alert_date) และ is_read <> 2
+        cursor.execute(
+            f"""
+            SELECT id
+            FROM `{table}`
+            WHERE cat_name = %s AND alert_type = %s AND alert_date = %s AND is_read <> 2
+            LIMIT 1
+            """,
+            (cat_name, alert_type, target_day),
+        )
+        if cursor.fetchone():
+            continue
+
+        # color (ถ้าตารางมี)
+        color_val = None
+        if has_color:
+            cursor.execute("SELECT color FROM cats WHERE name=%s LIMIT 1", (cat_name,))
+            r = cursor.fetchone() or {}
+            color_val = r.get("color")
+
+        # ถ้า alert_date เป็น generated: ห้าม insert alert_date เอง
+        if alert_date_generated:
+            created_at = datetime.combine(target_day, time(23, 59, 0))
+            if has_color:
+                cursor.execute(
+                    f"""
+                    INSERT INTO `{table}` (cat_name, color, alert_type, message, is_read, created_at)
+                    VALUES (%s, %s, %s, %s, 0, %s)
+                    """,
+                    (cat_name, color_val, alert_type, message, created_at),
+                )
+            else:
+                cursor.execute(
+                    f"""
+                    INSERT INTO `{table}` (cat_name, alert_type, message, is_read, created_at)
+                    VALUES (%s, %s, %s, 0, %s)
+                    """,
+                    (cat_name, alert_type, message, created_at),
+                )
+        else:
+            if has_color:
+                cursor.execute(
+                    f"""
+                    INSERT INTO `{table}` (cat_name, color, alert_type, message, is_read, alert_date, created_at)
+                    VALUES (%s, %s, %s, %s, 0, %s, NOW())
+                    """,
+                    (cat_name, color_val, alert_type, message, target_day),
+                )
+            else:
+                cursor.execute(
+                    f"""
+                    INSERT INTO `{table}` (cat_name, alert_type, message, is_read, alert_date, created_at)
+                    VALUES (%s, %s, %s, 0, %s, NOW())
+                    """,
+                    (cat_name, alert_type, message, target_day),
+                )
+
+        inserted += 1
+
+    return inserted
+
+
+def _ingest_daily_behavior_for_day(cursor, target_day: date) -> int:
+    """Daily mode: ingest only eating/excretion alerts for target_day."""
+    all_alerts = _compute_alerts_for_day(cursor, target_day)
+    behavior = [a for a in all_alerts if a.get("alert_type") in ("no_eating", "low_excrete", "high_excrete")]
+    return _ingest_alerts_list(cursor, target_day, behavior)
+
+
+def _compute_no_cat_realtime(cursor) -> list[dict]:
+    """Realtime mode: compute only no_cat using NOW() as reference time."""
+    alerts = []
+
+    global_cfg = _get_system_config_global(cursor)
+    global_no_cat_hours = int(global_cfg.get("alert_no_cat", 12) or 12)
+
+    cat_prefix = _get_cat_prefix_map(cursor)
+
+    now_dt = datetime.now()
+
+    for cat_name, prefix in cat_prefix.items():
+        # per-cat config fallback
+        cursor.execute("SELECT color FROM cats WHERE name=%s LIMIT 1", (cat_name,))
+        crow = cursor.fetchone() or {}
+        cat_color = (crow.get("color") or "").strip()
+        cfg = _get_effective_config(cursor, cat_color)
+        no_cat_hours = int(cfg.get("alert_no_cat", global_no_cat_hours) or global_no_cat_hours)
+
+        last_found = _time_last_found(cursor, prefix)
+        if not last_found:
+            continue
+
+        hours_since = (now_dt - last_found).total_seconds() / 3600.0
+        if hours_since >= no_cat_hours:
             alerts.append(
                 {
                     "cat_name": cat_name,
@@ -3479,636 +6813,2281 @@ def _compute_no_cat_realtime(cursor) -> list[dict]:
                 }
             )
 
-    return alerts
+    return alerts
+
+
+def _ingest_realtime_no_cat(cursor) -> int:
+    """Realtime mode: ingest only no_cat alerts using NOW()."""
+    alerts = _compute_no_cat_realtime(cursor)
+    # บันทึกด้วย target_day = วันนี้ (เพื่อ grouping ใน alerts_log)
+    target_day = date.today()
+    return _ingest_alerts_list(cursor, target_day, alerts)
+
+
+
+# ============================================================
+# Authentication (Email/Password) + Role-based Admin
+# - users register with email; default role=user and is_approved=0
+# - admin approves pending accounts
+# - forgot password sends real email via SMTP (config via env)
+# ============================================================
+
+def _ensure_users_table():
+    """Ensure the users table exists (MySQL)."""
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS users (
+              id INT AUTO_INCREMENT PRIMARY KEY,
+              name VARCHAR(120) NOT NULL,
+              email VARCHAR(190) NOT NULL,
+              password_hash VARCHAR(255) NOT NULL,
+              role VARCHAR(20) NOT NULL DEFAULT 'user',
+              is_approved TINYINT(1) NOT NULL DEFAULT 0,
+              approved_at DATETIME NULL,
+              reset_token_hash VARCHAR(64) NULL,
+              reset_token_expires DATETIME NULL,
+              created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+              updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+              UNIQUE KEY uniq_email (email)
+            );
+            """
+        )
+        conn.commit()
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+def _bootstrap_admin_user():
+    """Optionally create/approve an initial admin user from env vars.
+
+    Set:
+      - BOOTSTRAP_ADMIN_EMAIL
+      - BOOTSTRAP_ADMIN_PASSWORD
+      - BOOTSTRAP_ADMIN_NAME (optional, default 'Admin')
+    """
+    email = os.environ.get("BOOTSTRAP_ADMIN_EMAIL")
+    pwd = os.environ.get("BOOTSTRAP_ADMIN_PASSWORD")
+    name = os.environ.get("BOOTSTRAP_ADMIN_NAME", "Admin")
+    if not email or not pwd:
+        return
+
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute("SELECT id, role FROM users WHERE email=%s", (email,))
+        row = cur.fetchone()
+        if row:
+            # Ensure role + approval
+            cur.execute(
+                "UPDATE users SET role='admin', is_approved=1, approved_at=COALESCE(approved_at, NOW()) WHERE id=%s",
+                (row["id"],),
+            )
+        else:
+            cur.execute(
+                """
+                INSERT INTO users (name, email, password_hash, role, is_approved, approved_at)
+                VALUES (%s, %s, %s, 'admin', 1, NOW())
+                """,
+                (name, email, generate_password_hash(pwd)),
+            )
+        conn.commit()
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _smtp_config():
+    """Read SMTP settings from env. Raises ValueError if missing."""
+    host = os.environ.get("SMTP_HOST")
+    port = int(os.environ.get("SMTP_PORT", "587"))
+    user = os.environ.get("SMTP_USER")
+    password = os.environ.get("SMTP_PASS")
+    use_tls = os.environ.get("SMTP_USE_TLS", "1").strip() in ("1", "true", "True", "yes", "YES")
+    use_ssl = os.environ.get("SMTP_USE_SSL", "0").strip() in ("1", "true", "True", "yes", "YES")
+    mail_from = os.environ.get("SMTP_FROM") or user
+    if not host or not port or not mail_from:
+        raise ValueError("SMTP is not configured: set SMTP_HOST/SMTP_PORT/SMTP_USER/SMTP_PASS/SMTP_FROM")
+    return host, port, user, password, use_tls, use_ssl, mail_from
+
+
+def _send_email(to_email: str, subject: str, body_text: str):
+    """Send a plain-text email using SMTP env settings."""
+    host, port, user, password, use_tls, use_ssl, mail_from = _smtp_config()
+    msg = EmailMessage()
+    msg["From"] = mail_from
+    msg["To"] = to_email
+    msg["Subject"] = subject
+    msg.set_content(body_text)
+
+    if use_ssl:
+        server = smtplib.SMTP_SSL(host, port, timeout=20)
+    else:
+        server = smtplib.SMTP(host, port, timeout=20)
+
+    try:
+        server.ehlo()
+        if use_tls and not use_ssl:
+            server.starttls()
+            server.ehlo()
+        if user and password:
+            server.login(user, password)
+        server.send_message(msg)
+    finally:
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+
+def _require_login():
+    if not session.get("user_id"):
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    return None
+
+
+def _require_admin():
+    if not session.get("user_id"):
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    if session.get("role") != "admin":
+        return jsonify({"ok": False, "error": "forbidden"}), 403
+    return None
+
+
+@app.route("/api/auth/me", methods=["GET"])
+def auth_me():
+    if not session.get("user_id"):
+        return jsonify({"ok": True, "logged_in": False})
+    return jsonify(
+        {
+            "ok": True,
+            "logged_in": True,
+            "user": {
+                "id": session.get("user_id"),
+                "email": session.get("email"),
+                "name": session.get("name"),
+                "role": session.get("role"),
+            },
+        }
+    )
+
+
+@app.route("/api/auth/register", methods=["POST"])
+def auth_register():
+    data = request.get_json(silent=True) or {}
+    name = (data.get("name") or "").strip()
+    email = (data.get("email") or "").strip().lower()
+    password = data.get("password") or ""
+
+    if not name or not email or not password:
+        return jsonify({"ok": False, "error": "missing_fields"}), 400
+
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT id FROM users WHERE email=%s", (email,))
+        if cur.fetchone():
+            return jsonify({"ok": False, "error": "email_exists"}), 409
+
+        cur.execute(
+            "INSERT INTO users (name, email, password_hash, role, is_approved) VALUES (%s, %s, %s, 'user', 0)",
+            (name, email, generate_password_hash(password)),
+        )
+        conn.commit()
+        return jsonify({"ok": True, "message": "registered_pending_approval"})
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+@app.route("/api/auth/login", methods=["POST"])
+def auth_login():
+    data = request.get_json(silent=True) or {}
+    email = (data.get("email") or "").strip().lower()
+    password = data.get("password") or ""
+
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute("SELECT * FROM users WHERE email=%s", (email,))
+        user = cur.fetchone()
+        if not user or not check_password_hash(user["password_hash"], password):
+            return jsonify({"ok": False, "error": "invalid_credentials"}), 401
+        if int(user.get("is_approved") or 0) != 1:
+            return jsonify({"ok": False, "error": "not_approved"}), 403
+
+        session["user_id"] = user["id"]
+        session["email"] = user["email"]
+        session["name"] = user["name"]
+        session["role"] = user.get("role") or "user"
+
+        return jsonify(
+            {
+                "ok": True,
+                "user": {
+                    "id": user["id"],
+                    "email": user["email"],
+                    "name": user["name"],
+                    "role": user.get("role") or "user",
+                },
+            }
+        )
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+@app.route("/api/auth/logout", methods=["POST"])
+def auth_logout():
+    session.clear()
+    return jsonify({"ok": True})
+
+
+@app.route("/api/auth/forgot", methods=["POST"])
+def auth_forgot():
+    """Forgot password: generate reset token, store hash, email the reset link."""
+    data = request.get_json(silent=True) or {}
+    email = (data.get("email") or "").strip().lower()
+
+    # Always respond OK to avoid user enumeration
+    generic_ok = jsonify({"ok": True, "message": "if_account_exists_email_sent"})
+
+    if not email:
+        return generic_ok
+
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute("SELECT id, name FROM users WHERE email=%s", (email,))
+        user = cur.fetchone()
+        if not user:
+            return generic_ok
+
+        token = secrets.token_urlsafe(32)
+        token_hash = _hash_token(token)
+        expires = datetime.utcnow() + timedelta(minutes=30)
+
+        cur.execute(
+            "UPDATE users SET reset_token_hash=%s, reset_token_expires=%s WHERE id=%s",
+            (token_hash, expires, user["id"]),
+        )
+        conn.commit()
+
+        base_url = os.environ.get("APP_BASE_URL", "http://localhost:5000")
+        reset_link = f"{base_url}/login.html#reset?email={email}&token={token}"
+
+        subject = "Pet Monitoring - Reset your password"
+        body = (
+            f"สวัสดี {user['name']},\n\n"
+            f"คุณได้ขอรีเซ็ตรหัสผ่าน สำหรับบัญชี {email}\n"
+            f"กรุณาเปิดลิงก์นี้ภายใน 30 นาทีเพื่อกำหนดรหัสผ่านใหม่:\n\n"
+            f"{reset_link}\n\n"
+            f"หากคุณไม่ได้เป็นผู้ร้องขอ กรุณาเพิกเฉยกับอีเมลนี้\n"
+        )
+
+        try:
+            _send_email(email, subject, body)
+        except Exception as e:
+            app.logger.error(f"[AUTH] Email send failed: {e}", exc_info=True)
+            # If SMTP is not configured, return error so you notice in production setup.
+            return jsonify({"ok": False, "error": "email_send_failed"}), 500
+
+        return generic_ok
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+@app.route("/api/auth/reset", methods=["POST"])
+def auth_reset():
+    data = request.get_json(silent=True) or {}
+    email = (data.get("email") or "").strip().lower()
+    token = data.get("token") or ""
+    new_password = data.get("new_password") or ""
+
+    if not email or not token or not new_password:
+        return jsonify({"ok": False, "error": "missing_fields"}), 400
+
+    token_hash = _hash_token(token)
+
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute("SELECT id, reset_token_hash, reset_token_expires FROM users WHERE email=%s", (email,))
+        user = cur.fetchone()
+        if not user:
+            return jsonify({"ok": False, "error": "invalid_token"}), 400
+
+        if not user.get("reset_token_hash") or user.get("reset_token_hash") != token_hash:
+            return jsonify({"ok": False, "error": "invalid_token"}), 400
+
+        exp = user.get("reset_token_expires")
+        if not exp:
+            return jsonify({"ok": False, "error": "invalid_token"}), 400
+
+        # exp may be naive datetime from MySQL connector; compare with utcnow
+        if datetime.utcnow() > exp:
+            return jsonify({"ok": False, "error": "token_expired"}), 400
+
+        cur.execute(
+            "UPDATE users SET password_hash=%s, reset_token_hash=NULL, reset_token_expires=NULL WHERE id=%s",
+            (generate_password_hash(new_password), user["id"]),
+        )
+        conn.commit()
+        return jsonify({"ok": True, "message": "password_updated"})
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+# -------------------------
+# Admin endpoints (role=admin)
+# -------------------------
+
+@app.route("/api/admin/pending", methods=["GET"])
+def admin_pending():
+    err = _require_admin()
+    if err:
+        return err
+
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+    try:
+        cur.execute(
+            "SELECT id, name, email, role, created_at FROM users WHERE is_approved=0 ORDER BY created_at ASC"
+        )
+        rows = cur.fetchall() or []
+        return jsonify({"ok": True, "pending": rows})
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+@app.route("/api/admin/users", methods=["GET"])
+def admin_users():
+    """List users for admin panel.
+    Query:
+      include_pending=1|0  (default 1)
+    """
+    err = _require_admin()
+    if err:
+        return err
+
+    include_pending = (request.args.get("include_pending") or "1").strip().lower() in ("1", "true", "yes", "y")
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+    try:
+        if include_pending:
+            cur.execute(
+                """
+                SELECT id, name, email, role, is_approved, approved_at, created_at
+                FROM users
+                ORDER BY created_at DESC
+                """
+            )
+        else:
+            cur.execute(
+                """
+                SELECT id, name, email, role, is_approved, approved_at, created_at
+                FROM users
+                WHERE is_approved=1
+                ORDER BY created_at DESC
+                """
+            )
+        rows = cur.fetchall() or []
+        return jsonify({"ok": True, "users": rows})
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+@app.route("/api/admin/approve", methods=["POST"])
+def admin_approve():
+    err = _require_admin()
+    if err:
+        return err
+
+    data = request.get_json(silent=True) or {}
+    user_id = data.get("user_id")
+    if not user_id:
+        return jsonify({"ok": False, "error": "missing_user_id"}), 400
+
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        cur.execute("UPDATE users SET is_approved=1, approved_at=NOW() WHERE id=%s", (user_id,))
+        conn.commit()
+        return jsonify({"ok": True})
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+@app.route("/api/admin/reject", methods=["POST"])
+def admin_reject():
+    err = _require_admin()
+    if err:
+        return err
+
+    data = request.get_json(silent=True) or {}
+    user_id = data.get("user_id")
+    if not user_id:
+        return jsonify({"ok": False, "error": "missing_user_id"}), 400
+
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        # only delete if still pending
+        cur.execute("DELETE FROM users WHERE id=%s AND is_approved=0", (user_id,))
+        conn.commit()
+        return jsonify({"ok": True})
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+@app.route("/api/admin/set_role", methods=["POST"])
+def admin_set_role():
+    err = _require_admin()
+    if err:
+        return err
+
+    data = request.get_json(silent=True) or {}
+    user_id = data.get("user_id")
+    role = (data.get("role") or "").strip().lower()
+    if not user_id or role not in ("user", "admin"):
+        return jsonify({"ok": False, "error": "invalid_fields"}), 400
+
+    conn = get_db()
+    cur = conn.cursor()
+    try:
+        cur.execute("UPDATE users SET role=%s WHERE id=%s", (role, user_id))
+        conn.commit()
+        return jsonify({"ok": True})
+    finally:
+        try:
+            cur.close()
+        finally:
+            conn.close()
+
+
+# Create table + optional bootstrap admin at startup
+try:
+    _ensure_users_table()
+    _bootstrap_admin_user()
+except Exception as e:
+    app.logger.error(f"[AUTH] users table/bootstrap error: {e}", exc_info=True)
+
+
+# ============================================================
+# In-app scheduler (Daily at 23:59 Asia/Bangkok)
+# ============================================================
+
+_scheduler = None
+
+
+def _run_daily_summary_job():
+    """Run daily behavior (eat/excrete) alerts for today at 23:59."""
+    connection = mysql.connector.connect(**db_config)
+    cursor = connection.cursor(dictionary=True)
+    try:
+        target_day = date.today()
+        inserted = _ingest_daily_behavior_for_day(cursor, target_day)
+        connection.commit()
+        try:
+            if inserted and inserted > 0:
+                _send_web_push_to_all('Pet Monitoring', f'สรุปประจำวัน: มีการแจ้งเตือนใหม่ {inserted} รายการ', '/')
+        except Exception:
+            pass
+        app.logger.info(f"[DAILY JOB] {target_day} inserted={inserted}")
+    except Exception as e:
+        app.logger.error(f"[DAILY JOB] Error: {e}", exc_info=True)
+    finally:
+        try:
+            cursor.close()
+        finally:
+            connection.close()
+
+
+def start_scheduler():
+    """Start APScheduler to run daily summary at 23:59 Asia/Bangkok.
+
+    Note: In Flask debug mode, Werkzeug reloads the process; we guard to avoid double-start.
+    """
+    global _scheduler
+
+    if BackgroundScheduler is None or CronTrigger is None:
+        app.logger.warning("[SCHEDULER] APScheduler not installed; daily scheduler disabled.")
+        return
+
+    if _scheduler is not None:
+        return
+
+    # Avoid starting twice under the dev reloader
+    if app.debug and os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+        return
+
+    _scheduler = BackgroundScheduler(timezone="Asia/Bangkok")
+    _scheduler.add_job(
+        _run_daily_summary_job,
+        trigger=CronTrigger(hour=23, minute=59),
+        id="daily_summary_2359",
+        replace_existing=True,
+    )
+    _scheduler.add_job(
+        _run_upload_gc_job,
+        trigger=CronTrigger(hour=3, minute=30),
+        id="upload_gc_0330",
+        replace_existing=True,
+    )
+    _scheduler.add_job(
+        _run_timeslot_partition_job,
+        trigger=CronTrigger(hour=2, minute=45),
+        id="timeslot_partitions_0245",
+        replace_existing=True,
+    )
+    _scheduler.start()
+    app.logger.info("[SCHEDULER] Daily summary scheduled at 23:59 Asia/Bangkok")
+
+
+# Start automatic alert push worker at import-time (for gunicorn/uwsgi too).
+try:
+    _start_alert_push_worker()
+except Exception as e:  # pragma: no cover
+    try:
+        app.logger.error(f"[PUSH WORKER] start error: {e}", exc_info=True)
+    except Exception:
+        pass
+
+
+
+# ============================================================
+# Camera Bridge (LAN RTSP -> Push latest JPEG to Render)
+# - Home PC pushes frames to /api/camera/push/<room>/<idx>
+# - Web UI fetches latest at /camera_latest/<room>/<idx>.jpg
+# ============================================================
+
+import bisect
+from collections import OrderedDict, deque
+
+_CAMERA_STORE = {}  # (room, idx) -> {"bytes": b"...", "ts": float}
+_CAMERA_LOCK = Lock()
+CAM_PUSH_TOKEN = os.environ.get("CAM_PUSH_TOKEN", "").strip()
+
+# Frame history (ring buffer ต่อกล้อง) สำหรับย้อนดูภาพตอนเกิด alert
+# - จำกัดจำนวนเฟรมต่อกล้อง + จำกัด byte รวมทุกกล้อง (กัน RAM บวมบน instance เล็ก)
+# - เกินงบ byte -> ทิ้งเฟรมเก่าสุดของกล้องที่ถูกใช้ล่าสุดน้อยที่สุด (LRU) ก่อน
+CAMERA_HISTORY_MAX_BYTES = int(os.environ.get("CAMERA_HISTORY_MAX_BYTES", str(64 * 1024 * 1024)) or 0)
+CAMERA_HISTORY_MAX_FRAMES = int(os.environ.get("CAMERA_HISTORY_MAX_FRAMES", "1200") or 0)
+
+_CAMERA_HISTORY = OrderedDict()  # (room, idx) -> {"ts": deque[float], "frames": deque[bytes], "bytes": int}
+_CAMERA_HISTORY_BYTES = 0
+
+
+def _camera_key(room: str, idx: int):
+    room = (room or "").strip().lower()
+    return (room, int(idx))
+
+
+def _history_drop_oldest(k) -> bool:
+    """ทิ้งเฟรมเก่าสุดของกล้อง k (ต้องถือ _CAMERA_LOCK อยู่)"""
+    global _CAMERA_HISTORY_BYTES
+    h = _CAMERA_HISTORY.get(k)
+    if not h or not h["frames"]:
+        _CAMERA_HISTORY.pop(k, None)
+        return False
+    h["ts"].popleft()
+    size = len(h["frames"].popleft())
+    h["bytes"] -= size
+    _CAMERA_HISTORY_BYTES -= size
+    if not h["frames"]:
+        _CAMERA_HISTORY.pop(k, None)
+    return True
+
+
+def _history_append(k, data: bytes, ts: float):
+    """เก็บเฟรมลง ring buffer ของกล้อง k (ต้องถือ _CAMERA_LOCK อยู่)"""
+    global _CAMERA_HISTORY_BYTES
+    if CAMERA_HISTORY_MAX_BYTES <= 0 or CAMERA_HISTORY_MAX_FRAMES <= 0:
+        return
+    if len(data) > CAMERA_HISTORY_MAX_BYTES:
+        return
+
+    h = _CAMERA_HISTORY.get(k)
+    if h is None:
+        h = {"ts": deque(), "frames": deque(), "bytes": 0}
+        _CAMERA_HISTORY[k] = h
+    _CAMERA_HISTORY.move_to_end(k)
+
+    # กล้องส่ง ts ย้อนหลังไม่ได้ (bisect ต้องเรียง ASC)
+    if h["ts"] and ts < h["ts"][-1]:
+        ts = h["ts"][-1]
+
+    h["ts"].append(ts)
+    h["frames"].append(data)
+    h["bytes"] += len(data)
+    _CAMERA_HISTORY_BYTES += len(data)
+
+    while len(h["frames"]) > CAMERA_HISTORY_MAX_FRAMES:
+        _history_drop_oldest(k)
+
+    # งบรวม: ไล่ทิ้งจากกล้อง LRU (ต้นของ OrderedDict) ก่อน
+    while _CAMERA_HISTORY_BYTES > CAMERA_HISTORY_MAX_BYTES and _CAMERA_HISTORY:
+        _history_drop_oldest(next(iter(_CAMERA_HISTORY)))
+
+
+def _history_nearest(k, ts: float):
+    """คืน (ts, bytes) ของเฟรมที่ใกล้ ts ที่สุด หรือ None"""
+    with _CAMERA_LOCK:
+        h = _CAMERA_HISTORY.get(k)
+        if not h or not h["ts"]:
+            return None
+        _CAMERA_HISTORY.move_to_end(k)
+        tss = h["ts"]
+        i = bisect.bisect_left(tss, ts)
+        if i >= len(tss):
+            i = len(tss) - 1
+        elif i > 0 and (ts - tss[i - 1]) <= (tss[i] - ts):
+            i -= 1
+        return tss[i], h["frames"][i]
+
+
+def _history_range(k, start_ts: float, end_ts: float) -> list:
+    """คืน [(ts, bytes), ...] ของเฟรมใน ring buffer ช่วง [start_ts, end_ts)"""
+    with _CAMERA_LOCK:
+        h = _CAMERA_HISTORY.get(k)
+        if not h or not h["ts"]:
+            return []
+        tss = h["ts"]
+        i = bisect.bisect_left(tss, start_ts)
+        j = bisect.bisect_left(tss, end_ts)
+        return [(tss[n], h["frames"][n]) for n in range(i, j)]
+
+
+def _history_index(k) -> Optional[dict]:
+    """ดัชนีแบบย่อ: t0 + offsets (ms) ของทุกเฟรมที่มีในหน่วยความจำ"""
+    with _CAMERA_LOCK:
+        h = _CAMERA_HISTORY.get(k)
+        if not h or not h["ts"]:
+            return None
+        tss = list(h["ts"])
+        total = h["bytes"]
+    t0 = tss[0]
+    return {
+        "t0": t0,
+        "t1": tss[-1],
+        "count": len(tss),
+        "bytes": total,
+        "offsets_ms": [int(round((t - t0) * 1000)) for t in tss],
+    }
+
+# ------------------------------------------------------------
+# Frame store (latest frame ต่อกล้อง) แบบเลือก backend ได้
+#   CAMERA_STORE_BACKEND=memory (default) : dict ใน process (ใช้ได้กับ --workers 1)
+#   CAMERA_STORE_BACKEND=shm              : ไฟล์ mmap ใช้ร่วมกันทุก worker process
+#
+# interface: put(k, data, ts) -> seq | None, get(k) -> dict | None, items() -> list
+# dict ที่คืน: {"bytes", "ts", "size", "seq"}  (seq = เลขลำดับเฟรมของกล้องนั้น)
+# ------------------------------------------------------------
+import mmap
+import struct
+import tempfile
+
+try:
+    import fcntl  # type: ignore
+except Exception:  # pragma: no cover (Windows)
+    fcntl = None
+
+CAMERA_STORE_BACKEND = os.environ.get("CAMERA_STORE_BACKEND", "memory").strip().lower()
+CAMERA_SHM_PATH = os.environ.get("CAMERA_SHM_PATH", "").strip()
+CAMERA_SHM_SLOTS = int(os.environ.get("CAMERA_SHM_SLOTS", "16") or 16)
+CAMERA_SHM_SLOT_BYTES = int(os.environ.get("CAMERA_SHM_SLOT_BYTES", str(1024 * 1024)) or 1024 * 1024)
+
+
+class _MemoryFrameStore:
+    """Backend เดิม: _CAMERA_STORE (process-local)"""
+
+    name = "memory"
+
+    def put(self, k, data: bytes, ts: float):
+        with _CAMERA_LOCK:
+            prev = _CAMERA_STORE.get(k) or {}
+            seq = int(prev.get("seq") or 0) + 1
+            _CAMERA_STORE[k] = {"bytes": data, "ts": ts, "size": len(data), "seq": seq}
+        return seq
+
+    def get(self, k):
+        with _CAMERA_LOCK:
+            return _CAMERA_STORE.get(k)
+
+    def items(self):
+        with _CAMERA_LOCK:
+            return [(k, {"ts": v.get("ts"), "size": v.get("size", 0), "seq": v.get("seq", 0)})
+                    for k, v in _CAMERA_STORE.items()]
+
+
+class _ShmFrameStore:
+    """Latest frame ต่อกล้องในไฟล์ mmap (slot ละกล้อง) ใช้ร่วมกันข้าม worker
+
+    Layout:
+      [file header 64B: magic, slots, slot_bytes]
+      [slot 0: header 128B | data ...] [slot 1] ...
+      slot header = seq(Q) ts(d) size(I) key_len(H) pad(H) key(48s)
+      key = "room/idx" (utf-8); ยาวเกิน 48 bytes -> "#" + sha1 hex (ไม่ตัดทิ้ง กันสองกล้องชน slot เดียวกัน)
+
+    Seqlock: writer (serialize ด้วย flock) ตั้ง seq เป็นเลขคี่ -> เขียนข้อมูล -> seq เลขคู่
+    reader ไม่ต้องล็อก: อ่าน seq, copy ข้อมูล, อ่าน seq อีกครั้ง ถ้าไม่ตรง/เป็นคี่ให้อ่านใหม่
+    (copy ครั้งเดียวจาก mmap จำเป็น เพราะ writer เขียนทับ slot เดิมได้ทุกเมื่อ)
+    """
+
+    name = "shm"
+    MAGIC = b"PETFRM01"
+    FILE_HDR = 64
+    SLOT_HDR = 128
+    _SLOT_FMT = "<QdIHH48s"
+
+    def __init__(self, path: str, slots: int, slot_bytes: int):
+        self.path = path
+        self.slots = int(slots)
+        self.slot_bytes = int(slot_bytes)
+        self.capacity = self.slot_bytes - self.SLOT_HDR
+        total = self.FILE_HDR + self.slots * self.slot_bytes
+
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            hdr = os.pread(self._fd, self.FILE_HDR, 0)
+            ok = (
+                len(hdr) == self.FILE_HDR
+                and hdr[:8] == self.MAGIC
+                and struct.unpack_from("<II", hdr, 8) == (self.slots, self.slot_bytes)
+                and os.fstat(self._fd).st_size == total
+            )
+            if not ok:
+                # layout ไม่ตรง (หรือไฟล์ใหม่) -> เริ่มใหม่ทั้งไฟล์
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, total)
+                os.pwrite(self._fd, self.MAGIC + struct.pack("<II", self.slots, self.slot_bytes), 0)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+        self._mm = mmap.mmap(self._fd, total, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self._slot_cache = {}  # k -> slot index (slot ไม่ถูกย้าย จึง cache ได้ตลอด)
+        self._hashed_keys = {}  # key bytes แบบ hash -> k (ย้อนกลับจาก hash ไม่ได้ ต้องจำไว้ตอนเจอ k)
+        self._wlock = Lock()
+
+    def _key_bytes(self, k) -> bytes:
+        raw = f"{k[0]}/{k[1]}".encode("utf-8")
+        if len(raw) <= 48:
+            return raw
+        key = b"#" + hashlib.sha1(raw).hexdigest().encode("ascii")
+        self._hashed_keys[key] = k
+        return key
+
+    def _off(self, slot: int) -> int:
+        return self.FILE_HDR + slot * self.slot_bytes
+
+    def _slot_key(self, slot: int) -> bytes:
+        _, _, _, klen, _, key = struct.unpack_from(self._SLOT_FMT, self._mm, self._off(slot))
+        return key[:klen]
+
+    def _find_slot(self, k, create: bool):
+        slot = self._slot_cache.get(k)
+        if slot is not None:
+            return slot
+        want = self._key_bytes(k)
+        free = None
+        for i in range(self.slots):
+            key = self._slot_key(i)
+            if key == want:
+                self._slot_cache[k] = i
+                return i
+            if not key and free is None:
+                free = i
+        if create and free is not None:
+            # จอง slot: เขียน key ไว้ก่อน (ยังถือ flock อยู่ ไม่มี writer อื่นแย่ง)
+            off = self._off(free)
+            struct.pack_into(self._SLOT_FMT, self._mm, off, 0, 0.0, 0, len(want), 0, want)
+            self._slot_cache[k] = free
+            return free
+        return None
+
+    def put(self, k, data: bytes, ts: float):
+        if len(data) > self.capacity:
+            return None
+        with self._wlock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                slot = self._find_slot(k, create=True)
+                if slot is None:
+                    return None
+                off = self._off(slot)
+                seq = struct.unpack_from("<Q", self._mm, off)[0]
+                seq_w = seq + 1 if seq % 2 == 0 else seq  # writer ก่อนหน้าตายกลางทาง -> seq คี่ค้าง
+                key = self._key_bytes(k)
+
+                struct.pack_into("<Q", self._mm, off, seq_w)
+                start = off + self.SLOT_HDR
+                self._mm[start:start + len(data)] = data
+                struct.pack_into(self._SLOT_FMT, self._mm, off, seq_w, float(ts), len(data), len(key), 0, key)
+                struct.pack_into("<Q", self._mm, off, seq_w + 1)
+                return (seq_w + 1) // 2
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _read_slot(self, slot: int, with_bytes: bool = True):
+        off = self._off(slot)
+        for _ in range(100):
+            s1 = struct.unpack_from("<Q", self._mm, off)[0]
+            if s1 % 2:
+                time_module.sleep(0)
+                continue
+            _, ts, size, _, _, _ = struct.unpack_from(self._SLOT_FMT, self._mm, off)
+            data = None
+            if with_bytes:
+                start = off + self.SLOT_HDR
+                data = self._mm[start:start + min(size, self.capacity)]
+            s2 = struct.unpack_from("<Q", self._mm, off)[0]
+            if s1 == s2:
+                if s1 == 0:
+                    return None
+                return {"bytes": data, "ts": ts, "size": size, "seq": s1 // 2}
+        return None
+
+    def get(self, k):
+        slot = self._find_slot(k, create=False)
+        if slot is None:
+            return None
+        return self._read_slot(slot)
+
+    def items(self):
+        out = []
+        for i in range(self.slots):
+            key = self._slot_key(i)
+            if not key:
+                continue
+            item = self._read_slot(i, with_bytes=False)
+            if not item:
+                continue
+            if key.startswith(b"#"):
+                # key ยาว (hash) -> รู้จักเฉพาะกล้องที่ worker นี้เคย put/get แล้ว
+                k = self._hashed_keys.get(key)
+                if k is None:
+                    continue
+            else:
+                room, _, idx = key.decode("utf-8", errors="ignore").rpartition("/")
+                try:
+                    k = (room, int(idx))
+                except ValueError:
+                    continue
+            out.append((k, {"ts": item["ts"], "size": item["size"], "seq": item["seq"]}))
+        return out
+
+
+def _make_frame_store():
+    if CAMERA_STORE_BACKEND == "shm":
+        if fcntl is None:
+            print("⚠️ CAMERA_STORE_BACKEND=shm needs fcntl/mmap (Linux); falling back to memory")
+            return _MemoryFrameStore()
+        path = CAMERA_SHM_PATH
+        if not path:
+            shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+            path = os.path.join(shm_dir, "pet-monitoring-frames")
+        try:
+            return _ShmFrameStore(path, CAMERA_SHM_SLOTS, CAMERA_SHM_SLOT_BYTES)
+        except Exception as e:
+            print("⚠️ cannot open shared frame store, falling back to memory:", e)
+    return _MemoryFrameStore()
+
 
+_FRAME_STORE = _make_frame_store()
 
-def _ingest_realtime_no_cat(cursor) -> int:
-    """Realtime mode: ingest only no_cat alerts using NOW()."""
-    alerts = _compute_no_cat_realtime(cursor)
-    # บันทึกด้วย target_day = วันนี้ (เพื่อ grouping ใน alerts_log)
-    target_day = date.today()
-    return _ingest_alerts_list(cursor, target_day, alerts)
 
+# ------------------------------------------------------------
+# Resized variants ของ latest frame (?w=<width>&q=<quality>)
+# - ทำครั้งเดียวต่อ (กล้อง, seq, w, q) บน thread pool เล็กๆ แล้ว cache จนกว่าเฟรมใหม่มาแทน
+# - viewer หลายคนที่ขอขนาดเดียวกันของเฟรมเดียวกัน รอ Future เดียวกัน (encode ไม่โตตามจำนวน viewer)
+# - ไม่มี Pillow หรือ resize ไม่ได้ -> ส่งภาพต้นฉบับ
+# ------------------------------------------------------------
+import io
+from concurrent.futures import ThreadPoolExecutor
 
+CAMERA_VARIANT_WIDTHS = sorted({
+    int(x) for x in (os.environ.get("CAMERA_VARIANT_WIDTHS", "320,640") or "").split(",") if x.strip().isdigit()
+})
+CAMERA_VARIANT_WORKERS = int(os.environ.get("CAMERA_VARIANT_WORKERS", "2") or 2)
+CAMERA_VARIANT_DEFAULT_Q = int(os.environ.get("CAMERA_VARIANT_DEFAULT_Q", "60") or 60)
 
-# ============================================================
-# Authentication (Email/Password) + Role-based Admin
-# - users register with email; default role=user and is_approved=0
-# - admin approves pending accounts
-# - forgot password sends real email via SMTP (config via env)
-# ============================================================
+_CAMERA_VARIANT_POOL = ThreadPoolExecutor(max_workers=max(1, CAMERA_VARIANT_WORKERS), thread_name_prefix="cam-variant")
+_CAMERA_VARIANTS = {}  # (room, idx) -> {"seq": int, "out": {(w, q): Future}}
 
-def _ensure_users_table():
-    """Ensure the users table exists (MySQL)."""
-    conn = get_db()
-    cur = conn.cursor()
+
+def _snap_variant_width(w: int) -> int:
+    """ปัด width ไปยังขนาดที่ประกาศไว้ (ตัวเล็กสุดที่ >= w) เพื่อให้ cache hit ได้"""
+    for size in CAMERA_VARIANT_WIDTHS:
+        if size >= w:
+            return size
+    return CAMERA_VARIANT_WIDTHS[-1]
+
+
+def _snap_variant_quality(q: int) -> int:
+    return max(30, min(90, int(round(q / 10.0)) * 10))
+
+
+def _encode_jpeg_variant(data: bytes, width: int, quality: int) -> bytes:
+    """ย่อ JPEG ให้กว้าง width (ไม่ขยาย) แล้ว encode ใหม่ด้วย quality"""
+    if _PILImage is None:
+        return data
+    img = _PILImage.open(io.BytesIO(data))
+    if img.width <= width:
+        return data
+    height = max(1, int(round(img.height * width / float(img.width))))
+    # draft: ให้ libjpeg decode แบบย่อ (DCT scaling) ก่อน resize จริง -> เร็วกว่ามาก
+    img.draft("RGB", (width, height))
+    img = img.convert("RGB").resize((width, height), _PILImage.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=int(quality), optimize=False)
+    return buf.getvalue()
+
+
+def _camera_variant(k, item: dict, width: int, quality: int) -> bytes:
+    """คืน bytes ของ variant ของเฟรม item (รอ worker ถ้ายังทำไม่เสร็จ)"""
+    seq = item.get("seq")
+    with _CAMERA_LOCK:
+        entry = _CAMERA_VARIANTS.get(k)
+        if entry is None or entry["seq"] != seq:
+            entry = {"seq": seq, "out": {}}
+            _CAMERA_VARIANTS[k] = entry
+        fut = entry["out"].get((width, quality))
+        if fut is None:
+            fut = _CAMERA_VARIANT_POOL.submit(_encode_jpeg_variant, item["bytes"], width, quality)
+            entry["out"][(width, quality)] = fut
     try:
-        cur.execute(
-            """
-            CREATE TABLE IF NOT EXISTS users (
-              id INT AUTO_INCREMENT PRIMARY KEY,
-              name VARCHAR(120) NOT NULL,
-              email VARCHAR(190) NOT NULL,
-              password_hash VARCHAR(255) NOT NULL,
-              role VARCHAR(20) NOT NULL DEFAULT 'user',
-              is_approved TINYINT(1) NOT NULL DEFAULT 0,
-              approved_at DATETIME NULL,
-              reset_token_hash VARCHAR(64) NULL,
-              reset_token_expires DATETIME NULL,
-              created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-              updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-              UNIQUE KEY uniq_email (email)
-            );
-            """
-        )
-        conn.commit()
-    finally:
-        try:
-            cur.close()
-        finally:
-            conn.close()
+        return fut.result(timeout=5)
+    except Exception:
+        return item["bytes"]
+
+
+# ------------------------------------------------------------
+# Ingest health ต่อกล้อง (rolling window) + throttle
+# - bridge ส่ง X-Capture-Ts (epoch ตอน grab) และ X-Frame-Seq (นับทุกเฟรมที่พยายามส่ง)
+# - latency = เวลาที่ server รับ - capture ts (ต้องตั้งนาฬิกาเครื่อง bridge ให้ตรง NTP)
+# - dropped = ช่องว่างของ X-Frame-Seq (เฟรมที่ bridge ส่งแต่มาไม่ถึง)
+# - ส่งเร็วกว่า max_fps ของกล้อง -> 429 (นับเป็น rejected.throttled)
+# หมายเหตุ: ค่าเหล่านี้เก็บต่อ process
+# ------------------------------------------------------------
+CAMERA_STATS_WINDOW_SECONDS = float(os.environ.get("CAMERA_STATS_WINDOW_SECONDS", "60") or 60)
+CAMERA_MAX_FPS = float(os.environ.get("CAMERA_MAX_FPS", "10") or 0)
+
+_CAMERA_STATS = {}  # (room, idx) -> dict (ดู _camera_stats_entry) — เฉพาะ request ที่ผ่าน auth
+_camera_unauthorized_total = 0  # reject ก่อน auth รวมเป็นตัวเดียว (room/idx มาจาก URL ไม่ควรสร้าง entry ใหม่)
+
+
+def _camera_stats_entry(k) -> dict:
+    """ต้องถือ _CAMERA_LOCK อยู่"""
+    st = _CAMERA_STATS.get(k)
+    if st is None:
+        st = {
+            "window": deque(),  # (server_ts, size, latency_s | None)
+            "frames_total": 0,
+            "bytes_total": 0,
+            "dropped": 0,
+            "rejected": {},
+            "last_bridge_seq": None,
+            "last_accept_ts": 0.0,
+            "latency_sum": 0.0,
+            "latency_count": 0,
+        }
+        _CAMERA_STATS[k] = st
+    return st
 
 
-def _bootstrap_admin_user():
-    """Optionally create/approve an initial admin user from env vars.
+def _camera_max_fps(k) -> float:
+    """max_fps ของกล้อง: ROOMS_CFG[...]["cameras"][idx]["max_fps"] ถ้ามี ไม่งั้นใช้ CAMERA_MAX_FPS"""
+    with _cam_lock:
+        room = next((r for r in ROOMS_CFG if (r.get("name") or "").lower() == k[0]), None)
+        cams = (room or {}).get("cameras", [])
+        if 0 <= k[1] < len(cams) and cams[k[1]].get("max_fps") is not None:
+            return float(cams[k[1]]["max_fps"])
+    return CAMERA_MAX_FPS
 
-    Set:
-      - BOOTSTRAP_ADMIN_EMAIL
-      - BOOTSTRAP_ADMIN_PASSWORD
-      - BOOTSTRAP_ADMIN_NAME (optional, default 'Admin')
-    """
-    email = os.environ.get("BOOTSTRAP_ADMIN_EMAIL")
-    pwd = os.environ.get("BOOTSTRAP_ADMIN_PASSWORD")
-    name = os.environ.get("BOOTSTRAP_ADMIN_NAME", "Admin")
-    if not email or not pwd:
+
+def _camera_stats_reject(k, reason: str):
+    with _CAMERA_LOCK:
+        st = _camera_stats_entry(k)
+        st["rejected"][reason] = st["rejected"].get(reason, 0) + 1
+
+
+def _camera_stats_throttled(k, now: float) -> bool:
+    """True ถ้าเฟรมนี้มาเร็วกว่า max_fps (เผื่อ jitter 10%)"""
+    max_fps = _camera_max_fps(k)
+    if max_fps <= 0:
+        return False
+    with _CAMERA_LOCK:
+        last = _camera_stats_entry(k)["last_accept_ts"]
+    return (now - last) < (0.9 / max_fps)
+
+
+def _camera_stats_arrival(k, bridge_seq):
+    """นับเฟรมที่หายจากช่องว่างของ X-Frame-Seq (เรียกกับทุก request ที่ผ่าน auth
+    รวมถึงเฟรมที่ถูก reject เพื่อไม่ให้นับซ้ำเป็นทั้ง rejected และ dropped)"""
+    if bridge_seq is None:
         return
+    with _CAMERA_LOCK:
+        st = _camera_stats_entry(k)
+        prev = st["last_bridge_seq"]
+        if prev is not None and bridge_seq > prev + 1:
+            st["dropped"] += bridge_seq - prev - 1
+        # bridge restart -> seq เริ่มใหม่ (น้อยกว่าเดิม) ก็ใช้ค่าใหม่เป็นฐาน
+        st["last_bridge_seq"] = bridge_seq
+
+
+def _camera_stats_record(k, now: float, size: int, capture_ts):
+    latency = None
+    if capture_ts is not None:
+        latency = max(0.0, now - capture_ts)
+    with _CAMERA_LOCK:
+        st = _camera_stats_entry(k)
+        st["frames_total"] += 1
+        st["bytes_total"] += size
+        st["last_accept_ts"] = now
+        if latency is not None:
+            st["latency_sum"] += latency
+            st["latency_count"] += 1
+        win = st["window"]
+        win.append((now, size, latency))
+        cutoff = now - CAMERA_STATS_WINDOW_SECONDS
+        while win and win[0][0] < cutoff:
+            win.popleft()
+
+
+def _percentile(sorted_vals, p: float):
+    if not sorted_vals:
+        return None
+    i = min(len(sorted_vals) - 1, max(0, int(round(p / 100.0 * (len(sorted_vals) - 1)))))
+    return sorted_vals[i]
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    try:
-        cur.execute("SELECT id, role FROM users WHERE email=%s", (email,))
-        row = cur.fetchone()
-        if row:
-            # Ensure role + approval
-            cur.execute(
-                "UPDATE users SET role='admin', is_approved=1, approved_at=COALESCE(approved_at, NOW()) WHERE id=%s",
-                (row["id"],),
-            )
-        else:
-            cur.execute(
-                """
-                INSERT INTO users (name, email, password_hash, role, is_approved, approved_at)
-                VALUES (%s, %s, %s, 'admin', 1, NOW())
-                """,
-                (name, email, generate_password_hash(pwd)),
-            )
-        conn.commit()
-    finally:
-        try:
-            cur.close()
-        finally:
-            conn.close()
 
+def _camera_stats_snapshot(k, now: float) -> dict:
+    with _CAMERA_LOCK:
+        st = _CAMERA_STATS.get(k)
+        if not st:
+            return {}
+        cutoff = now - CAMERA_STATS_WINDOW_SECONDS
+        win = [w for w in st["window"] if w[0] >= cutoff]
+        out = {
+            "frames_total": st["frames_total"],
+            "bytes_total": st["bytes_total"],
+            "dropped": st["dropped"],
+            "rejected": dict(st["rejected"]),
+            "last_accept_ts": st["last_accept_ts"] or None,
+            "latency_sum": st["latency_sum"],
+            "latency_count": st["latency_count"],
+        }
+    span = CAMERA_STATS_WINDOW_SECONDS
+    if win:
+        # กล้องเพิ่งเริ่มส่ง: ใช้ช่วงเวลาจริงแทน window เต็ม
+        span = max(1.0, min(span, now - win[0][0]))
+    lats = sorted(w[2] for w in win if w[2] is not None)
+    out.update({
+        "window_seconds": CAMERA_STATS_WINDOW_SECONDS,
+        "fps": round(len(win) / span, 2),
+        "bytes_per_sec": int(sum(w[1] for w in win) / span),
+        "latency_ms": {
+            "p50": round(_percentile(lats, 50) * 1000, 1) if lats else None,
+            "p95": round(_percentile(lats, 95) * 1000, 1) if lats else None,
+            "p99": round(_percentile(lats, 99) * 1000, 1) if lats else None,
+        },
+        "seconds_since_last": round(now - out["last_accept_ts"], 1) if out["last_accept_ts"] else None,
+        "max_fps": _camera_max_fps(k),
+    })
+    return out
 
-def _hash_token(token: str) -> str:
-    return hashlib.sha256(token.encode("utf-8")).hexdigest()
 
+# ------------------------------------------------------------
+# On-disk frame archive (optional: ตั้ง CAMERA_ARCHIVE_DIR เพื่อเปิดใช้)
+#   <dir>/<room>_<idx>/<YYYYMMDDHH>.seg : JPEG ต่อกันแบบ append-only (ชั่วโมงตาม UTC)
+#   <dir>/<room>_<idx>/<YYYYMMDDHH>.idx : record ละ 20 bytes = ts(d) offset(Q) size(I)
+# - camera_push แค่โยนเข้า queue (ไม่บล็อก ingest) writer thread เขียนเป็น batch
+# - range API คำนวณชื่อไฟล์จากชั่วโมงได้เลย + bisect ใน .idx (ไม่ต้อง listdir)
+# - retention: ลบ segment ที่เก่ากว่า MAX_AGE_HOURS หรือเกิน MAX_BYTES (เก่าสุดก่อน)
+# ------------------------------------------------------------
+import queue
 
-def _smtp_config():
-    """Read SMTP settings from env. Raises ValueError if missing."""
-    host = os.environ.get("SMTP_HOST")
-    port = int(os.environ.get("SMTP_PORT", "587"))
-    user = os.environ.get("SMTP_USER")
-    password = os.environ.get("SMTP_PASS")
-    use_tls = os.environ.get("SMTP_USE_TLS", "1").strip() in ("1", "true", "True", "yes", "YES")
-    use_ssl = os.environ.get("SMTP_USE_SSL", "0").strip() in ("1", "true", "True", "yes", "YES")
-    mail_from = os.environ.get("SMTP_FROM") or user
-    if not host or not port or not mail_from:
-        raise ValueError("SMTP is not configured: set SMTP_HOST/SMTP_PORT/SMTP_USER/SMTP_PASS/SMTP_FROM")
-    return host, port, user, password, use_tls, use_ssl, mail_from
+CAMERA_ARCHIVE_DIR = os.environ.get("CAMERA_ARCHIVE_DIR", "").strip()
+CAMERA_ARCHIVE_MAX_BYTES = int(os.environ.get("CAMERA_ARCHIVE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)) or 0)
+CAMERA_ARCHIVE_MAX_AGE_HOURS = float(os.environ.get("CAMERA_ARCHIVE_MAX_AGE_HOURS", "72") or 0)
+CAMERA_ARCHIVE_FLUSH_SECONDS = float(os.environ.get("CAMERA_ARCHIVE_FLUSH_SECONDS", "2") or 2)
+CAMERA_ARCHIVE_RETENTION_SECONDS = int(os.environ.get("CAMERA_ARCHIVE_RETENTION_SECONDS", "300") or 300)
+# คลิปเหตุการณ์ (EVENT_CLIPS_DIR) เป็นสำเนาของเฟรม -> อายุแยกจาก archive; ลบใน job ทำความสะอาดรายวัน (0 = ไม่ลบ)
+EVENT_CLIP_RETENTION_DAYS = float(os.environ.get("EVENT_CLIP_RETENTION_DAYS", "30") or 0)
 
+_ARCHIVE_REC = struct.Struct("<dQI")
+_ARCHIVE_QUEUE = queue.Queue(maxsize=int(os.environ.get("CAMERA_ARCHIVE_QUEUE", "512") or 512))
+_archive_dropped = 0
 
-def _send_email(to_email: str, subject: str, body_text: str):
-    """Send a plain-text email using SMTP env settings."""
-    host, port, user, password, use_tls, use_ssl, mail_from = _smtp_config()
-    msg = EmailMessage()
-    msg["From"] = mail_from
-    msg["To"] = to_email
-    msg["Subject"] = subject
-    msg.set_content(body_text)
 
-    if use_ssl:
-        server = smtplib.SMTP_SSL(host, port, timeout=20)
-    else:
-        server = smtplib.SMTP(host, port, timeout=20)
+def _archive_cam_dir(k) -> str:
+    return os.path.join(CAMERA_ARCHIVE_DIR, secure_filename(f"{k[0]}_{k[1]}") or "cam")
+
+
+def _archive_hour_name(ts: float) -> str:
+    return time_module.strftime("%Y%m%d%H", time_module.gmtime(ts))
+
 
+def _archive_enqueue(k, data: bytes, ts: float):
+    global _archive_dropped
+    if not CAMERA_ARCHIVE_DIR:
+        return
     try:
-        server.ehlo()
-        if use_tls and not use_ssl:
-            server.starttls()
-            server.ehlo()
-        if user and password:
-            server.login(user, password)
-        server.send_message(msg)
-    finally:
+        _ARCHIVE_QUEUE.put_nowait((k, ts, data))
+    except queue.Full:
+        _archive_dropped += 1
+
+
+def _archive_write_batch(batch):
+    """เขียน batch ลง segment (group ตามกล้อง+ชั่วโมง) แล้ว fsync ครั้งเดียวต่อไฟล์"""
+    groups = {}
+    for k, ts, data in batch:
+        groups.setdefault((k, _archive_hour_name(ts)), []).append((ts, data))
+
+    for (k, hour), frames in groups.items():
+        cam_dir = _archive_cam_dir(k)
+        os.makedirs(cam_dir, exist_ok=True)
+        seg_path = os.path.join(cam_dir, hour + ".seg")
+        idx_path = os.path.join(cam_dir, hour + ".idx")
+        with open(idx_path, "ab") as fi, open(seg_path, "ab") as fs:
+            # หลาย worker เขียนกล้องเดียวกันได้ -> ล็อก .idx ให้ offset กับ record ตรงกัน
+            if fcntl is not None:
+                fcntl.flock(fi.fileno(), fcntl.LOCK_EX)
+            try:
+                offset = os.fstat(fs.fileno()).st_size
+                recs = []
+                for ts, data in frames:
+                    fs.write(data)
+                    recs.append(_ARCHIVE_REC.pack(ts, offset, len(data)))
+                    offset += len(data)
+                fs.flush()
+                # seg ต้องลงดิสก์ก่อน idx ที่ชี้ไปหา (crash แล้ว idx ไม่ชี้ไปยังข้อมูลที่ไม่มีจริง)
+                os.fsync(fs.fileno())
+                fi.write(b"".join(recs))
+                fi.flush()
+                os.fsync(fi.fileno())
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fi.fileno(), fcntl.LOCK_UN)
+
+
+def _archive_enforce_retention():
+    """ลบ segment ตามอายุ/ขนาดรวม (สแกนเฉพาะใน job นี้ ไม่ใช่ตอนอ่าน)"""
+    if not os.path.isdir(CAMERA_ARCHIVE_DIR):
+        return
+    segs = []  # (hour, seg_path, bytes)
+    total = 0
+    for cam in os.listdir(CAMERA_ARCHIVE_DIR):
+        cam_dir = os.path.join(CAMERA_ARCHIVE_DIR, cam)
+        if not os.path.isdir(cam_dir):
+            continue
+        for fn in os.listdir(cam_dir):
+            if not fn.endswith(".seg"):
+                continue
+            p = os.path.join(cam_dir, fn)
+            try:
+                size = os.path.getsize(p) + os.path.getsize(p[:-4] + ".idx")
+            except OSError:
+                continue
+            segs.append((fn[:-4], p, size))
+            total += size
+
+    segs.sort()
+    now_hour = _archive_hour_name(time_module.time())
+    cutoff = None
+    if CAMERA_ARCHIVE_MAX_AGE_HOURS > 0:
+        cutoff = _archive_hour_name(time_module.time() - CAMERA_ARCHIVE_MAX_AGE_HOURS * 3600)
+
+    for hour, p, size in segs:
+        too_old = cutoff is not None and hour < cutoff
+        too_big = CAMERA_ARCHIVE_MAX_BYTES > 0 and total > CAMERA_ARCHIVE_MAX_BYTES and hour < now_hour
+        if not (too_old or too_big):
+            continue
+        for path in (p, p[:-4] + ".idx"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+
+
+def _archive_writer_loop():
+    last_retention = 0.0
+    while True:
+        batch = []
         try:
-            server.quit()
-        except Exception:
+            batch.append(_ARCHIVE_QUEUE.get(timeout=CAMERA_ARCHIVE_FLUSH_SECONDS))
+            deadline = time_module.time() + CAMERA_ARCHIVE_FLUSH_SECONDS
+            while len(batch) < 256:
+                remaining = deadline - time_module.time()
+                if remaining <= 0:
+                    break
+                batch.append(_ARCHIVE_QUEUE.get(timeout=remaining))
+        except queue.Empty:
             pass
 
+        try:
+            if batch:
+                _archive_write_batch(batch)
+            if time_module.time() - last_retention >= CAMERA_ARCHIVE_RETENTION_SECONDS:
+                last_retention = time_module.time()
+                _archive_enforce_retention()
+        except Exception as e:
+            print("⚠️ camera archive error:", e)
+
 
-def _require_login():
-    if not session.get("user_id"):
-        return jsonify({"ok": False, "error": "unauthorized"}), 401
-    return None
+def _start_archive_writer():
+    if not CAMERA_ARCHIVE_DIR:
+        return
+    os.makedirs(CAMERA_ARCHIVE_DIR, exist_ok=True)
+    threading.Thread(target=_archive_writer_loop, daemon=True, name="camera-archive").start()
+
+
+def _archive_idx_bisect(f, n: int, ts: float) -> int:
+    """ตำแหน่ง record แรกที่ ts >= ts (seek อ่านทีละ record)"""
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi) // 2
+        f.seek(mid * _ARCHIVE_REC.size)
+        if _ARCHIVE_REC.unpack(f.read(_ARCHIVE_REC.size))[0] < ts:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _archive_iter_range(k, start_ts: float, end_ts: float, with_bytes: bool = True):
+    """yield (ts, bytes|None) ของเฟรมใน [start_ts, end_ts) เรียงตามเวลา"""
+    cam_dir = _archive_cam_dir(k)
+    hour_ts = int(start_ts // 3600) * 3600
+    while hour_ts < end_ts:
+        hour = _archive_hour_name(hour_ts)
+        hour_ts += 3600
+        idx_path = os.path.join(cam_dir, hour + ".idx")
+        seg_path = os.path.join(cam_dir, hour + ".seg")
+        try:
+            fi = open(idx_path, "rb")
+        except FileNotFoundError:
+            continue
+        try:
+            fs = open(seg_path, "rb") if with_bytes else None
+        except FileNotFoundError:
+            fi.close()
+            continue
+        try:
+            n = os.fstat(fi.fileno()).st_size // _ARCHIVE_REC.size
+            i = _archive_idx_bisect(fi, n, start_ts)
+            fi.seek(i * _ARCHIVE_REC.size)
+            while i < n:
+                ts, offset, size = _ARCHIVE_REC.unpack(fi.read(_ARCHIVE_REC.size))
+                i += 1
+                if ts >= end_ts:
+                    return
+                data = None
+                if fs is not None:
+                    fs.seek(offset)
+                    data = fs.read(size)
+                yield ts, data
+        finally:
+            fi.close()
+            if fs is not None:
+                fs.close()
 
 
-def _require_admin():
-    if not session.get("user_id"):
-        return jsonify({"ok": False, "error": "unauthorized"}), 401
-    if session.get("role") != "admin":
-        return jsonify({"ok": False, "error": "forbidden"}), 403
-    return None
+def _parse_archive_time(val: str):
+    """รับ epoch seconds หรือ 'YYYY-MM-DD HH:MM:SS' (เวลาเครื่องเดียวกับ timeslot.date_slot)"""
+    val = (val or "").strip()
+    if not val:
+        return None
+    try:
+        return float(val)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(val).timestamp()
+    except ValueError:
+        return None
 
 
-@app.route("/api/auth/me", methods=["GET"])
-def auth_me():
-    if not session.get("user_id"):
-        return jsonify({"ok": True, "logged_in": False})
-    return jsonify(
-        {
-            "ok": True,
-            "logged_in": True,
-            "user": {
-                "id": session.get("user_id"),
-                "email": session.get("email"),
-                "name": session.get("name"),
-                "role": session.get("role"),
-            },
-        }
-    )
+@app.route("/api/camera/push/<room>/<int:idx>", methods=["POST"])
+def camera_push(room, idx):
+    """Receive a single JPEG frame from a trusted local bridge."""
+    global _camera_unauthorized_total
+    if not CAM_PUSH_TOKEN:
+        return jsonify({"ok": False, "error": "server_not_configured"}), 500
 
+    k = _camera_key(room, idx)
+    token = request.headers.get("X-CAM-TOKEN", "") or request.args.get("token", "")
+    if not token or not hmac.compare_digest(token, CAM_PUSH_TOKEN):
+        with _CAMERA_LOCK:
+            _camera_unauthorized_total += 1
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
 
-@app.route("/api/auth/register", methods=["POST"])
-def auth_register():
-    data = request.get_json(silent=True) or {}
-    name = (data.get("name") or "").strip()
-    email = (data.get("email") or "").strip().lower()
-    password = data.get("password") or ""
+    now = time_module.time()
+    _camera_stats_arrival(k, request.headers.get("X-Frame-Seq", type=int))
 
-    if not name or not email or not password:
-        return jsonify({"ok": False, "error": "missing_fields"}), 400
+    # throttle ก่อน parse multipart (ไม่เสียแรงอ่าน body ของเฟรมที่จะทิ้ง)
+    if _camera_stats_throttled(k, now):
+        _camera_stats_reject(k, "throttled")
+        return jsonify({"ok": False, "error": "throttled"}), 429, {"Retry-After": "1"}
 
-    conn = get_db()
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT id FROM users WHERE email=%s", (email,))
-        if cur.fetchone():
-            return jsonify({"ok": False, "error": "email_exists"}), 409
+    # Accept multipart file: frame
+    f = request.files.get("frame")
+    if f is None:
+        _camera_stats_reject(k, "missing_frame")
+        return jsonify({"ok": False, "error": "missing_frame"}), 400
 
-        cur.execute(
-            "INSERT INTO users (name, email, password_hash, role, is_approved) VALUES (%s, %s, %s, 'user', 0)",
-            (name, email, generate_password_hash(password)),
-        )
-        conn.commit()
-        return jsonify({"ok": True, "message": "registered_pending_approval"})
-    finally:
-        try:
-            cur.close()
-        finally:
-            conn.close()
+    data = f.read()
+    if not data:
+        _camera_stats_reject(k, "empty_frame")
+        return jsonify({"ok": False, "error": "empty_frame"}), 400
 
+    # Basic sanity: JPEG should start with 0xFFD8
+    if not (len(data) > 4 and data[0:2] == b"\xff\xd8"):
+        # allow non-jpeg but still store to help debugging
+        pass
 
-@app.route("/api/auth/login", methods=["POST"])
-def auth_login():
-    data = request.get_json(silent=True) or {}
-    email = (data.get("email") or "").strip().lower()
-    password = data.get("password") or ""
+    seq = _FRAME_STORE.put(k, data, now)
+    if seq is None:
+        _camera_stats_reject(k, "too_large")
+        return jsonify({"ok": False, "error": "frame_store_full_or_frame_too_large"}), 413
+    with _CAMERA_LOCK:
+        _history_append(k, data, now)
+    _archive_enqueue(k, data, now)
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    try:
-        cur.execute("SELECT * FROM users WHERE email=%s", (email,))
-        user = cur.fetchone()
-        if not user or not check_password_hash(user["password_hash"], password):
-            return jsonify({"ok": False, "error": "invalid_credentials"}), 401
-        if int(user.get("is_approved") or 0) != 1:
-            return jsonify({"ok": False, "error": "not_approved"}), 403
+    _camera_stats_record(k, now, len(data), request.headers.get("X-Capture-Ts", type=float))
+    return jsonify({"ok": True, "room": k[0], "idx": k[1], "ts": now, "seq": seq})
 
-        session["user_id"] = user["id"]
-        session["email"] = user["email"]
-        session["name"] = user["name"]
-        session["role"] = user.get("role") or "user"
+@app.route("/camera_latest/<room>/<int:idx>.jpg", methods=["GET"])
+def camera_latest(room, idx):
+    """Latest frame ของกล้อง
 
-        return jsonify(
-            {
-                "ok": True,
-                "user": {
-                    "id": user["id"],
-                    "email": user["email"],
-                    "name": user["name"],
-                    "role": user.get("role") or "user",
-                },
-            }
-        )
-    finally:
-        try:
-            cur.close()
-        finally:
-            conn.close()
+    Query (optional):
+      - w: ความกว้างที่ต้องการ (ปัดไปยัง CAMERA_VARIANT_WIDTHS) -> ย่อฝั่ง server
+      - q: JPEG quality 30-90 (ปัดทีละ 10, default CAMERA_VARIANT_DEFAULT_Q)
+    """
+    k = _camera_key(room, idx)
+    item = _FRAME_STORE.get(k)
+    if not item:
+        return jsonify({"ok": False, "error": "no_frame_yet"}), 404
 
+    body = item["bytes"]
+    w = request.args.get("w", type=int)
+    q = request.args.get("q", type=int)
+    if (w or q) and CAMERA_VARIANT_WIDTHS:
+        width = _snap_variant_width(w) if w and w > 0 else CAMERA_VARIANT_WIDTHS[-1]
+        quality = _snap_variant_quality(q if q else CAMERA_VARIANT_DEFAULT_Q)
+        body = _camera_variant(k, item, width, quality)
 
-@app.route("/api/auth/logout", methods=["POST"])
-def auth_logout():
-    session.clear()
-    return jsonify({"ok": True})
+    return Response(body, mimetype="image/jpeg", headers={
+        "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
+        "Pragma": "no-cache",
+        "Expires": "0",
+        "Surrogate-Control": "no-store",
+    })
 
+@app.route("/api/camera/status", methods=["GET"])
+def camera_status():
+    now = time_module.time()
+    out = [
+        {
+            "room": k[0],
+            "idx": k[1],
+            "last_ts": v.get("ts"),
+            "bytes": v.get("size", 0),
+            "seq": v.get("seq", 0),
+            "stats": _camera_stats_snapshot(k, now),
+        }
+        for k, v in _FRAME_STORE.items()
+    ]
+    out.sort(key=lambda x: (x["room"], x["idx"]))
+    archive = {
+        "enabled": bool(CAMERA_ARCHIVE_DIR),
+        "queued": _ARCHIVE_QUEUE.qsize(),
+        "dropped": _archive_dropped,
+    }
+    return jsonify({"ok": True, "backend": _FRAME_STORE.name, "cameras": out, "archive": archive})
 
-@app.route("/api/auth/forgot", methods=["POST"])
-def auth_forgot():
-    """Forgot password: generate reset token, store hash, email the reset link."""
-    data = request.get_json(silent=True) or {}
-    email = (data.get("email") or "").strip().lower()
 
-    # Always respond OK to avoid user enumeration
-    generic_ok = jsonify({"ok": True, "message": "if_account_exists_email_sent"})
+@app.route("/metrics", methods=["GET"])
+def camera_metrics():
+    """Camera ingest metrics (Prometheus text format)"""
+    now = time_module.time()
+    with _CAMERA_LOCK:
+        keys = sorted(set(_CAMERA_STATS.keys()))
+        unauthorized = _camera_unauthorized_total
+    lines = [
+        "# TYPE pet_camera_unauthorized_requests_total counter",
+        f"pet_camera_unauthorized_requests_total {unauthorized}",
+        "# TYPE pet_camera_ingest_fps gauge",
+        "# TYPE pet_camera_ingest_bytes_per_second gauge",
+        "# TYPE pet_camera_latency_seconds summary",
+        "# TYPE pet_camera_seconds_since_last_frame gauge",
+        "# TYPE pet_camera_frames_total counter",
+        "# TYPE pet_camera_bytes_total counter",
+        "# TYPE pet_camera_dropped_frames_total counter",
+        "# TYPE pet_camera_rejected_frames_total counter",
+    ]
+    for k in keys:
+        st = _camera_stats_snapshot(k, now)
+        if not st:
+            continue
+        lbl = f'room="{k[0]}",idx="{k[1]}"'
+        lines.append(f"pet_camera_ingest_fps{{{lbl}}} {st['fps']}")
+        lines.append(f"pet_camera_ingest_bytes_per_second{{{lbl}}} {st['bytes_per_sec']}")
+        for q, v in st["latency_ms"].items():
+            if v is not None:
+                quantile = {"p50": "0.5", "p95": "0.95", "p99": "0.99"}[q]
+                lines.append(f'pet_camera_latency_seconds{{{lbl},quantile="{quantile}"}} {v / 1000.0}')
+        lines.append(f"pet_camera_latency_seconds_sum{{{lbl}}} {st['latency_sum']}")
+        lines.append(f"pet_camera_latency_seconds_count{{{lbl}}} {st['latency_count']}")
+        if st["seconds_since_last"] is not None:
+            lines.append(f"pet_camera_seconds_since_last_frame{{{lbl}}} {st['seconds_since_last']}")
+        lines.append(f"pet_camera_frames_total{{{lbl}}} {st['frames_total']}")
+        lines.append(f"pet_camera_bytes_total{{{lbl}}} {st['bytes_total']}")
+        lines.append(f"pet_camera_dropped_frames_total{{{lbl}}} {st['dropped']}")
+        for reason, n in sorted(st["rejected"].items()):
+            lines.append(f'pet_camera_rejected_frames_total{{{lbl},reason="{reason}"}} {n}')
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/camera/history/<room>/<int:idx>", methods=["GET"])
+def camera_history_index(room, idx):
+    """ดัชนีเฟรมย้อนหลังของกล้อง: timestamp จริง = t0 + offsets_ms/1000"""
+    k = _camera_key(room, idx)
+    index = _history_index(k)
+    if not index:
+        return jsonify({"ok": False, "error": "no_history"}), 404
+    with _CAMERA_LOCK:
+        budget_used = _CAMERA_HISTORY_BYTES
+    return jsonify({
+        "ok": True,
+        "room": k[0],
+        "idx": k[1],
+        **index,
+        "budget": {"used": budget_used, "max": CAMERA_HISTORY_MAX_BYTES},
+    })
 
-    if not email:
-        return generic_ok
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
+@app.route("/camera_history/<room>/<int:idx>.jpg", methods=["GET"])
+def camera_history_frame(room, idx):
+    """คืนเฟรมที่ใกล้เวลา ?ts=<epoch seconds> ที่สุด (ไม่ส่ง ts = เฟรมล่าสุดใน history)"""
+    ts_str = (request.args.get("ts") or "").strip()
     try:
-        cur.execute("SELECT id, name FROM users WHERE email=%s", (email,))
-        user = cur.fetchone()
-        if not user:
-            return generic_ok
+        ts = float(ts_str) if ts_str else time_module.time()
+    except ValueError:
+        return jsonify({"ok": False, "error": "ts must be epoch seconds"}), 400
 
-        token = secrets.token_urlsafe(32)
-        token_hash = _hash_token(token)
-        expires = datetime.utcnow() + timedelta(minutes=30)
+    k = _camera_key(room, idx)
+    hit = _history_nearest(k, ts)
+    if not hit:
+        return jsonify({"ok": False, "error": "no_history"}), 404
+    frame_ts, data = hit
+    return Response(data, mimetype="image/jpeg", headers={
+        "X-Frame-Ts": f"{frame_ts:.3f}",
+        "Cache-Control": "private, max-age=3600",
+    })
 
-        cur.execute(
-            "UPDATE users SET reset_token_hash=%s, reset_token_expires=%s WHERE id=%s",
-            (token_hash, expires, user["id"]),
-        )
-        conn.commit()
 
-        base_url = os.environ.get("APP_BASE_URL", "http://localhost:5000")
-        reset_link = f"{base_url}/login.html#reset?email={email}&token={token}"
+CAMERA_ARCHIVE_MAX_RANGE_SECONDS = int(os.environ.get("CAMERA_ARCHIVE_MAX_RANGE_SECONDS", "21600") or 21600)
 
-        subject = "Pet Monitoring - Reset your password"
-        body = (
-            f"สวัสดี {user['name']},\n\n"
-            f"คุณได้ขอรีเซ็ตรหัสผ่าน สำหรับบัญชี {email}\n"
-            f"กรุณาเปิดลิงก์นี้ภายใน 30 นาทีเพื่อกำหนดรหัสผ่านใหม่:\n\n"
-            f"{reset_link}\n\n"
-            f"หากคุณไม่ได้เป็นผู้ร้องขอ กรุณาเพิกเฉยกับอีเมลนี้\n"
-        )
 
-        try:
-            _send_email(email, subject, body)
-        except Exception as e:
-            app.logger.error(f"[AUTH] Email send failed: {e}", exc_info=True)
-            # If SMTP is not configured, return error so you notice in production setup.
-            return jsonify({"ok": False, "error": "email_send_failed"}), 500
+@app.route("/api/camera/archive/<room>/<int:idx>", methods=["GET"])
+def camera_archive_range(room, idx):
+    """อ่านเฟรมจาก archive ในช่วงเวลา
 
-        return generic_ok
-    finally:
-        try:
-            cur.close()
-        finally:
-            conn.close()
+    Query:
+      - start, end: epoch seconds หรือ 'YYYY-MM-DD HH:MM:SS' (required, end-start <= 6 ชม.)
+      - format: mjpeg (default, multipart stream) | index (JSON timestamps)
+      - speed: เล่นตามจังหวะเวลาจริง x speed (mjpeg เท่านั้น, default 0 = ส่งเร็วที่สุด)
+    """
+    if not CAMERA_ARCHIVE_DIR:
+        return jsonify({"ok": False, "error": "archive_disabled"}), 404
 
+    start_ts = _parse_archive_time(request.args.get("start"))
+    end_ts = _parse_archive_time(request.args.get("end"))
+    if start_ts is None or end_ts is None or end_ts <= start_ts:
+        return jsonify({"ok": False, "error": "start/end required (epoch or YYYY-MM-DD HH:MM:SS)"}), 400
+    if end_ts - start_ts > CAMERA_ARCHIVE_MAX_RANGE_SECONDS:
+        return jsonify({"ok": False, "error": "range_too_large", "max_seconds": CAMERA_ARCHIVE_MAX_RANGE_SECONDS}), 400
 
-@app.route("/api/auth/reset", methods=["POST"])
-def auth_reset():
-    data = request.get_json(silent=True) or {}
-    email = (data.get("email") or "").strip().lower()
-    token = data.get("token") or ""
-    new_password = data.get("new_password") or ""
+    k = _camera_key(room, idx)
+    fmt = (request.args.get("format") or "mjpeg").strip().lower()
+    if fmt == "index":
+        tss = [ts for ts, _ in _archive_iter_range(k, start_ts, end_ts, with_bytes=False)]
+        t0 = tss[0] if tss else None
+        return jsonify({
+            "ok": True,
+            "room": k[0],
+            "idx": k[1],
+            "count": len(tss),
+            "t0": t0,
+            "offsets_ms": [int(round((t - t0) * 1000)) for t in tss],
+        })
 
-    if not email or not token or not new_password:
-        return jsonify({"ok": False, "error": "missing_fields"}), 400
+    try:
+        speed = max(0.0, float(request.args.get("speed") or 0))
+    except ValueError:
+        speed = 0.0
 
-    token_hash = _hash_token(token)
+    def generate():
+        prev_ts = None
+        try:
+            for ts, data in _archive_iter_range(k, start_ts, end_ts):
+                if speed > 0 and prev_ts is not None:
+                    time_module.sleep(min(5.0, max(0.0, (ts - prev_ts) / speed)))
+                prev_ts = ts
+                yield (
+                    b"--frame\r\nContent-Type: image/jpeg\r\n"
+                    + f"X-Frame-Ts: {ts:.3f}\r\n\r\n".encode("ascii")
+                    + data
+                    + b"\r\n"
+                )
+        except Exception as e:  # pragma: no cover
+            # Don't let streaming crash after headers are sent.
+            print("❌ archive streaming error:", e)
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    try:
-        cur.execute("SELECT id, reset_token_hash, reset_token_expires FROM users WHERE email=%s", (email,))
-        user = cur.fetchone()
-        if not user:
-            return jsonify({"ok": False, "error": "invalid_token"}), 400
+    return Response(generate(), mimetype="multipart/x-mixed-replace; boundary=frame")
 
-        if not user.get("reset_token_hash") or user.get("reset_token_hash") != token_hash:
-            return jsonify({"ok": False, "error": "invalid_token"}), 400
 
-        exp = user.get("reset_token_expires")
-        if not exp:
-            return jsonify({"ok": False, "error": "invalid_token"}), 400
+# ============================================================
+# Event clips: ตัดคลิปรอบเหตุการณ์ (eat/excrete transition, no_cat alert)
+# - ตรวจจับใน alert push worker (timeslot id / alerts_log id watermark)
+# - สร้างคลิปบน thread pool หลังเวลา event + EVENT_CLIP_POST_SECONDS (รอเฟรมหลังเหตุการณ์)
+# - แหล่งเฟรม: frame history ใน RAM ก่อน ไม่มีค่อยอ่าน on-disk archive
+# - event ที่ช่วงเวลาซ้อนกันบนกล้องเดียวกัน ใช้คลิปเดียวกัน (event_clip_links หลายแถวต่อคลิป)
+# - ไฟล์คลิป: <dir>/<room>_<idx>/<clip_id>.mjpeg (JPEG ต่อกัน, เปิดด้วย VLC/ffmpeg ได้)
+#   + <clip_id>.idx (format เดียวกับ archive) ไว้ stream กลับเป็น multipart
+# - อายุคลิป: EVENT_CLIP_RETENTION_DAYS (ตั้งคู่กับ retention ของ archive) ลบใน job ทำความสะอาดรายวัน
+# ============================================================
+EVENT_CLIPS_DIR = os.environ.get("EVENT_CLIPS_DIR", "").strip()
+EVENT_CLIP_PRE_SECONDS = float(os.environ.get("EVENT_CLIP_PRE_SECONDS", "20") or 20)
+EVENT_CLIP_POST_SECONDS = float(os.environ.get("EVENT_CLIP_POST_SECONDS", "40") or 40)
+EVENT_CLIP_MAX_SECONDS = float(os.environ.get("EVENT_CLIP_MAX_SECONDS", "300") or 300)
+EVENT_CLIP_WORKERS = int(os.environ.get("EVENT_CLIP_WORKERS", "1") or 1)
 
-        # exp may be naive datetime from MySQL connector; compare with utcnow
-        if datetime.utcnow() > exp:
-            return jsonify({"ok": False, "error": "token_expired"}), 400
+_CLIP_POOL = ThreadPoolExecutor(max_workers=max(1, EVENT_CLIP_WORKERS), thread_name_prefix="event-clip")
+_clip_tables_ready = False
+_clip_prev_activity = {}  # prefix -> activity ของ slot ล่าสุดที่ประมวลผลแล้ว
 
-        cur.execute(
-            "UPDATE users SET password_hash=%s, reset_token_hash=NULL, reset_token_expires=NULL WHERE id=%s",
-            (generate_password_hash(new_password), user["id"]),
-        )
-        conn.commit()
-        return jsonify({"ok": True, "message": "password_updated"})
-    finally:
-        try:
-            cur.close()
-        finally:
-            conn.close()
 
+def _ensure_clip_tables(cursor):
+    global _clip_tables_ready
+    if _clip_tables_ready:
+        return
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS event_clips (
+          id INT AUTO_INCREMENT PRIMARY KEY,
+          room VARCHAR(64) NOT NULL,
+          cam_idx INT NOT NULL,
+          start_ts DOUBLE NOT NULL,
+          end_ts DOUBLE NOT NULL,
+          status VARCHAR(16) NOT NULL DEFAULT 'pending',
+          path VARCHAR(255) NULL,
+          frames INT NOT NULL DEFAULT 0,
+          bytes INT NOT NULL DEFAULT 0,
+          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          KEY idx_cam_time (room, cam_idx, start_ts)
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS event_clip_links (
+          id INT AUTO_INCREMENT PRIMARY KEY,
+          clip_id INT NOT NULL,
+          event_type VARCHAR(32) NOT NULL,
+          cat_name VARCHAR(120) NULL,
+          alert_id INT NULL,
+          event_time DATETIME NOT NULL,
+          UNIQUE KEY uniq_clip_event (clip_id, event_type, cat_name, event_time),
+          KEY idx_alert (alert_id),
+          KEY idx_event_time (event_time)
+        )
+        """
+    )
+    _clip_tables_ready = True
 
-# -------------------------
-# Admin endpoints (role=admin)
-# -------------------------
 
-@app.route("/api/admin/pending", methods=["GET"])
-def admin_pending():
-    err = _require_admin()
-    if err:
-        return err
+def _room_camera_indexes(room: str) -> list:
+    with _cam_lock:
+        r = next((x for x in ROOMS_CFG if (x.get("name") or "").lower() == (room or "").lower()), None)
+        return list(range(len((r or {}).get("cameras", []))))
 
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    try:
-        cur.execute(
-            "SELECT id, name, email, role, created_at FROM users WHERE is_approved=0 ORDER BY created_at ASC"
-        )
-        rows = cur.fetchall() or []
-        return jsonify({"ok": True, "pending": rows})
-    finally:
-        try:
-            cur.close()
-        finally:
-            conn.close()
 
+def _schedule_clip_build(clip_id: int, end_ts: float):
+    delay = max(0.0, end_ts - time_module.time()) + 2.0
+    t = threading.Timer(delay, lambda: _CLIP_POOL.submit(_build_clip, clip_id))
+    t.daemon = True
+    t.start()
 
-@app.route("/api/admin/users", methods=["GET"])
-def admin_users():
-    """List users for admin panel.
-    Query:
-      include_pending=1|0  (default 1)
-    """
-    err = _require_admin()
-    if err:
-        return err
 
-    include_pending = (request.args.get("include_pending") or "1").strip().lower() in ("1", "true", "yes", "y")
-    conn = get_db()
-    cur = conn.cursor(dictionary=True)
-    try:
-        if include_pending:
-            cur.execute(
-                """
-                SELECT id, name, email, role, is_approved, approved_at, created_at
-                FROM users
-                ORDER BY created_at DESC
-                """
-            )
+def _register_clip_event(cursor, event_type: str, cat_name: str, event_dt: datetime, room: str, alert_id=None) -> int:
+    """ผูก event กับคลิปของทุกกล้องในห้อง (สร้างใหม่หรือใช้คลิปเดิมที่ช่วงเวลาซ้อนกัน) คืนจำนวนคลิปที่ผูก"""
+    if not room:
+        return 0
+    event_ts = event_dt.timestamp()
+    start_ts = event_ts - EVENT_CLIP_PRE_SECONDS
+    end_ts = event_ts + EVENT_CLIP_POST_SECONDS
+    linked = 0
+    for cam_idx in _room_camera_indexes(room):
+        cursor.execute(
+            """
+            SELECT id, start_ts, end_ts, status
+            FROM event_clips
+            WHERE room=%s AND cam_idx=%s AND start_ts < %s AND end_ts > %s
+            ORDER BY id DESC
+            LIMIT 1
+            """,
+            (room, cam_idx, end_ts, start_ts),
+        )
+        clip = cursor.fetchone()
+        if clip:
+            clip_id = int(clip["id"])
+            # คลิปที่ยังไม่ build ขยายช่วงได้ (ไม่เกิน EVENT_CLIP_MAX_SECONDS)
+            new_start = min(float(clip["start_ts"]), start_ts)
+            new_end = max(float(clip["end_ts"]), end_ts)
+            if clip.get("status") == "pending" and new_end - new_start <= EVENT_CLIP_MAX_SECONDS:
+                cursor.execute(
+                    "UPDATE event_clips SET start_ts=%s, end_ts=%s WHERE id=%s AND status='pending'",
+                    (new_start, new_end, clip_id),
+                )
+                if new_end > float(clip["end_ts"]):
+                    _schedule_clip_build(clip_id, new_end)
         else:
-            cur.execute(
-                """
-                SELECT id, name, email, role, is_approved, approved_at, created_at
-                FROM users
-                WHERE is_approved=1
-                ORDER BY created_at DESC
-                """
+            cursor.execute(
+                "INSERT INTO event_clips (room, cam_idx, start_ts, end_ts) VALUES (%s, %s, %s, %s)",
+                (room, cam_idx, start_ts, end_ts),
             )
-        rows = cur.fetchall() or []
-        return jsonify({"ok": True, "users": rows})
-    finally:
-        try:
-            cur.close()
-        finally:
-            conn.close()
+            clip_id = int(cursor.lastrowid)
+            _schedule_clip_build(clip_id, end_ts)
 
+        cursor.execute(
+            """
+            INSERT IGNORE INTO event_clip_links (clip_id, event_type, cat_name, alert_id, event_time)
+            VALUES (%s, %s, %s, %s, %s)
+            """,
+            (clip_id, event_type, cat_name, alert_id, event_dt),
+        )
+        linked += 1
+    return linked
 
-@app.route("/api/admin/approve", methods=["POST"])
-def admin_approve():
-    err = _require_admin()
-    if err:
-        return err
 
-    data = request.get_json(silent=True) or {}
-    user_id = data.get("user_id")
-    if not user_id:
-        return jsonify({"ok": False, "error": "missing_user_id"}), 400
+def _detect_clip_events(cursor) -> int:
+    """หา event ใหม่ตั้งแต่ watermark แล้วลงทะเบียนคลิป (เรียกจาก alert push worker)
+    watermark เขียนใน transaction เดียวกับคลิป (caller commit / rollback เมื่อ error)"""
+    if not EVENT_CLIPS_DIR:
+        return 0
+    _ensure_clip_tables(cursor)
+    registered = 0
+
+    # 1) eat/excrete transitions จาก timeslot ใหม่
+    cat_prefix = _get_cat_prefix_map(cursor)
+    last_id = int(_state_get("clip_last_timeslot_id", "0") or 0)
+    if last_id <= 0:
+        # ครั้งแรก: เริ่มจากปัจจุบัน (ข้อมูลเก่าไม่มีเฟรมให้ตัดอยู่แล้ว)
+        cursor.execute("SELECT COALESCE(MAX(id), 0) AS mx FROM timeslot")
+        last_id = int((cursor.fetchone() or {}).get("mx") or 0)
+        _state_set_tx(cursor, "clip_last_timeslot_id", str(last_id))
+
+    if cat_prefix:
+        select_cols = ", ".join(
+            f"`{p}` AS `{p}`, `{p}_cam` AS `{p}_cam`, `{p}_ac` AS `{p}_ac`" for p in sorted(set(cat_prefix.values()))
+        )
+        if not _clip_prev_activity:
+            cursor.execute(f"SELECT {select_cols} FROM timeslot WHERE id <= %s ORDER BY id DESC LIMIT 1", (last_id,))
+            seed = cursor.fetchone() or {}
+            for p in cat_prefix.values():
+                if (seed.get(p) or "").upper() == "F":
+                    _clip_prev_activity[p] = (seed.get(f"{p}_ac") or "").lower()
+
+        cursor.execute(
+            f"SELECT id, date_slot, {select_cols} FROM timeslot WHERE id > %s ORDER BY id ASC LIMIT 5000",
+            (last_id,),
+        )
+        rows = cursor.fetchall() or []
+        for r in rows:
+            last_id = max(last_id, int(r["id"]))
+            for cat_name, p in cat_prefix.items():
+                if (r.get(p) or "").upper() != "F":
+                    continue
+                act = (r.get(f"{p}_ac") or "").lower()
+                prev = _clip_prev_activity.get(p)
+                _clip_prev_activity[p] = act
+                if act in ("eat", "excrete") and act != prev:
+                    cam = r.get(f"{p}_cam")
+                    room = CAM_CODE_TO_ROOM.get(str(cam).strip().upper()) if cam else None
+                    registered += _register_clip_event(cursor, act, cat_name, r["date_slot"], room)
+        _state_set_tx(cursor, "clip_last_timeslot_id", str(last_id))
+
+    # 2) no_cat alerts ใหม่ -> คลิปรอบ "ครั้งสุดท้ายที่เห็น" ในห้องนั้น (มักต้องใช้ archive)
+    last_alert = int(_state_get("clip_last_alert_id", "0") or 0)
+    if last_alert <= 0:
+        last_alert = _get_latest_alert_id(cursor)
+        _state_set_tx(cursor, "clip_last_alert_id", str(last_alert))
+    cursor.execute(
+        "SELECT id, cat_name FROM alerts_log WHERE id > %s AND alert_type='no_cat' ORDER BY id ASC LIMIT 100",
+        (last_alert,),
+    )
+    for a in cursor.fetchall() or []:
+        last_alert = max(last_alert, int(a["id"]))
+        p = cat_prefix.get(a.get("cat_name"))
+        if not p:
+            continue
+        seen = None
+        # ไม่เจอใน timeslot สด -> ครั้งสุดท้ายที่เห็นอาจอยู่ในเดือนที่ archive ไปแล้ว
+        # ไล่ทีละ archive table จากเดือนใหม่ -> เก่า (หยุดที่เดือนแรกที่เจอ ไม่ scan ทุกเดือนผ่าน view)
+        archived = _archive_tables(cursor)
+        sources = ["timeslot"] + [
+            f"`timeslot_archive_{m:%Y%m}`" for m in sorted(archived, reverse=True) if p in archived[m]
+        ]
+        for source in sources:
+            cursor.execute(
+                f"SELECT date_slot, `{p}_cam` AS cam FROM {source} WHERE `{p}`='F' ORDER BY date_slot DESC LIMIT 1"
+            )
+            seen = cursor.fetchone()
+            if seen and seen.get("date_slot"):
+                break
+        if not seen or not seen.get("date_slot"):
+            continue
+        room = CAM_CODE_TO_ROOM.get(str(seen.get("cam") or "").strip().upper())
+        registered += _register_clip_event(cursor, "no_cat", a.get("cat_name"), seen["date_slot"], room, alert_id=int(a["id"]))
+    _state_set_tx(cursor, "clip_last_alert_id", str(last_alert))
+
+    # คลิปที่ค้าง pending (เช่น process restart ก่อน timer ทำงาน) -> build ตอนนี้
+    cursor.execute(
+        "SELECT id FROM event_clips WHERE status='pending' AND end_ts < %s ORDER BY id ASC LIMIT 20",
+        (time_module.time() - 30,),
+    )
+    for r in cursor.fetchall() or []:
+        _CLIP_POOL.submit(_build_clip, int(r["id"]))
 
-    conn = get_db()
-    cur = conn.cursor()
-    try:
-        cur.execute("UPDATE users SET is_approved=1, approved_at=NOW() WHERE id=%s", (user_id,))
-        conn.commit()
-        return jsonify({"ok": True})
-    finally:
-        try:
-            cur.close()
-        finally:
-            conn.close()
+    return registered
 
 
-@app.route("/api/admin/reject", methods=["POST"])
-def admin_reject():
-    err = _require_admin()
-    if err:
-        return err
+def _clip_paths(room: str, cam_idx: int, clip_id: int):
+    cam_dir = os.path.join(EVENT_CLIPS_DIR, secure_filename(f"{room}_{cam_idx}") or "cam")
+    return cam_dir, os.path.join(cam_dir, f"{clip_id}.mjpeg"), os.path.join(cam_dir, f"{clip_id}.idx")
 
-    data = request.get_json(silent=True) or {}
-    user_id = data.get("user_id")
-    if not user_id:
-        return jsonify({"ok": False, "error": "missing_user_id"}), 400
 
+def _build_clip(clip_id: int):
+    """เขียนไฟล์คลิปจาก history/archive แล้วอัปเดตสถานะใน event_clips (รันบน _CLIP_POOL)"""
     conn = get_db()
-    cur = conn.cursor()
+    cur = conn.cursor(dictionary=True)
     try:
-        # only delete if still pending
-        cur.execute("DELETE FROM users WHERE id=%s AND is_approved=0", (user_id,))
-        conn.commit()
-        return jsonify({"ok": True})
-    finally:
-        try:
-            cur.close()
-        finally:
-            conn.close()
+        cur.execute("SELECT * FROM event_clips WHERE id=%s", (clip_id,))
+        clip = cur.fetchone()
+        if not clip or clip.get("status") != "pending":
+            return
+        # ถูกขยายช่วงหลังตั้ง timer -> รอ timer ตัวใหม่
+        if float(clip["end_ts"]) + 1.0 > time_module.time():
+            return
 
+        k = _camera_key(clip["room"], clip["cam_idx"])
+        start_ts, end_ts = float(clip["start_ts"]), float(clip["end_ts"])
+        frames = _history_range(k, start_ts, end_ts)
+        if (not frames or frames[0][0] > start_ts + 5) and CAMERA_ARCHIVE_DIR:
+            frames = list(_archive_iter_range(k, start_ts, end_ts))
 
-@app.route("/api/admin/set_role", methods=["POST"])
-def admin_set_role():
-    err = _require_admin()
-    if err:
-        return err
+        if not frames:
+            cur.execute("UPDATE event_clips SET status='empty' WHERE id=%s", (clip_id,))
+            conn.commit()
+            return
 
-    data = request.get_json(silent=True) or {}
-    user_id = data.get("user_id")
-    role = (data.get("role") or "").strip().lower()
-    if not user_id or role not in ("user", "admin"):
-        return jsonify({"ok": False, "error": "invalid_fields"}), 400
+        cam_dir, clip_path, idx_path = _clip_paths(k[0], k[1], clip_id)
+        os.makedirs(cam_dir, exist_ok=True)
+        total = 0
+        with open(clip_path, "wb") as fc, open(idx_path, "wb") as fi:
+            for ts, data in frames:
+                fi.write(_ARCHIVE_REC.pack(ts, total, len(data)))
+                fc.write(data)
+                total += len(data)
 
-    conn = get_db()
-    cur = conn.cursor()
-    try:
-        cur.execute("UPDATE users SET role=%s WHERE id=%s", (role, user_id))
+        cur.execute(
+            "UPDATE event_clips SET status='ready', path=%s, frames=%s, bytes=%s WHERE id=%s",
+            (os.path.relpath(clip_path, EVENT_CLIPS_DIR), len(frames), total, clip_id),
+        )
         conn.commit()
-        return jsonify({"ok": True})
+    except Exception as e:
+        print("⚠️ clip build error:", clip_id, e)
     finally:
-        try:
-            cur.close()
-        finally:
-            conn.close()
+        cur.close()
+        conn.close()
 
 
-# Create table + optional bootstrap admin at startup
-try:
-    _ensure_users_table()
-    _bootstrap_admin_user()
-except Exception as e:
-    app.logger.error(f"[AUTH] users table/bootstrap error: {e}", exc_info=True)
+def _prune_event_clips(conn, cursor) -> dict:
+    """ทำความสะอาดคลิป (เรียกจาก job รายวัน):
+    - pending ที่ช่วงเวลาเก่ากว่าเฟรมต้นทางที่ยังเหลือ (history ใน RAM / archive ถูก retention ลบแล้ว) -> 'empty'
+    - คลิปที่จบก่อน EVENT_CLIP_RETENTION_DAYS -> ลบแถว (+ link)
+    commit แล้วค่อยลบไฟล์ที่ไม่มีแถวใน event_clips (รวมไฟล์ค้างจากรอบก่อน) — แถวไม่ชี้ไปไฟล์ที่หายไปแล้ว
+    """
+    _ensure_clip_tables(cursor)
+    now = time_module.time()
+    stats = {"expired_pending": 0, "deleted": 0, "files_removed": 0}
 
+    if not CAMERA_ARCHIVE_DIR:
+        source_horizon = now - 86400  # มีแค่ frame history ใน RAM
+    elif CAMERA_ARCHIVE_MAX_AGE_HOURS > 0:
+        source_horizon = now - CAMERA_ARCHIVE_MAX_AGE_HOURS * 3600
+    else:
+        source_horizon = None
+    if source_horizon is not None:
+        cursor.execute(
+            "UPDATE event_clips SET status='empty' WHERE status='pending' AND end_ts < %s",
+            (source_horizon,),
+        )
+        stats["expired_pending"] = max(0, cursor.rowcount or 0)
+
+    if EVENT_CLIP_RETENTION_DAYS > 0:
+        cutoff = now - EVENT_CLIP_RETENTION_DAYS * 86400
+        cursor.execute("DELETE l FROM event_clip_links l JOIN event_clips c ON c.id = l.clip_id WHERE c.end_ts < %s", (cutoff,))
+        cursor.execute("DELETE FROM event_clips WHERE end_ts < %s", (cutoff,))
+        stats["deleted"] = max(0, cursor.rowcount or 0)
+    conn.commit()
+
+    cursor.execute("SELECT id FROM event_clips")
+    live_ids = {int(r["id"]) for r in cursor.fetchall() or []}
+    if os.path.isdir(EVENT_CLIPS_DIR):
+        for cam in os.listdir(EVENT_CLIPS_DIR):
+            cam_dir = os.path.join(EVENT_CLIPS_DIR, cam)
+            if not os.path.isdir(cam_dir):
+                continue
+            for name in os.listdir(cam_dir):
+                m = re.match(r"^(\d+)\.(?:mjpeg|idx)$", name)
+                if not m or int(m.group(1)) in live_ids:
+                    continue
+                path = os.path.join(cam_dir, name)
+                try:
+                    # คลิปที่เพิ่งสร้างหลังอ่าน live_ids -> ไม่แตะ
+                    if os.path.getmtime(path) > now - 3600:
+                        continue
+                    os.remove(path)
+                    stats["files_removed"] += 1
+                except OSError:
+                    pass
+    return stats
 
-# ============================================================
-# In-app scheduler (Daily at 23:59 Asia/Bangkok)
-# ============================================================
 
-_scheduler = None
+@app.route("/api/clips", methods=["GET"])
+def list_event_clips():
+    """รายการคลิปเหตุการณ์
 
+    Query (optional): alert_id, cat, date=YYYY-MM-DD, limit (default 50)
+    """
+    if not EVENT_CLIPS_DIR:
+        return jsonify({"ok": True, "enabled": False, "clips": []})
+
+    where, params = ["1=1"], []
+    if request.args.get("alert_id", type=int):
+        where.append("l.alert_id = %s")
+        params.append(request.args.get("alert_id", type=int))
+    if (request.args.get("cat") or "").strip():
+        where.append("l.cat_name = %s")
+        params.append(request.args.get("cat").strip())
+    date_str = (request.args.get("date") or "").strip()
+    if date_str:
+        try:
+            day = datetime.strptime(date_str, "%Y-%m-%d")
+        except ValueError:
+            return jsonify({"message": "date must be YYYY-MM-DD"}), 400
+        where.append("l.event_time >= %s AND l.event_time < %s")
+        params.extend([day, day + timedelta(days=1)])
+    limit_n = max(1, min(request.args.get("limit", 50, type=int) or 50, 500))
 
-def _run_daily_summary_job():
-    """Run daily behavior (eat/excrete) alerts for today at 23:59."""
-    connection = mysql.connector.connect(**db_config)
-    cursor = connection.cursor(dictionary=True)
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
     try:
-        target_day = date.today()
-        inserted = _ingest_daily_behavior_for_day(cursor, target_day)
-        connection.commit()
-        try:
-            if inserted and inserted > 0:
-                _send_web_push_to_all('Pet Monitoring', f'สรุปประจำวัน: มีการแจ้งเตือนใหม่ {inserted} รายการ', '/')
-        except Exception:
-            pass
-        app.logger.info(f"[DAILY JOB] {target_day} inserted={inserted}")
-    except Exception as e:
-        app.logger.error(f"[DAILY JOB] Error: {e}", exc_info=True)
+        _ensure_clip_tables(cur)
+        cur.execute(
+            f"""
+            SELECT c.id, c.room, c.cam_idx, c.start_ts, c.end_ts, c.status, c.frames, c.bytes,
+                   l.event_type, l.cat_name, l.alert_id, l.event_time
+            FROM event_clip_links l
+            JOIN event_clips c ON c.id = l.clip_id
+            WHERE {' AND '.join(where)}
+            ORDER BY l.event_time DESC, c.id DESC
+            LIMIT {limit_n}
+            """,
+            tuple(params),
+        )
+        rows = cur.fetchall() or []
+        for r in rows:
+            r["event_time"] = r["event_time"].strftime("%Y-%m-%d %H:%M:%S") if r.get("event_time") else None
+            r["url"] = f"/api/clips/{r['id']}.mjpeg" if r.get("status") == "ready" else None
+            r["stream_url"] = f"/api/clips/{r['id']}/stream" if r.get("status") == "ready" else None
+        return jsonify({"ok": True, "enabled": True, "clips": rows})
+    finally:
+        cur.close()
+        conn.close()
+
+
+def _get_ready_clip(clip_id: int):
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
+    try:
+        _ensure_clip_tables(cur)
+        cur.execute("SELECT * FROM event_clips WHERE id=%s AND status='ready'", (clip_id,))
+        return cur.fetchone()
     finally:
+        cur.close()
+        conn.close()
+
+
+@app.route("/api/clips/<int:clip_id>.mjpeg", methods=["GET"])
+def download_event_clip(clip_id):
+    if not EVENT_CLIPS_DIR:
+        return jsonify({"ok": False, "error": "clips_disabled"}), 404
+    clip = _get_ready_clip(clip_id)
+    if not clip:
+        return jsonify({"ok": False, "error": "clip_not_found"}), 404
+    return send_from_directory(EVENT_CLIPS_DIR, clip["path"], mimetype="video/x-motion-jpeg", as_attachment=True)
+
+
+@app.route("/api/clips/<int:clip_id>/stream", methods=["GET"])
+def stream_event_clip(clip_id):
+    """เล่นคลิปในเบราว์เซอร์ (multipart MJPEG ตามจังหวะเวลาจริง x speed)"""
+    if not EVENT_CLIPS_DIR:
+        return jsonify({"ok": False, "error": "clips_disabled"}), 404
+    clip = _get_ready_clip(clip_id)
+    if not clip:
+        return jsonify({"ok": False, "error": "clip_not_found"}), 404
+    _, clip_path, idx_path = _clip_paths(clip["room"], clip["cam_idx"], clip_id)
+    speed = max(0.1, request.args.get("speed", 1.0, type=float) or 1.0)
+
+    def generate():
         try:
-            cursor.close()
-        finally:
-            connection.close()
+            with open(idx_path, "rb") as fi, open(clip_path, "rb") as fc:
+                prev_ts = None
+                while True:
+                    rec = fi.read(_ARCHIVE_REC.size)
+                    if len(rec) < _ARCHIVE_REC.size:
+                        break
+                    ts, offset, size = _ARCHIVE_REC.unpack(rec)
+                    if prev_ts is not None:
+                        time_module.sleep(min(5.0, max(0.0, (ts - prev_ts) / speed)))
+                    prev_ts = ts
+                    fc.seek(offset)
+                    yield b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + fc.read(size) + b"\r\n"
+        except Exception as e:  # pragma: no cover
+            print("❌ clip streaming error:", e)
+
+    return Response(generate(), mimetype="multipart/x-mixed-replace; boundary=frame")
 
 
-def start_scheduler():
-    """Start APScheduler to run daily summary at 23:59 Asia/Bangkok.
+try:
+    _start_archive_writer()
+except Exception as e:  # pragma: no cover
+    print("⚠️ cannot start camera archive writer:", e)
 
-    Note: In Flask debug mode, Werkzeug reloads the process; we guard to avoid double-start.
-    """
-    global _scheduler
+# =========================================
+# LIVE EVENTS (Server-Sent Events hub)
+# =========================================
+# /api/events?topics=cats,alerts,camera
+#   - publisher thread เดียวต่อ process (เริ่มเมื่อมี subscriber คนแรก, หยุดเองเมื่อไม่มีใคร)
+#     ตรวจ high-water mark ของ timeslot/alerts_log แล้ว query ใหม่เฉพาะเมื่อมี batch ใหม่
+#   - client ได้ snapshot ตอนเชื่อมต่อ แล้วตามด้วย diff เล็ก ๆ -> ภาระ DB ไม่ขึ้นกับจำนวนแท็บที่เปิด
+#   - คิวของ client เต็ม (client ช้า) -> ส่ง event "resync" แล้วปิด ให้ EventSource reconnect รับ snapshot ใหม่
+#   - gunicorn รันแบบ sync threads (Procfile: --threads 4) และ stream หนึ่งตัวกิน 1 thread ตลอดอายุ
+#     -> จำกัด stream พร้อมกันต่อ process ไว้ต่ำกว่าจำนวน thread (LIVE_EVENTS_MAX_SUBSCRIBERS)
+#     เกินแล้วตอบ 503 ให้ client กลับไป poll; stream มีอายุ LIVE_EVENTS_MAX_STREAM_SECONDS แล้วปิด
+#     เพื่อหมุนเวียน slot ให้แท็บอื่น (ถ้าเพิ่ม --threads ให้ปรับค่านี้ตาม)
+LIVE_EVENTS_ENABLED = os.environ.get("LIVE_EVENTS_ENABLED", "1") == "1"
+LIVE_EVENTS_POLL_SECONDS = float(os.environ.get("LIVE_EVENTS_POLL_SECONDS", "2.0") or 2.0)
+LIVE_EVENTS_CAMERA_SECONDS = float(os.environ.get("LIVE_EVENTS_CAMERA_SECONDS", "0.3") or 0.3)
+LIVE_EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("LIVE_EVENTS_HEARTBEAT_SECONDS", "15") or 15)
+LIVE_EVENTS_QUEUE_MAX = int(os.environ.get("LIVE_EVENTS_QUEUE_MAX", "256") or 256)
+LIVE_EVENTS_MAX_SUBSCRIBERS = int(os.environ.get("LIVE_EVENTS_MAX_SUBSCRIBERS", "2") or 0)
+LIVE_EVENTS_MAX_STREAM_SECONDS = float(os.environ.get("LIVE_EVENTS_MAX_STREAM_SECONDS", "600") or 600)
+LIVE_EVENTS_TOPICS = ("cats", "alerts", "camera")
+
+_LIVE_LOCK = Lock()
+_LIVE_SUBSCRIBERS = []  # [{"q": queue.Queue, "topics": set, "overflow": bool}]
+_LIVE_STATE = {"seq": 0, "cats": None, "latest_slot": None, "alert_id": None, "camera": {}}
+_LIVE_PUBLISHER = None
+
+
+def _live_format(topic: str, data, event_id=None) -> str:
+    """1 event ในรูปแบบ text/event-stream (encode ครั้งเดียว ใช้ร่วมทุก subscriber)"""
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    body = json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+    return f"{head}event: {topic}\ndata: {body}\n\n"
+
+
+def _live_publish(topic: str, data):
+    """ส่ง event ไปยังทุก subscriber ที่สนใจ topic (ต้องไม่ถือ _LIVE_LOCK อยู่)"""
+    with _LIVE_LOCK:
+        _LIVE_STATE["seq"] += 1
+        msg = _live_format(topic, data, _LIVE_STATE["seq"])
+        for sub in _LIVE_SUBSCRIBERS:
+            if topic not in sub["topics"] or sub["overflow"]:
+                continue
+            try:
+                sub["q"].put_nowait(msg)
+            except queue.Full:
+                sub["overflow"] = True
+
+
+def _live_snapshot_messages(topics) -> list:
+    """snapshot ปัจจุบันของแต่ละ topic สำหรับ client ที่เพิ่งเชื่อมต่อ (ต้องถือ _LIVE_LOCK อยู่)"""
+    st = _LIVE_STATE
+    out = []
+    if "cats" in topics and st["cats"] is not None:
+        out.append(_live_format("cats", {"snapshot": True, "cats": st["cats"], "latest_slot": st["latest_slot"]}))
+    if "alerts" in topics and st["alert_id"] is not None:
+        out.append(_live_format("alerts", {"snapshot": True, "latest_id": st["alert_id"], "alerts": []}))
+    if "camera" in topics and st["camera"]:
+        out.append(_live_format("camera", {"snapshot": True, "cameras": list(st["camera"].values())}))
+    return out
 
-    if BackgroundScheduler is None or CronTrigger is None:
-        app.logger.warning("[SCHEDULER] APScheduler not installed; daily scheduler disabled.")
-        return
 
-    if _scheduler is not None:
-        return
+def _live_cat_states(cursor):
+    """{name: {color, current_room, status, activity}} ของทุกแมว + date_slot ของ slot ล่าสุด"""
+    cursor.execute("SELECT name, color FROM cats ORDER BY name")
+    cats_rows = cursor.fetchall() or []
+    cols = _get_timeslot_columns(cursor)
+    cursor.execute("SELECT * FROM timeslot ORDER BY date_slot DESC, id DESC LIMIT 1")
+    latest = cursor.fetchone() or {}
 
-    # Avoid starting twice under the dev reloader
-    if app.debug and os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+    out = {}
+    for r in cats_rows:
+        name = r["name"]
+        prefix = _normalize_prefix(r.get("color") or name)
+        has_cols = bool(prefix) and {prefix, f"{prefix}_cam", f"{prefix}_ac"}.issubset(cols)
+        status = latest.get(prefix) if has_cols else None
+        cam = latest.get(f"{prefix}_cam") if has_cols else None
+        if status == "F" and cam:
+            room = CAM_CODE_TO_ROOM.get(str(cam).strip(), None)
+        else:
+            room = _cat_current_room(cursor, prefix)
+        out[name] = {
+            "color": r.get("color"),
+            "current_room": room,
+            "status": status,
+            "activity": latest.get(f"{prefix}_ac") if has_cols else None,
+        }
+    latest_dt = latest.get("date_slot")
+    return out, (latest_dt.strftime("%Y-%m-%d %H:%M:%S") if latest_dt else None)
+
+
+def _live_poll_camera():
+    """frame seq ของกล้อง (อ่านจาก _FRAME_STORE ในหน่วยความจำ/shm ไม่แตะ DB)"""
+    changed = []
+    seen = set()
+    for k, v in _FRAME_STORE.items():
+        cid = f"{k[0]}/{k[1]}"
+        seen.add(cid)
+        item = {"id": cid, "room": k[0], "idx": k[1], "seq": v.get("seq", 0), "ts": v.get("ts")}
+        prev = _LIVE_STATE["camera"].get(cid)
+        if prev is None or prev["seq"] != item["seq"]:
+            changed.append(item)
+    removed = [cid for cid in _LIVE_STATE["camera"] if cid not in seen]
+    if not changed and not removed:
         return
-
-    _scheduler = BackgroundScheduler(timezone="Asia/Bangkok")
-    _scheduler.add_job(
-        _run_daily_summary_job,
-        trigger=CronTrigger(hour=23, minute=59),
-        id="daily_summary_2359",
-        replace_existing=True,
-    )
-    _scheduler.start()
-    app.logger.info("[SCHEDULER] Daily summary scheduled at 23:59 Asia/Bangkok")
+    with _LIVE_LOCK:
+        for item in changed:
+            _LIVE_STATE["camera"][item["id"]] = item
+        for cid in removed:
+            _LIVE_STATE["camera"].pop(cid, None)
+    _live_publish("camera", {"cameras": changed, "removed": removed})
 
 
-# Start automatic alert push worker at import-time (for gunicorn/uwsgi too).
-try:
-    _start_alert_push_worker()
-except Exception as e:  # pragma: no cover
+def _live_poll_db(prev_marks):
+    """ตรวจ high-water mark ก่อน แล้วคำนวณสถานะแมว/ดึง alert ใหม่เฉพาะเมื่อมีข้อมูลใหม่; คืน marks ใหม่"""
+    conn = get_db()
+    cur = conn.cursor(dictionary=True)
     try:
-        app.logger.error(f"[PUSH WORKER] start error: {e}", exc_info=True)
-    except Exception:
-        pass
+        hwm = _timeslot_high_water(cur)
+        cur.execute("SELECT name, color, display_status FROM cats ORDER BY name")
+        cats_fp = repr([(r.get("name"), r.get("color"), r.get("display_status")) for r in cur.fetchall() or []])
+        alert_id = _get_latest_alert_id(cur)
+        # แถวเดิมถูกแก้ (ingest) -> hwm ไม่ขยับ แต่ revision เปลี่ยน -> คำนวณสถานะแมวใหม่ด้วย
+        rev = _timeslot_revision_read(cur)
+
+        marks = (hwm, cats_fp, rev)
+        if marks != prev_marks:
+            states, latest_slot = _live_cat_states(cur)
+            old = _LIVE_STATE["cats"] or {}
+            changed = {n: v for n, v in states.items() if old.get(n) != v}
+            removed = [n for n in old if n not in states]
+            reload = prev_marks is not None and prev_marks[1] != cats_fp
+            with _LIVE_LOCK:
+                _LIVE_STATE["cats"] = states
+                _LIVE_STATE["latest_slot"] = latest_slot
+            if changed or removed or reload:
+                # reload = ข้อมูลแมว (ชื่อ/รูป/display_status) เปลี่ยน -> client โหลด /api/cats ใหม่ครั้งเดียว
+                _live_publish("cats", {
+                    "changed": changed, "removed": removed, "reload": reload, "latest_slot": latest_slot,
+                })
+
+        prev_alert = _LIVE_STATE["alert_id"]
+        if prev_alert is not None and alert_id > prev_alert:
+            rows = _fetch_new_alerts_since(cur, prev_alert, limit=50)
+            _live_publish("alerts", {
+                "latest_id": alert_id,
+                "alerts": [
+                    {
+                        "id": r.get("id"),
+                        "cat_name": r.get("cat_name"),
+                        "alert_type": r.get("alert_type"),
+                        "message": r.get("message"),
+                        "created_at": r.get("created_at").strftime("%Y-%m-%d %H:%M:%S") if r.get("created_at") else None,
+                    }
+                    for r in rows
+                ],
+            })
+        if alert_id != prev_alert:
+            with _LIVE_LOCK:
+                _LIVE_STATE["alert_id"] = alert_id
+        return marks
+    finally:
+        cur.close()
+        conn.close()
+
 
+def _live_publisher_loop():
+    global _LIVE_PUBLISHER
+    marks = None
+    next_db_at = 0.0
+    while True:
+        with _LIVE_LOCK:
+            if not _LIVE_SUBSCRIBERS:
+                # ไม่มีใครฟังแล้ว -> หยุด (subscriber คนถัดไปจะเริ่ม thread ใหม่และได้ snapshot ใหม่)
+                _LIVE_PUBLISHER = None
+                _LIVE_STATE.update({"cats": None, "latest_slot": None, "alert_id": None, "camera": {}})
+                return
+        try:
+            _live_poll_camera()
+        except Exception as e:
+            app.logger.warning(f"[LIVE] camera poll error: {e}")
+        now = time_module.monotonic()
+        if now >= next_db_at:
+            next_db_at = now + LIVE_EVENTS_POLL_SECONDS
+            try:
+                marks = _live_poll_db(marks)
+            except Exception as e:
+                app.logger.warning(f"[LIVE] db poll error: {e}")
+        time_module.sleep(LIVE_EVENTS_CAMERA_SECONDS)
+
+
+def _live_subscribe(topics):
+    """คืน subscriber ใหม่ หรือ None ถ้าเต็ม LIVE_EVENTS_MAX_SUBSCRIBERS แล้ว"""
+    global _LIVE_PUBLISHER
+    sub = {"q": queue.Queue(maxsize=LIVE_EVENTS_QUEUE_MAX), "topics": set(topics), "overflow": False}
+    with _LIVE_LOCK:
+        if len(_LIVE_SUBSCRIBERS) >= LIVE_EVENTS_MAX_SUBSCRIBERS:
+            return None
+        for msg in _live_snapshot_messages(sub["topics"]):
+            sub["q"].put_nowait(msg)
+        _LIVE_SUBSCRIBERS.append(sub)
+        if _LIVE_PUBLISHER is None:
+            _LIVE_PUBLISHER = threading.Thread(target=_live_publisher_loop, daemon=True, name="live-events")
+            _LIVE_PUBLISHER.start()
+    return sub
 
 
-# ============================================================
-# Camera Bridge (LAN RTSP -> Push latest JPEG to Render)
-# - Home PC pushes frames to /api/camera/push/<room>/<idx>
-# - Web UI fetches latest at /camera_latest/<room>/<idx>.jpg
-# ============================================================
+def _live_unsubscribe(sub):
+    with _LIVE_LOCK:
+        try:
+            _LIVE_SUBSCRIBERS.remove(sub)
+        except ValueError:
+            pass
 
-_CAMERA_STORE = {}  # (room, idx) -> {"bytes": b"...", "ts": float}
-_CAMERA_LOCK = Lock()
-CAM_PUSH_TOKEN = os.environ.get("CAM_PUSH_TOKEN", "").strip()
 
-def _camera_key(room: str, idx: int):
-    room = (room or "").strip().lower()
-    return (room, int(idx))
+@app.route("/api/events", methods=["GET"])
+def live_events():
+    """
+    Server-Sent Events แทนการ poll /api/cats, /api/alerts, /api/camera/status
 
-@app.route("/api/camera/push/<room>/<int:idx>", methods=["POST"])
-def camera_push(room, idx):
-    """Receive a single JPEG frame from a trusted local bridge."""
-    if not CAM_PUSH_TOKEN:
-        return jsonify({"ok": False, "error": "server_not_configured"}), 500
+    Query params:
+      topics: รายการคั่นด้วย comma จาก cats, alerts, camera (default = ทั้งหมด)
 
-    token = request.headers.get("X-CAM-TOKEN", "") or request.args.get("token", "")
-    if not token or not hmac.compare_digest(token, CAM_PUSH_TOKEN):
-        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    Events (data เป็น JSON):
+      cats:   {"changed": {name: {color,current_room,status,activity}}, "removed": [...],
+               "reload": bool, "latest_slot": "..."}  (ครั้งแรก: {"snapshot": true, "cats": {...}})
+      alerts: {"latest_id": N, "alerts": [{id,cat_name,alert_type,message,created_at}]}
+      camera: {"cameras": [{id,room,idx,seq,ts}], "removed": [...]}
+      resync: client ตามไม่ทัน / stream ครบอายุ -> server ปิด stream, EventSource จะต่อใหม่เองและได้ snapshot ใหม่
 
-    # Accept multipart file: frame
-    f = request.files.get("frame")
-    if f is None:
-        return jsonify({"ok": False, "error": "missing_frame"}), 400
+    503: stream เต็มแล้ว (LIVE_EVENTS_MAX_SUBSCRIBERS) -> client ใช้การ poll แทน
+    """
+    if not LIVE_EVENTS_ENABLED:
+        return jsonify({"message": "live events disabled"}), 404
 
-    data = f.read()
-    if not data:
-        return jsonify({"ok": False, "error": "empty_frame"}), 400
+    raw = (request.args.get("topics") or "").strip()
+    topics = [t.strip().lower() for t in raw.split(",") if t.strip()] if raw else list(LIVE_EVENTS_TOPICS)
+    bad = [t for t in topics if t not in LIVE_EVENTS_TOPICS]
+    if bad:
+        return jsonify({"message": f"unknown topics: {', '.join(bad)}", "topics": list(LIVE_EVENTS_TOPICS)}), 400
 
-    # Basic sanity: JPEG should start with 0xFFD8
-    if not (len(data) > 4 and data[0:2] == b"\xff\xd8"):
-        # allow non-jpeg but still store to help debugging
-        pass
+    sub = _live_subscribe(topics)
+    if sub is None:
+        return jsonify({"message": "too many live event streams, use polling"}), 503, {"Retry-After": "60"}
 
-    k = _camera_key(room, idx)
-    now = time_module.time()
-    with _CAMERA_LOCK:
-        _CAMERA_STORE[k] = {"bytes": data, "ts": now, "size": len(data)}
-    return jsonify({"ok": True, "room": k[0], "idx": k[1], "ts": now})
+    def generate():
+        deadline = time_module.monotonic() + LIVE_EVENTS_MAX_STREAM_SECONDS
+        try:
+            # retry: ให้ EventSource รอ 3 วินาทีก่อนต่อใหม่
+            yield "retry: 3000\n\n"
+            while True:
+                if sub["overflow"] or time_module.monotonic() >= deadline:
+                    yield _live_format("resync", {})
+                    return
+                try:
+                    yield sub["q"].get(timeout=LIVE_EVENTS_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # comment line กัน proxy ตัด connection ที่เงียบ
+                    yield ": ping\n\n"
+        finally:
+            _live_unsubscribe(sub)
 
-@app.route("/camera_latest/<room>/<int:idx>.jpg", methods=["GET"])
-def camera_latest(room, idx):
-    k = _camera_key(room, idx)
-    with _CAMERA_LOCK:
-        item = _CAMERA_STORE.get(k)
-    if not item:
-        return jsonify({"ok": False, "error": "no_frame_yet"}), 404
-    return Response(item["bytes"], mimetype="image/jpeg", headers={
-        "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-        "Pragma": "no-cache",
-        "Expires": "0",
-        "Surrogate-Control": "no-store",
+    resp = Response(generate(), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
     })
+    # client ตัดก่อน generator เริ่ม -> finally ข้างบนไม่ทำงาน แต่ slot ต้องคืนเสมอ
+    resp.call_on_close(lambda: _live_unsubscribe(sub))
+    return resp
 
-@app.route("/api/camera/status", methods=["GET"])
-def camera_status():
-    with _CAMERA_LOCK:
-        out = [
-            {"room": k[0], "idx": k[1], "last_ts": v.get("ts"), "bytes": v.get("size", 0)}
-            for k, v in _CAMERA_STORE.items()
-        ]
-    out.sort(key=lambda x: (x["room"], x["idx"]))
-    return jsonify({"ok": True, "cameras": out})
+
+try:
+    _start_image_variant_backfill()
+except Exception as e:  # pragma: no cover
+    print("⚠️ cannot start image variant backfill:", e)
 
 
 if __name__ == "__main__":
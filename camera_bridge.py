@@ -1,4 +1,5 @@
-import os, time, cv2, requests
+import os, time, threading, cv2, requests
+import numpy as np
 
 BASE = os.environ.get("RENDER_BASE_URL","").rstrip("/")
 TOKEN = os.environ.get("CAM_PUSH_TOKEN","")
@@ -8,7 +9,15 @@ IDX   = os.environ.get("CAMERA_INDEX","0")
 
 INTERVAL_MS = int(os.environ.get("PUSH_INTERVAL_MS","250"))  # 200-400 แนะนำ
 JPEG_Q      = int(os.environ.get("JPEG_QUALITY","60"))       # 50-70 แนะนำ
-GRAB_N      = int(os.environ.get("GRAB_N","8"))              # ทิ้งเฟรมเก่าแรงขึ้น
+READ_TIMEOUT_S = float(os.environ.get("READ_TIMEOUT_S","5"))  # รอเฟรมใหม่นานสุดกี่วินาที
+
+# Change detection (optional): ข้ามเฟรมที่ภาพไม่เปลี่ยน แต่ส่ง keep-alive ตามรอบ
+MOTION_DETECT    = os.environ.get("MOTION_DETECT","0") not in ("0", "", "false", "no")
+MOTION_WIDTH     = int(os.environ.get("MOTION_WIDTH","160"))         # ย่อภาพก่อนเทียบ (px)
+MOTION_PIXEL_DIFF = int(os.environ.get("MOTION_PIXEL_DIFF","25"))    # 0-255 ต่อ pixel
+MOTION_THRESHOLD = float(os.environ.get("MOTION_THRESHOLD","0.01"))  # สัดส่วน pixel ที่เปลี่ยน
+MOTION_MASK      = os.environ.get("MOTION_MASK","")                  # path รูป mask (ขาว = ตรวจ)
+KEEPALIVE_MS     = int(os.environ.get("KEEPALIVE_MS","10000"))       # ส่งอย่างน้อยทุกกี่ ms
 
 if not all([BASE, TOKEN, RTSP]):
     raise SystemExit("❌ missing env: RENDER_BASE_URL / CAM_PUSH_TOKEN / RTSP_URL")
@@ -17,6 +26,8 @@ PUSH_URL = f"{BASE}/api/camera/push/{ROOM}/{IDX}"
 print("🔌 RTSP:", RTSP)
 print("🌐 PUSH:", PUSH_URL)
 print("⏱️ interval(ms):", INTERVAL_MS)
+if MOTION_DETECT:
+    print(f"👀 motion: width={MOTION_WIDTH} diff={MOTION_PIXEL_DIFF} ratio={MOTION_THRESHOLD} keepalive(ms)={KEEPALIVE_MS}")
 
 def open_cap():
     cap = cv2.VideoCapture(RTSP)
@@ -26,52 +37,155 @@ def open_cap():
         pass
     return cap
 
-cap = open_cap()
-backoff = 1.0
+
+class LatestFrameReader:
+    """อ่าน RTSP ใน thread แยก: grab() ตลอดเวลาเพื่อไม่ให้ buffer ค้าง
+    แต่ retrieve() (แปลงเป็น BGR) เฉพาะตอนที่มีคนขอเฟรม -> ไม่เสีย CPU กับเฟรมที่ทิ้ง
+
+    reconnect + backoff อยู่ใน thread นี้ทั้งหมด ฝั่งส่งแค่เรียก read()
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._want = False
+        self._frame = None
+        self._seq = 0
+        self._ts = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True, name="rtsp-reader")
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        backoff = 1.0
+        while True:
+            cap = open_cap()
+            if not cap.isOpened():
+                print(f"⚠️ open failed, retry in {backoff}s")
+                cap.release()
+                time.sleep(backoff)
+                backoff = min(backoff*2, 20)
+                continue
+            backoff = 1.0
+            try:
+                while True:
+                    if not cap.grab():
+                        print("⚠️ grab failed, reconnect...")
+                        break
+                    ts = time.time()
+                    with self._cond:
+                        want = self._want
+                    if not want:
+                        continue
+                    ok, frame = cap.retrieve()
+                    if not ok:
+                        print("⚠️ retrieve failed, reconnect...")
+                        break
+                    with self._cond:
+                        self._frame = frame
+                        self._ts = ts
+                        self._seq += 1
+                        self._want = False
+                        self._cond.notify_all()
+            finally:
+                cap.release()
+
+    def read(self, timeout=None):
+        """คืน (frame, capture_ts) ของเฟรมถัดไปที่ grab ได้ หรือ (None, 0) ถ้า timeout"""
+        with self._cond:
+            seq = self._seq
+            self._want = True
+            if not self._cond.wait_for(lambda: self._seq != seq, timeout=timeout):
+                return None, 0.0
+            return self._frame, self._ts
+
+
+def load_mask(shape):
+    """โหลด mask ให้ขนาดเท่าภาพย่อ (None = ตรวจทั้งภาพ)"""
+    if not MOTION_MASK:
+        return None
+    m = cv2.imread(MOTION_MASK, cv2.IMREAD_GRAYSCALE)
+    if m is None:
+        print("⚠️ cannot read MOTION_MASK:", MOTION_MASK)
+        return None
+    m = cv2.resize(m, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+    return m > 127
+
+
+def small_gray(frame):
+    h, w = frame.shape[:2]
+    sw = max(16, min(MOTION_WIDTH, w))
+    sh = max(1, int(round(h * sw / float(w))))
+    g = cv2.cvtColor(cv2.resize(frame, (sw, sh), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    return cv2.GaussianBlur(g, (5, 5), 0)
+
+
+_ref = None    # ภาพย่อของเฟรมล่าสุดที่ส่งไป
+_mask = None
+_mask_px = 0
+
+
+def frame_changed(gray) -> bool:
+    """เทียบกับเฟรมที่ส่งล่าสุด (ไม่ใช่เฟรมก่อนหน้า) เพื่อให้การเปลี่ยนช้าๆ สะสมจนถูกจับได้"""
+    global _ref, _mask, _mask_px
+    if _ref is None or _ref.shape != gray.shape:
+        _mask = load_mask(gray.shape)
+        _mask_px = int(_mask.sum()) if _mask is not None else gray.size
+        return True
+    diff = cv2.absdiff(gray, _ref) > MOTION_PIXEL_DIFF
+    if _mask is not None:
+        diff &= _mask
+    changed = int(np.count_nonzero(diff))
+    return changed >= max(1, int(_mask_px * MOTION_THRESHOLD))
+
+
+reader = LatestFrameReader().start()
+last_sent = 0.0
+push_seq = 0
 
 while True:
-    if not cap.isOpened():
-        print(f"⚠️ open failed, retry in {backoff}s")
-        time.sleep(backoff)
-        backoff = min(backoff*2, 20)
-        cap = open_cap()
-        continue
-    backoff = 1.0
-
-    # ทิ้งเฟรมเก่าให้เยอะขึ้น แล้วค่อยดึงเฟรมล่าสุด
-    ok = True
-    for _ in range(GRAB_N):
-        ok = cap.grab()
-        if not ok:
-            break
-    if not ok:
-        print("⚠️ grab failed, reconnect...")
-        cap.release()
-        cap = open_cap()
+    started = time.time()
+    frame, captured_at = reader.read(timeout=READ_TIMEOUT_S)
+    if frame is None:
+        print(f"⚠️ no frame for {READ_TIMEOUT_S}s (reader reconnecting?)")
         continue
 
-    ok, frame = cap.retrieve()
-    if not ok:
-        print("⚠️ retrieve failed, reconnect...")
-        cap.release()
-        cap = open_cap()
-        continue
+    gray = None
+    if MOTION_DETECT:
+        gray = small_gray(frame)
+        keepalive_due = (time.time() - last_sent) * 1000 >= KEEPALIVE_MS
+        if not frame_changed(gray) and not keepalive_due:
+            time.sleep(max(0.0, INTERVAL_MS/1000 - (time.time() - started)))
+            continue
 
     ok, enc = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_Q])
     if not ok:
         time.sleep(INTERVAL_MS/1000)
         continue
 
+    push_seq += 1
     try:
         r = requests.post(
             PUSH_URL,
-            headers={"X-CAM-TOKEN": TOKEN},
+            headers={
+                "X-CAM-TOKEN": TOKEN,
+                "X-Capture-Ts": f"{captured_at:.3f}",  # server ใช้วัด latency
+                "X-Frame-Seq": str(push_seq),           # server ใช้นับเฟรมที่หาย
+            },
             files={"frame": ("frame.jpg", enc.tobytes(), "image/jpeg")},
             timeout=10,
         )
-        if r.status_code != 200:
+        if r.status_code == 429:
+            pass  # server throttle (ส่งเร็วกว่า max_fps ของกล้อง)
+        elif r.status_code != 200:
             print("⚠️ push failed:", r.status_code, r.text[:200])
+        elif gray is not None:
+            # อัปเดต reference เฉพาะเมื่อส่งสำเร็จ
+            _ref = gray
+            last_sent = time.time()
     except Exception as e:
         print("⚠️ push exception:", e)
 
-    time.sleep(INTERVAL_MS/1000)
+    # นับ interval จากต้นรอบ (เวลา encode/upload รวมอยู่ในรอบแล้ว)
+    time.sleep(max(0.0, INTERVAL_MS/1000 - (time.time() - started)))
@@ -0,0 +1,144 @@
+"""Export timeslot history ผ่าน /api/export/timeslot ลงไฟล์ (CSV หรือ NDJSON)
+
+ตัวอย่าง:
+  RENDER_BASE_URL=https://... EXPORT_TOKEN=... \
+    python export_timeslot.py --cats Black,Orange --start 2025-01-01 --end 2025-12-31 -o 2025.csv
+
+- server ส่งทีละหน้า (ไม่เกิน X-Export-Limit แถวของ timeslot) สคริปต์นี้ขอหน้าถัดไปจากแถวสุดท้ายเอง
+- ถูกตัดกลางทาง -> รันคำสั่งเดิมซ้ำพร้อม --resume จะต่อจาก (date_slot, id) ของบรรทัดสุดท้ายในไฟล์
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+
+import requests
+
+BASE = os.environ.get("RENDER_BASE_URL", "").rstrip("/")
+TOKEN = os.environ.get("EXPORT_TOKEN", "")
+TIMEOUT_S = float(os.environ.get("EXPORT_TIMEOUT_S", "60"))
+
+
+def _row_cursor(line, fmt):
+    """(date_slot, id) ของบรรทัด หรือ None (header/บรรทัดเสีย)"""
+    try:
+        if fmt == "ndjson":
+            row = json.loads(line)
+            return row["date_slot"], int(row["id"])
+        row = next(csv.reader([line]))
+        if row and row[0] != "id":
+            return row[1], int(row[0])
+    except (ValueError, KeyError, IndexError, StopIteration):
+        pass
+    return None
+
+
+def prepare_resume(path, fmt):
+    """ตัดส่วนท้ายไฟล์ที่อาจไม่ครบ แล้วคืน (date_slot, id) ของแถวสุดท้ายที่เหลือ หรือ None
+
+    - บรรทัดสุดท้ายที่เขียนไม่จบ (ไม่มี \n) -> ตัดทิ้ง
+    - slot สุดท้าย (id เดียวกัน หลายแมว) อาจได้ไม่ครบทุกแมว -> ตัดทั้ง slot แล้วขอใหม่
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        base = max(0, size - 64 * 1024)
+        f.seek(base)
+        tail = f.read()
+        keep = tail[: tail.rfind(b"\n") + 1]
+
+        lines = keep.split(b"\n")[:-1]
+        cursors = [_row_cursor(l.decode("utf-8", errors="replace"), fmt) for l in lines]
+        cursor = None
+        if cursors and cursors[-1]:
+            last_id = cursors[-1][1]
+            n = len(lines)
+            while n > 0 and cursors[n - 1] and cursors[n - 1][1] == last_id:
+                n -= 1
+            keep = b"".join(l + b"\n" for l in lines[:n])
+            cursor = next((c for c in reversed(cursors[:n]) if c), None)
+        f.truncate(base + len(keep))
+    return cursor
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Stream timeslot history to a CSV/NDJSON file")
+    ap.add_argument("--cats", default="", help="ชื่อแมวคั่นด้วย comma (default = ทุกตัว)")
+    ap.add_argument("--start", default="", help="YYYY-MM-DD หรือ 'YYYY-MM-DD HH:MM:SS'")
+    ap.add_argument("--end", default="", help="YYYY-MM-DD (รวมทั้งวัน) หรือ datetime")
+    ap.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    ap.add_argument("-o", "--output", default="-", help="ไฟล์ปลายทาง (- = stdout)")
+    ap.add_argument("--resume", action="store_true", help="ต่อจากแถวสุดท้ายในไฟล์ปลายทาง")
+    args = ap.parse_args()
+
+    if not BASE:
+        raise SystemExit("❌ missing env: RENDER_BASE_URL")
+
+    cursor = None
+    to_stdout = args.output == "-"
+    if args.resume and not to_stdout:
+        cursor = prepare_resume(args.output, args.format)
+        if cursor:
+            print(f"↪️ resume after {cursor[0]} (id={cursor[1]})", file=sys.stderr)
+
+    out = sys.stdout.buffer if to_stdout else open(args.output, "ab" if cursor else "wb")
+    session = requests.Session()
+    if TOKEN:
+        session.headers["X-EXPORT-TOKEN"] = TOKEN
+
+    total = 0
+    header_written = cursor is not None
+    try:
+        while True:
+            params = {"format": args.format}
+            if args.cats:
+                params["cats"] = args.cats
+            if args.start:
+                params["start"] = args.start
+            if args.end:
+                params["end"] = args.end
+            if cursor:
+                params["after"], params["after_id"] = cursor[0], cursor[1]
+
+            # requests ถอด gzip (Content-Encoding) ให้เองระหว่าง iter_lines
+            with session.get(f"{BASE}/api/export/timeslot", params=params, stream=True, timeout=TIMEOUT_S) as r:
+                if r.status_code != 200:
+                    raise SystemExit(f"❌ export failed: {r.status_code} {r.text[:200]}")
+                page_limit = int(r.headers.get("X-Export-Limit") or 0)
+                ids = set()
+                for line in r.iter_lines(delimiter=b"\n"):
+                    if not line:
+                        continue
+                    if args.format == "csv":
+                        row = next(csv.reader([line.decode("utf-8")]))
+                        if row[0] == "id":
+                            if header_written:
+                                continue
+                            header_written = True
+                        else:
+                            ids.add(row[0])
+                            cursor = (row[1], int(row[0]))
+                    else:
+                        row = json.loads(line)
+                        ids.add(row["id"])
+                        cursor = (row["date_slot"], int(row["id"]))
+                    out.write(line + b"\n")
+                total += len(ids)
+                out.flush()
+                print(f"… {total} slots, last={cursor[0] if cursor else '-'}", file=sys.stderr)
+
+            # หน้าไม่เต็ม = หมดแล้ว
+            if not page_limit or len(ids) < page_limit:
+                break
+    finally:
+        if not to_stdout:
+            out.close()
+
+    print(f"✅ exported {total} slots", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -67,8 +67,18 @@ function startCameraImgRefresh(intervalMs = 300) {
       return;
     }
 
+    // มี SSE (topic camera) แล้ว: ข้ามการโหลดถ้า frame seq ของกล้องนี้ยังไม่เปลี่ยน
+    const camId = liveCameraIdFromUrl(base);
+    const liveSeq = (liveEventsConnected && camId) ? liveCameraSeq[camId] : undefined;
+    if (liveSeq !== undefined && img.dataset.loadedBase === base && img.dataset.loadedSeq === String(liveSeq)) {
+      cameraImgRefreshTimer = setTimeout(tick, intervalMs);
+      return;
+    }
+    img.dataset.loadedBase = base;
+    img.dataset.loadedSeq = liveSeq !== undefined ? String(liveSeq) : "";
+
     // Cache-bust every request
-    const nextSrc = `${base}?t=${Date.now()}`;
+    const nextSrc = `${base}${base.includes("?") ? "&" : "?"}t=${Date.now()}`;
 
     // Only schedule next refresh after current image finishes (prevents backlog)
     const scheduleNext = () => {
@@ -113,6 +123,8 @@ const ENDPOINTS = {
   systemConfigApplySummary: `${API_BASE}/api/system_config/apply_summary`,
   rooms: `${API_BASE}/api/rooms`,
 timeline: `${API_BASE}/api/timeline`,
+  timelineDelta: `${API_BASE}/api/timeline/delta`,
+  events: `${API_BASE}/api/events`,
   timelineTable: `${API_BASE}/api/timeline_table`,
 };
 const REFRESH_INTERVAL = 5000;
@@ -567,7 +579,8 @@ document.addEventListener("DOMContentLoaded", () => {
     initDateRangePicker();
 bindSystemConfigSummaryApply();
   fetchCatDataFromAPI();
-  refreshTimer = setInterval(updateCatData, REFRESH_INTERVAL);
+  // SSE (/api/events) แทนการ poll; ถ้า browser ไม่รองรับหรือเชื่อมต่อไม่ได้ -> poll ตามเดิม
+  if (!startLiveEvents()) startCatPolling();
   loadSystemConfig();
   loadRoomsAndRender();
   // Fullscreen (double click + button)
@@ -605,10 +618,23 @@ function setText(id, text) {
 // Cat Image Helpers
 // =========================
 // Display order: real_image_url -> image_url
-function getCatDisplayImage(cat) {
+// displayWidth (CSS px): ถ้ามีรูปย่อ (real_image_variants/image_variants) จะเลือกขนาดที่พอดีจอแทนต้นฉบับ
+function pickCatImageVariant(variants, displayWidth) {
+  if (!variants || !displayWidth) return "";
+  const need = displayWidth * Math.min(window.devicePixelRatio || 1, 3);
+  const widths = Object.keys(variants).map(Number).filter(Number.isFinite).sort((a, b) => a - b);
+  if (widths.length === 0) return "";
+  const w = widths.find((x) => x >= need) ?? widths[widths.length - 1];
+  return String(variants[String(w)] || "");
+}
+
+function getCatDisplayImage(cat, displayWidth) {
   const realUrl = String(cat?.real_image_url || "").trim();
   const baseUrl = String(cat?.image_url || "").trim();
-  const chosen = realUrl || baseUrl || "";
+  const variant = realUrl
+    ? pickCatImageVariant(cat?.real_image_variants, displayWidth)
+    : pickCatImageVariant(cat?.image_variants, displayWidth);
+  const chosen = variant || realUrl || baseUrl || "";
   // If API returns a relative assets path, serve it from API_BASE.
   if (chosen.startsWith("/assets/")) {
     return `${API_BASE}${chosen}`;
@@ -721,6 +747,92 @@ function updateCatData() {
     .catch(handleFetchError);
 }
 
+function startCatPolling() {
+  if (refreshTimer) return;
+  refreshTimer = setInterval(updateCatData, REFRESH_INTERVAL);
+}
+
+function stopCatPolling() {
+  if (refreshTimer) clearInterval(refreshTimer);
+  refreshTimer = null;
+}
+
+/* =========================
+ * 4.1) LIVE EVENTS (SSE)
+ * ========================= */
+let liveEvents = null;
+let liveEventsConnected = false;
+const LIVE_EVENTS_RETRY_MS = 60000;
+const liveCameraSeq = {};        // "room/idx" -> frame seq ล่าสุดจาก server
+
+function startLiveEvents() {
+  if (!window.EventSource) return false;
+  if (liveEvents) return true;
+
+  const es = new EventSource(ENDPOINTS.events, { withCredentials: true });
+  liveEvents = es;
+
+  es.onopen = () => {
+    liveEventsConnected = true;
+    stopCatPolling();
+  };
+  es.onerror = () => {
+    // EventSource จะต่อใหม่เอง (และได้ snapshot ใหม่) ระหว่างนั้นกลับไป poll
+    liveEventsConnected = false;
+    startCatPolling();
+    if (es.readyState === EventSource.CLOSED) {
+      // server ปฏิเสธ (เช่น 503 stream เต็ม) -> poll ไปก่อน แล้วลองใหม่ภายหลัง
+      liveEvents = null;
+      setTimeout(startLiveEvents, LIVE_EVENTS_RETRY_MS);
+    }
+  };
+
+  es.addEventListener("cats", (e) => applyLiveCats(JSON.parse(e.data)));
+  es.addEventListener("alerts", (e) => applyLiveAlerts(JSON.parse(e.data)));
+  es.addEventListener("camera", (e) => applyLiveCamera(JSON.parse(e.data)));
+  return true;
+}
+
+function applyLiveCats(payload) {
+  if (!payload) return;
+  if (payload.reload || (payload.removed || []).length) {
+    // แมวถูกลบ/ซ่อน -> โหลดทั้งรายการ (ไม่ต้องไล่ลบทีละตัวจาก cats และการ์ด)
+    updateCatData();
+    return;
+  }
+  const entries = payload.snapshot ? (payload.cats || {}) : (payload.changed || {});
+  for (const [name, state] of Object.entries(entries)) {
+    const cat = cats.find((c) => c.name === name);
+    if (!cat) {
+      // แมวใหม่ที่ยังไม่มีในรายการ -> โหลดทั้งรายการ
+      updateCatData();
+      return;
+    }
+    cat.current_room = state.current_room;
+    cat.status = state.status;
+    cat.activity = state.activity;
+  }
+  updateOpenCatDetail();
+}
+
+function applyLiveAlerts(payload) {
+  if (!payload || payload.snapshot || !(payload.alerts || []).length) return;
+  refreshNotificationsIfVisible();
+  const aPage = document.getElementById("alertsPage");
+  if (aPage && !aPage.classList.contains("hidden")) loadAlertsList();
+}
+
+function applyLiveCamera(payload) {
+  if (!payload) return;
+  for (const c of (payload.cameras || [])) liveCameraSeq[c.id] = c.seq;
+  for (const id of (payload.removed || [])) delete liveCameraSeq[id];
+}
+
+function liveCameraIdFromUrl(url) {
+  const m = /\/camera_latest\/([^/]+)\/(\d+)\.jpg/.exec(String(url || ""));
+  return m ? `${decodeURIComponent(m[1]).toLowerCase()}/${m[2]}` : null;
+}
+
 function renderCatCards(catList) {
   const container = document.querySelector(".cat-grid");
   if (!container) return;
@@ -741,7 +853,7 @@ function renderCatCards(catList) {
     card.className = "cat-card";
     card.onclick = () => selectCat(name);
 
-    const imgUrl = getCatDisplayImage(cat);
+    const imgUrl = getCatDisplayImage(cat, 240);
     card.innerHTML = `
       <img src="${escapeAttr(imgUrl)}" alt="${escapeAttr(name)}" class="cat-image">
       <h3>${escapeHtml(name)}</h3>
@@ -766,7 +878,7 @@ function selectCat(catName) {
   selectedCatId = catName; // จำชื่อแมวไว้ใช้ที่ Alerts/Statistics
   document.getElementById("catDetailName").textContent = cat.name;
   document.getElementById("catProfileName").textContent = `Name ${cat.name}`;
-  document.getElementById("catDetailImage").src = getCatDisplayImage(cat);
+  document.getElementById("catDetailImage").src = getCatDisplayImage(cat, 200);
   document.getElementById("catLocation").textContent = cat.current_room || "Unknown";
   document.getElementById("catPage").classList.add("hidden");
   document.getElementById("profilePage").classList.add("hidden");
@@ -956,7 +1068,7 @@ function updateOpenCatDetail() {
       document.getElementById("catLocation").textContent = cat.current_room || "Unknown";
       document.getElementById("catDetailName").textContent = cat.name;
       document.getElementById("catProfileName").textContent = `Name ${cat.name}`;
-      document.getElementById("catDetailImage").src = getCatDisplayImage(cat);
+      document.getElementById("catDetailImage").src = getCatDisplayImage(cat, 200);
     }
   }
 }
@@ -1013,6 +1125,21 @@ function selectRoom(index) {
   }, 1000);
 }
 
+// เลือกขนาดภาพกล้องจาก sizes ที่ server ประกาศ (/api/rooms)
+// - จอเล็ก/เน็ตมือถือ/Data Saver -> ขอภาพย่อ, จอใหญ่ -> null (ภาพเต็มจาก bridge)
+function pickCameraFeedWidth(sizes) {
+  if (!Array.isArray(sizes) || !sizes.length) return null;
+  const conn = navigator.connection || {};
+  const slowNet = !!conn.saveData || ["slow-2g", "2g", "3g"].includes(conn.effectiveType);
+  const box = document.getElementById("cameraFeed");
+  const cssWidth = (box && box.clientWidth) || window.innerWidth || 0;
+  const wanted = Math.round(cssWidth * (slowNet ? 1 : (window.devicePixelRatio || 1)));
+  const sorted = [...sizes].sort((a, b) => a - b);
+  const fit = sorted.find(s => s >= wanted);
+  if (fit) return fit;
+  return slowNet ? sorted[sorted.length - 1] : null;
+}
+
 function updateCameraUI() {
   if (currentRoomIndex === null) return;
 
@@ -1025,9 +1152,12 @@ function updateCameraUI() {
     ? `กล้อง ${currentCameraIndex + 1} จาก ${cams.length}`
     : `ไม่มีกล้องในห้องนี้`;
 
-  const feed = cam ? `${API_BASE}/camera_latest/${room.name}/${cam.index}.jpg` : "";
+  const feedWidth = cam ? pickCameraFeedWidth(cam.sizes) : null;
+  const feed = cam
+    ? `${API_BASE}/camera_latest/${room.name}/${cam.index}.jpg${feedWidth ? `?w=${feedWidth}` : ""}`
+    : "";
   document.getElementById("cameraFeed").innerHTML = cam
-    ? `<img id="cameraImg" class="camera-img" data-base="${feed}" src="${feed}?t=${Date.now()}" alt="${cam.label}">`
+    ? `<img id="cameraImg" class="camera-img" data-base="${feed}" src="${feed}${feedWidth ? "&" : "?"}t=${Date.now()}" alt="${cam.label}">`
     : `<div class="simulated-video"><div class="camera-placeholder large">📹</div><p>ไม่มีกล้อง</p></div>`;
 
   const prevBtn = document.querySelector(".camera-controls .nav-btn:first-child");
@@ -1195,7 +1325,7 @@ function openCatSettings() {
       const name = String(c?.name || "").trim();
       if (!name) return;
       const checked = Number(c?.display_status) === 1;
-      const img = getCatDisplayImage(c);
+      const img = getCatDisplayImage(c, 44);
       const id = `catVis_${name.replace(/[^a-zA-Z0-9_-]/g, "_")}`;
       html += `
         <label class="cat-settings-item" for="${escapeAttr(id)}">
@@ -2083,6 +2213,8 @@ let timelineBefore = null;        // cursor (datetime string) to load older slot
 let timelineHasMore = true;
 let timelineIsLoading = false;
 let timelineAutoTimer = null;
+let timelineAfterId = null;       // cursor (timeslot.id) สำหรับ delta-sync ตอน auto refresh
+let timelineRevision = null;      // timeslot revision ตอนโหลดหน้าแรก (แถวเดิมถูกแก้ -> server ขอให้โหลดใหม่)
 const TIMELINE_PAGE_SIZE = 300;   // 300 slots = ~50 นาที (10s/slot)
 
 function getTimelineGranularity() {
@@ -2166,6 +2298,7 @@ function reloadTimeline() {
 
   // reset state
   timelineBefore = null;
+  timelineAfterId = null;
   timelineHasMore = true;
   timelineIsLoading = false;
   if (listEl) listEl.innerHTML = "";
@@ -2183,16 +2316,73 @@ function startTimelineAutoRefresh() {
     const list = document.getElementById("timelineList");
     if (!list) return;
     if (list.scrollTop <= 30) {
-      // reload latest chunk (reset cursor)
-      timelineBefore = null;
-      timelineHasMore = true;
-      list.innerHTML = "";
-      hideEl("timelineEnd");
-      loadTimelineChunk(true);
+      if (timelineAfterId != null) {
+        loadTimelineDelta();
+        return;
+      }
+      reloadTimelineLatest();
     }
   }, 8000);
 }
 
+function reloadTimelineLatest() {
+  // reload latest chunk (reset cursor)
+  const list = document.getElementById("timelineList");
+  timelineBefore = null;
+  timelineAfterId = null;
+  timelineHasMore = true;
+  if (list) list.innerHTML = "";
+  hideEl("timelineEnd");
+  loadTimelineChunk(true);
+}
+
+function loadTimelineDelta() {
+  // ดึงเฉพาะแถวใหม่กว่า timelineAfterId แล้วแทรกไว้บนสุด (204 = ไม่มีอะไรใหม่)
+  if (timelineIsLoading || !selectedCatId) return;
+  timelineIsLoading = true;
+
+  const date = document.getElementById("timelineDate")?.value;
+  const params = new URLSearchParams();
+  params.set("cat", selectedCatId);
+  params.set("after_id", String(timelineAfterId));
+  if (timelineRevision != null) params.set("rev", String(timelineRevision));
+  if (date) params.set("date", date);
+
+  const requestedCat = selectedCatId;
+  let needFullReload = false;
+  fetch(`${ENDPOINTS.timelineDelta}?${params.toString()}`)
+    .then(r => {
+      if (r.status === 204) {
+        const hdr = r.headers.get("X-Next-After-Id");
+        if (hdr) timelineAfterId = Number(hdr);
+        return null;
+      }
+      if (!r.ok) throw new Error(`HTTP ${r.status}`);
+      return r.json();
+    })
+    .then(payload => {
+      if (!payload || requestedCat !== selectedCatId) return;
+      if (payload.truncated || payload.reload) {
+        // ใหม่เยอะเกิน / แถวเดิมถูกแก้ย้อนหลัง -> โหลดหน้าแรกใหม่ทั้งหมด
+        needFullReload = true;
+        return;
+      }
+      timelineAfterId = payload.next_after_id ?? timelineAfterId;
+      renderTimelineListRows(payload.rows || [], true);
+
+      const meta = document.getElementById("timelineMeta");
+      if (meta) {
+        const loaded = document.querySelectorAll("#timelineList .timeline-row").length;
+        meta.textContent = `วันที่: ${date || "-"} | โหลดแล้ว: ${loaded} แถว | แสดง: 10 วินาที`;
+      }
+    })
+    .catch(err => console.error("loadTimelineDelta error:", err))
+    .finally(() => {
+      timelineIsLoading = false;
+      if (needFullReload) reloadTimelineLatest();
+    });
+}
+
 function stopTimelineAutoRefresh() {
   if (timelineAutoTimer) clearInterval(timelineAutoTimer);
   timelineAutoTimer = null;
@@ -2223,6 +2413,8 @@ function loadTimelineChunk(resetScrollTop) {
       const rows = payload?.rows || [];
       timelineHasMore = !!payload?.has_more;
       timelineBefore = payload?.next_before || null;
+      if (payload?.next_after_id != null) timelineAfterId = payload.next_after_id;
+      if (payload?.revision != null) timelineRevision = payload.revision;
 
       renderTimelineListRows(rows);
 
@@ -2250,10 +2442,12 @@ function loadTimelineChunk(resetScrollTop) {
     });
 }
 
-function renderTimelineListRows(rows) {
+function renderTimelineListRows(rows, prepend = false) {
   const list = document.getElementById("timelineList");
   if (!list) return;
 
+  // prepend: rows เรียงใหม่ -> เก่า จึงแทรกก่อนแถวบนสุดเดิมตามลำดับ
+  const anchor = prepend ? list.firstChild : null;
   for (const r of rows) {
     const timeTxt = (r.date_slot || "-");
     const roomTxt = (r.room || "-");
@@ -2271,7 +2465,7 @@ function renderTimelineListRows(rows) {
       <div class="tl-activity">${escapeHtml(actTxt)}</div>
       <div class="tl-status ${statusClass}">${escapeHtml(st)}</div>
     `;
-    list.appendChild(row);
+    list.insertBefore(row, anchor);
   }
 }
 